@@ -0,0 +1,196 @@
+import numpy as np
+
+from materials import NODE_TYPE
+
+# ================= 紧凑的桥梁设计模型 =================
+# 流水线内部统一使用 BridgeDesign (列式 numpy 数组 + id→下标映射)，
+# 只在读写存档 / 解析大模型输出的边界处与游戏的 Objects JSON 互相转换。
+# 节点与杆件里恒为 0 的冗余字段 (anchorAID/anchorBID/splitForDrawBridge/rate) 不再逐个存储。
+# 存档里缺失的必填字段不补 0：id / 锚点记为 MISSING_ID，坐标记为 NaN，由 design_validator 报告 missing_field，
+# 导出时原样省略该字段。
+
+MISSING_ID = -1
+
+
+def _field(obj, key, missing):
+    """读取必填字段，缺失或为 null 时返回哨兵值 missing"""
+    value = obj.get(key)
+    return missing if value is None else value
+
+
+def _num(value):
+    """整数值坐标按 int 输出，与游戏原生存档保持一致 (例如 "x":8 而不是 "x":8.0)"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _present(obj):
+    """去掉缺失字段 (哨兵 id 或 NaN 坐标)"""
+    return {k: v for k, v in obj.items()
+            if not (isinstance(v, float) and v != v)
+            and not (k in ("id", "anchorAID", "anchorBID") and v == MISSING_ID)}
+
+
+class BridgeDesign:
+    """
+    节点表：node_ids / node_xy (n,2) / node_kinematic / node_split
+    杆件表：edge_ids / edge_type / edge_anchor_ids (m,2) / edge_nodes (m,2，锚点不存在时为 -1)
+            edge_xy (m,2，存档里的杆件坐标，正常应为两端中点) / edge_rate / edge_split
+    node_index：节点 id -> 节点表下标
+    """
+
+    __slots__ = (
+        "display_name",
+        "node_ids", "node_xy", "node_kinematic", "node_split",
+        "edge_ids", "edge_type", "edge_anchor_ids", "edge_nodes", "edge_xy", "edge_rate", "edge_split",
+        "node_index",
+    )
+
+    def __init__(self, display_name, node_ids, node_xy, node_kinematic, node_split,
+                 edge_ids, edge_type, edge_anchor_ids, edge_xy=None, edge_rate=None, edge_split=None):
+        self.display_name = display_name
+        self.node_ids = np.asarray(node_ids, dtype=np.int64).reshape(-1)
+        self.node_xy = np.asarray(node_xy, dtype=float).reshape(-1, 2)
+        self.node_kinematic = np.asarray(node_kinematic, dtype=bool).reshape(-1)
+        self.node_split = np.asarray(node_split, dtype=np.int8).reshape(-1)
+        self.edge_ids = np.asarray(edge_ids, dtype=np.int64).reshape(-1)
+        self.edge_type = np.asarray(edge_type, dtype=np.int16).reshape(-1)
+        self.edge_anchor_ids = np.asarray(edge_anchor_ids, dtype=np.int64).reshape(-1, 2)
+        m = len(self.edge_ids)
+        self.edge_rate = np.zeros(m) if edge_rate is None else np.asarray(edge_rate, dtype=float).reshape(-1)
+        self.edge_split = np.zeros(m, dtype=np.int8) if edge_split is None else np.asarray(edge_split, dtype=np.int8).reshape(-1)
+
+        self.node_index = dict(zip(self.node_ids.tolist(), range(len(self.node_ids))))
+        self.edge_nodes = self._resolve_anchors()
+        self.edge_xy = self.midpoints() if edge_xy is None else np.asarray(edge_xy, dtype=float).reshape(-1, 2)
+
+    def _resolve_anchors(self):
+        """把杆件的锚点 id 映射成节点表下标 (向量化二分查找)，找不到的记为 -1"""
+        anchors = self.edge_anchor_ids
+        if len(self.node_ids) == 0 or len(anchors) == 0:
+            return np.full(anchors.shape, -1, dtype=np.int64)
+        order = np.argsort(self.node_ids, kind="stable")
+        sorted_ids = self.node_ids[order]
+        pos = np.clip(np.searchsorted(sorted_ids, anchors), 0, len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == anchors, order[pos], -1)
+
+    # ---------- 构造 (I/O 边界) ----------
+    @classmethod
+    def from_topology(cls, nodes, edges, display_name="Bridge_Generated"):
+        """由大模型输出的拓扑 (nodes + edges) 构造，杆件坐标自动取两端中点"""
+        return cls(
+            display_name,
+            [node["id"] for node in nodes],
+            [(node["x"], node["y"]) for node in nodes],
+            [node.get("isKinematic") is True for node in nodes],
+            [node.get("splitForDrawBridge", 0) for node in nodes],
+            [edge["id"] for edge in edges],
+            [edge["type"] for edge in edges],
+            [(edge["anchorAID"], edge["anchorBID"]) for edge in edges],
+            edge_rate=[edge.get("rate", 0) for edge in edges],
+            edge_split=[edge.get("splitForDrawBridge", 0) for edge in edges],
+        )
+
+    @classmethod
+    def from_objects(cls, design_data):
+        """
+        由游戏存档的 {"DisplayName", "Objects"} (或直接的 Objects 列表) 构造。
+        type 为 0 且无锚点的视为节点，其余 (包括带锚点的 type 0) 都视为杆件，原样保留供校验。
+        """
+        if isinstance(design_data, dict):
+            display_name = design_data.get("DisplayName", "")
+            objects = design_data.get("Objects", [])
+        else:
+            display_name, objects = "", design_data
+        n = len(objects)
+        types = np.fromiter((obj.get("type", NODE_TYPE) for obj in objects), dtype=np.int64, count=n)
+        ids = np.fromiter((_field(obj, "id", MISSING_ID) for obj in objects), dtype=np.int64, count=n)
+        xy = np.fromiter((v for obj in objects for v in (_field(obj, "x", np.nan), _field(obj, "y", np.nan))),
+                         dtype=float, count=2 * n).reshape(n, 2)
+        anchors = np.fromiter((v for obj in objects for v in (_field(obj, "anchorAID", MISSING_ID), _field(obj, "anchorBID", MISSING_ID))),
+                              dtype=np.int64, count=2 * n).reshape(n, 2)
+        split = np.fromiter((obj.get("splitForDrawBridge") or 0 for obj in objects), dtype=np.int8, count=n)
+        rate = np.nan_to_num(np.fromiter((_field(obj, "rate", 0) for obj in objects), dtype=float, count=n))
+        kinematic = np.fromiter((obj.get("isKinematic") is True for obj in objects), dtype=bool, count=n)
+
+        # 节点的锚点恒为 0，缺省时同样视为 0；带有非 0 锚点的 type 0 物体视为杆件
+        is_node = (types == NODE_TYPE) & ~np.any((anchors != 0) & (anchors != MISSING_ID), axis=1)
+        anchors[is_node] = 0
+        is_edge = ~is_node
+        return cls(
+            display_name,
+            ids[is_node], xy[is_node], kinematic[is_node], split[is_node],
+            ids[is_edge], types[is_edge], anchors[is_edge],
+            edge_xy=xy[is_edge], edge_rate=rate[is_edge], edge_split=split[is_edge],
+        )
+
+    @classmethod
+    def coerce(cls, design):
+        """BridgeDesign 原样返回，存档 dict / Objects 列表则转换"""
+        return design if isinstance(design, cls) else cls.from_objects(design)
+
+    def to_objects(self):
+        """
+        导出为游戏存档格式，与 convert_topology_to_objects 的输出字段和顺序一致；
+        缺失的字段 (MISSING_ID / NaN) 省略不写，不会把 NaN 写进 JSON
+        """
+        objects = []
+        for node_id, (x, y), kinematic, split in zip(self.node_ids.tolist(), self.node_xy.tolist(),
+                                                     self.node_kinematic.tolist(), self.node_split.tolist()):
+            obj = _present({"type": 0, "x": _num(x), "y": _num(y), "id": node_id,
+                            "anchorAID": 0, "anchorBID": 0, "splitForDrawBridge": split, "rate": 0})
+            # 引擎序列化规则：只有 True 才写 isKinematic
+            if kinematic:
+                obj["isKinematic"] = True
+            objects.append(obj)
+        for edge_id, edge_type, (x, y), (aid, bid), split, rate in zip(
+                self.edge_ids.tolist(), self.edge_type.tolist(), self.edge_xy.tolist(),
+                self.edge_anchor_ids.tolist(), self.edge_split.tolist(), self.edge_rate.tolist()):
+            objects.append(_present({"type": edge_type, "x": x, "y": y, "id": edge_id,
+                                     "anchorAID": aid, "anchorBID": bid, "splitForDrawBridge": split, "rate": _num(rate)}))
+        return {"DisplayName": self.display_name, "Objects": objects}
+
+    # ---------- 几何量 (向量化) ----------
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self):
+        return len(self.edge_ids)
+
+    @property
+    def max_id(self):
+        """当前所有节点与杆件中的最大 id，新增物体应从它之后顺序编号"""
+        all_ids = np.concatenate([self.node_ids, self.edge_ids])
+        return int(all_ids.max()) if len(all_ids) else 0
+
+    def resolved(self):
+        """两端锚点都存在的杆件掩码"""
+        return np.all(self.edge_nodes >= 0, axis=1)
+
+    def edge_vectors(self):
+        """杆件 A->B 向量 (m,2)，锚点不存在的杆件为 nan"""
+        vec = np.full((self.n_edges, 2), np.nan)
+        ok = self.resolved()
+        vec[ok] = self.node_xy[self.edge_nodes[ok, 1]] - self.node_xy[self.edge_nodes[ok, 0]]
+        return vec
+
+    def edge_lengths(self):
+        vec = self.edge_vectors()
+        return np.hypot(vec[:, 0], vec[:, 1])
+
+    def midpoints(self):
+        """杆件两端中点 (m,2)，锚点不存在的杆件为 nan"""
+        mid = np.full((self.n_edges, 2), np.nan)
+        ok = self.resolved()
+        mid[ok] = (self.node_xy[self.edge_nodes[ok, 0]] + self.node_xy[self.edge_nodes[ok, 1]]) / 2.0
+        return mid
+
+    def __repr__(self):
+        return f"BridgeDesign({self.display_name!r}, nodes={self.n_nodes}, edges={self.n_edges})"
+
+
+def as_objects(design):
+    """存档写出边界：BridgeDesign 转成 Objects dict，dict 原样返回"""
+    return design.to_objects() if isinstance(design, BridgeDesign) else design
@@ -0,0 +1,303 @@
+import os
+import time
+
+import numpy as np
+
+from bridge_design import BridgeDesign
+from materials import MATERIALS, ROAD_TYPE
+from truss_solver import DEFAULT_ROAD_LOAD, DEFAULT_VEHICLE_LOAD
+
+# ================= 离线动力模拟 =================
+# 近似游戏物理的二维时程模拟，不开游戏也能判断车能不能过桥：
+#   节点 = 质点 (锚点固定)，杆件 = 带阻尼的轴向弹簧 (刚度 EA/L 取自 materials.py)，
+#   轴力超过材料强度即断裂；绳索只受拉；液压杆按 rate 伸缩；splitForDrawBridge 的节点不把杆件连在一起。
+#   车辆是沿路面匀速行驶的集中荷载：所在位置没有完好的路面或路面下沉过多即判定掉落。
+# 积分用半隐式欧拉 (辛欧拉)，固定步长 SIM_DT；又轻又硬的节点 (例如只连短钢杆的上弦节点) 做质量缩放 (只加惯性不加重量)，
+# 保证显式积分稳定，不让个别节点把整批的步长拖小。
+# 多个设计拼成一个大的质点 / 弹簧系统一起向量化推进 (设计之间互不相连)，再由进程池并行处理多批，
+# 每秒可以评估上百个候选。这只是近似：碰撞、车辆动力学、节点强度等都不模拟，结论以游戏回放为准；
+# 材料长度上限、中点坐标等规则也不在这里检查 (见 design_validator.py)。
+
+GRAVITY = 9.81
+# 杆件线密度 (质量 / m)：路面按 truss_solver 的路面均布荷载反推，桁架杆件远轻于路面 (与游戏里的手感一致)
+LINEAR_DENSITY = {ROAD_TYPE: DEFAULT_ROAD_LOAD / GRAVITY, 2: 1.0, 4: 2.0, 5: 0.3, 8: 1.5}
+NODE_MASS = 0.5                 # 每个节点的附加质量，避免只连着绳索的节点过轻
+DAMPING_RATIO = 0.3             # 杆件轴向阻尼比
+DT = float(os.getenv("SIM_DT", "0.004"))                      # 积分步长 (s)
+SETTLE_TIME = float(os.getenv("SIM_SETTLE_TIME", "1.0"))      # 车辆上桥前先让桥在自重下稳定 (s)，重力在前一半时间内逐渐加上
+VEHICLE_SPEED = float(os.getenv("SIM_VEHICLE_SPEED", "3.0"))  # 车速 (m/s)
+FALL_DEPTH = 1.0                # 车辆所在处路面比初始位置低这么多 (m) 视为掉落
+HYDRAULIC_STROKE_TIME = 1.0     # 液压杆在模拟开始后这么多秒内线性走完行程，rate 视为相对原长的伸缩比例
+BATCH_SIZE = int(os.getenv("SIM_BATCH_SIZE", "64"))
+
+
+class _Batch:
+    """把多个设计拼成一个系统：质点 / 杆件数组 + 每个元素所属的设计下标"""
+
+    def __init__(self, designs):
+        xy, fixed, node_design = [], [], []
+        a_idx, b_idx, types, rate, edge_ids, edge_design = [], [], [], [], [], []
+        self.errors = {}
+        offset = 0
+        for d, design in enumerate(designs):
+            resolved = design.resolved()
+            if not np.all(resolved):
+                self.errors[d] = f"杆件 {design.edge_ids[~resolved].tolist()} 引用了不存在的节点"
+                continue
+            unknown = sorted(set(design.edge_type.tolist()) - set(MATERIALS))
+            if unknown:
+                self.errors[d] = f"未知材料类型 {unknown}"
+                continue
+            if not np.any(design.edge_type == ROAD_TYPE):
+                self.errors[d] = "设计中没有路面 (Road) 杆件，车辆无法通过"
+                continue
+
+            node_xy = design.node_xy.tolist()
+            node_fixed = design.node_kinematic.tolist()
+            ends = design.edge_nodes.copy()
+            # 断开节点：连在上面的每根杆件各用一个独立的节点副本
+            for i in np.flatnonzero(design.node_split != 0).tolist():
+                for k, side in zip(*np.nonzero(ends == i)):
+                    ends[k, side] = len(node_xy)
+                    node_xy.append(node_xy[i])
+                    node_fixed.append(node_fixed[i])
+
+            xy.extend(node_xy)
+            fixed.extend(node_fixed)
+            node_design.extend([d] * len(node_xy))
+            a_idx.append(ends[:, 0] + offset)
+            b_idx.append(ends[:, 1] + offset)
+            types.append(design.edge_type)
+            rate.append(design.edge_rate)
+            edge_ids.append(design.edge_ids)
+            edge_design.append(np.full(design.n_edges, d))
+            offset += len(node_xy)
+
+        self.n_designs = len(designs)
+        self.xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        self.fixed = np.asarray(fixed, dtype=bool)
+        self.node_design = np.asarray(node_design, dtype=np.int64)
+        cat = lambda parts, dtype: np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+        self.a, self.b = cat(a_idx, np.int64), cat(b_idx, np.int64)
+        self.types = cat(types, np.int64)
+        self.rate = cat(rate, float)
+        self.edge_ids = cat(edge_ids, np.int64)
+        self.edge_design = cat(edge_design, np.int64)
+
+
+def _material_table(key, types, default=0.0):
+    return np.array([MATERIALS[t][key] if MATERIALS[t][key] is not None else default for t in types.tolist()])
+
+
+def simulate_batch(designs, vehicle_load=DEFAULT_VEHICLE_LOAD, speed=VEHICLE_SPEED, settle_time=SETTLE_TIME, dt=DT):
+    """
+    一次向量化模拟一批设计 (BridgeDesign 或 convert_topology_to_objects 的输出)，返回与输入等长的结果列表。
+    每项 {"success", "collapsed", "vehicle_reached", "progress", "members_lost", "failure_time", "reason",
+          "breaks": [{"time", "id", "material", "force"}], "max_utilisation", "steps", "elapsed_ms"}
+    字段与 tool/replay_score.py 的回放判定一致，可以直接对照
+    """
+    started = time.perf_counter()
+    designs = [BridgeDesign.coerce(d) for d in designs]
+    batch = _Batch(designs)
+    B = batch.n_designs
+    results = [None] * B
+    for d, reason in batch.errors.items():
+        results[d] = _result(False, reason=reason)
+
+    a, b, types, ed = batch.a, batch.b, batch.types, batch.edge_design
+    n, m = len(batch.xy), len(a)
+    if m == 0:
+        return [r or _result(False, reason="设计中缺少杆件") for r in results]
+
+    # ---------- 杆件与质点参数 ----------
+    x0 = batch.xy.copy()
+    rest = np.hypot(*(x0[b] - x0[a]).T)
+    rest_safe = np.maximum(rest, 1e-6)
+    k = _material_table("stiffness", types) / rest_safe
+    strength = _material_table("strength", types)
+    tension_only = _material_table("tension_only", types).astype(bool)
+    is_road = types == ROAD_TYPE
+    stroke = np.where(types == 4, batch.rate, 0.0)
+    density = np.array([LINEAR_DENSITY.get(t, 1.0) for t in types.tolist()])
+    half_mass = density * rest / 2.0
+    mass = NODE_MASS + np.bincount(a, half_mass, n) + np.bincount(b, half_mass, n)
+    free = ~batch.fixed
+    weight = -GRAVITY * mass * free
+    # 质量缩放：ω² ≤ 2Σk / m (Gershgorin 上界)，要求 ω·dt ≤ 1 (稳定极限为 2，留出阻尼的余量)
+    k_sum = np.bincount(a, k, n) + np.bincount(b, k, n)
+    mass = np.maximum(mass, 2.0 * k_sum * dt * dt)
+    inv_mass = np.where(free, 1.0 / mass, 0.0)
+    m_edge = np.minimum(np.where(free[a], mass[a], np.inf), np.where(free[b], mass[b], np.inf))
+    m_edge = np.where(np.isfinite(m_edge), m_edge, 0.0)
+    c = 2.0 * DAMPING_RATIO * np.sqrt(k * m_edge)
+
+    # ---------- 车辆：从最左的路面节点匀速驶向最右的路面节点 ----------
+    road = np.flatnonzero(is_road)
+    road_design = ed[road]
+    road_x = np.concatenate([x0[a[road], 0], x0[b[road], 0]])
+    road_owner = np.concatenate([road_design, road_design])
+    start_x = np.full(B, np.inf)
+    end_x = np.full(B, -np.inf)
+    np.minimum.at(start_x, road_owner, road_x)
+    np.maximum.at(end_x, road_owner, road_x)
+    span = np.where(np.isfinite(start_x), end_x - start_x, 0.0)
+    duration = settle_time + np.max(span, initial=0.0) / speed + 0.5
+    steps = int(np.ceil(duration / dt))
+
+    active = np.ones(m, dtype=bool)
+    broken_at = np.full(m, np.nan)
+    broken_force = np.zeros(m)
+    peak = np.zeros(m)
+    alive = np.array([results[d] is None for d in range(B)])   # 仍在模拟中的设计
+    reached = np.zeros(B, dtype=bool)
+    failure_time = np.full(B, np.nan)
+    reason = [None] * B
+    progress = np.zeros(B)
+
+    x = x0.copy()
+    v = np.zeros_like(x)
+    for step in range(steps):
+        t = step * dt
+        # 弹簧 + 阻尼轴力 (拉为正)
+        delta = x[b] - x[a]
+        length = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 1e-9)
+        u = delta / length[:, None]
+        target = rest * (1.0 + stroke * min(t / HYDRAULIC_STROKE_TIME, 1.0))
+        force = k * (length - target)
+        force = np.where(tension_only & (force < 0), 0.0, force)
+
+        snapped = active & (np.abs(force) > strength)
+        if np.any(snapped):
+            active &= ~snapped
+            broken_at[snapped] = t
+            broken_force[snapped] = force[snapped]
+        np.maximum(peak, np.where(active, np.abs(force) / strength, 0.0), out=peak)
+
+        closing = np.einsum("ij,ij->i", v[b] - v[a], u)
+        axial = np.where(active, force + c * closing, 0.0)
+        fx, fy = axial * u[:, 0], axial * u[:, 1]
+        F = np.empty_like(x)
+        F[:, 0] = np.bincount(a, fx, n) - np.bincount(b, fx, n)
+        F[:, 1] = np.bincount(a, fy, n) - np.bincount(b, fy, n) + weight * min(2.0 * t / settle_time, 1.0)
+
+        # 车辆荷载：按车辆在所在路面杆件上的位置分给两端节点
+        on_bridge = alive & ~reached & (t >= settle_time)
+        if np.any(on_bridge):
+            vx = start_x + speed * (t - settle_time)
+            progress = np.where(on_bridge, np.clip((vx - start_x) / np.maximum(span, 1e-9), 0.0, 1.0), progress)
+            reached |= on_bridge & (vx >= end_x)
+            on_bridge &= ~reached
+            xa, xb = x[a[road], 0], x[b[road], 0]
+            lo, hi = np.minimum(xa, xb), np.maximum(xa, xb)
+            car_x = vx[road_design]
+            under = active[road] & on_bridge[road_design] & (lo <= car_x) & (car_x <= hi)
+            hit = np.flatnonzero(under)
+            owners, first = np.unique(road_design[hit], return_index=True)
+            chosen = road[hit[first]]
+            support = np.zeros(B, dtype=bool)
+            support[owners] = True
+
+            s = np.clip((vx[owners] - x[a[chosen], 0]) / np.where(x[b[chosen], 0] != x[a[chosen], 0],
+                                                                   x[b[chosen], 0] - x[a[chosen], 0], 1.0), 0.0, 1.0)
+            y_now = x[a[chosen], 1] + s * (x[b[chosen], 1] - x[a[chosen], 1])
+            y_ref = x0[a[chosen], 1] + s * (x0[b[chosen], 1] - x0[a[chosen], 1])
+            np.add.at(F[:, 1], a[chosen], -vehicle_load * (1.0 - s))
+            np.add.at(F[:, 1], b[chosen], -vehicle_load * s)
+
+            sagged = np.zeros(B, dtype=bool)
+            sagged[owners] = y_now < y_ref - FALL_DEPTH
+            for d in np.flatnonzero(on_bridge & (~support | sagged)).tolist():
+                alive[d] = False
+                failure_time[d] = t
+                reason[d] = "车辆所在处路面已断开" if not support[d] else f"路面下沉超过 {FALL_DEPTH:g}m，车辆掉落"
+
+        v += dt * F * inv_mass[:, None]
+        x += dt * v
+
+        if not np.all(np.isfinite(x)):
+            bad = np.unique(batch.node_design[~np.all(np.isfinite(x), axis=1)])
+            for d in bad.tolist():
+                if alive[d]:
+                    alive[d] = False
+                    failure_time[d] = t
+                    reason[d] = "数值发散 (结构为机构或严重超载)"
+            x = np.nan_to_num(x)
+            v = np.nan_to_num(v)
+        if not np.any(alive & ~reached):
+            break
+
+    elapsed = (time.perf_counter() - started) * 1000.0
+    for d in range(B):
+        if results[d] is not None:
+            continue
+        mine = np.flatnonzero(ed == d)
+        lost = mine[~active[mine]]
+        breaks = [{"time": round(float(broken_at[i]), 4), "id": int(batch.edge_ids[i]),
+                   "material": MATERIALS[int(types[i])]["name"], "force": round(float(broken_force[i]), 1)}
+                  for i in lost[np.argsort(broken_at[lost])]]
+        success = bool(reached[d])
+        first_break = float(np.nanmin(broken_at[mine])) if len(lost) else None
+        results[d] = _result(
+            success,
+            collapsed=not success and not np.isnan(failure_time[d]),
+            vehicle_reached=success,
+            progress=1.0 if success else float(progress[d]),
+            members_lost=len(lost),
+            failure_time=None if success else (float(failure_time[d]) if not np.isnan(failure_time[d]) else first_break),
+            reason=None if success else (reason[d] or "模拟时间内车辆未到达对岸"),
+            breaks=breaks,
+            max_utilisation=float(np.max(peak[mine], initial=0.0)),
+            steps=step + 1,
+        )
+    for r in results:
+        r["elapsed_ms"] = elapsed
+        r["dt"] = dt
+    return results
+
+
+def _result(success, **fields):
+    result = {"success": success, "collapsed": None, "vehicle_reached": None, "progress": 0.0, "members_lost": 0,
+              "failure_time": None, "reason": None, "breaks": [], "max_utilisation": None, "steps": 0}
+    result.update(fields)
+    return result
+
+
+def simulate_design(design_data, **kwargs):
+    """模拟单个设计"""
+    return simulate_batch([design_data], **kwargs)[0]
+
+
+def _simulate_chunk(args):
+    designs, kwargs = args
+    return simulate_batch(designs, **kwargs)
+
+
+def simulate_many(designs, workers=None, batch_size=BATCH_SIZE, **kwargs):
+    """
+    大量设计按 batch_size 分批，每批在一个进程里向量化模拟；只有一批或 workers=1 时在当前进程处理。
+    返回与输入等长的结果列表
+    """
+    designs = [BridgeDesign.coerce(d) for d in designs]
+    chunks = [(designs[i:i + batch_size], kwargs) for i in range(0, len(designs), batch_size)]
+    if len(chunks) <= 1 or workers == 1:
+        return [r for chunk in chunks for r in _simulate_chunk(chunk)]
+
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        return [r for chunk in executor.map(_simulate_chunk, chunks) for r in chunk]
+
+
+def describe_result(result):
+    """一行中文摘要，与 replay_score.describe 的写法一致"""
+    if result["success"]:
+        text = f"车辆到达对岸，最大利用率 {result['max_utilisation']:.2f}"
+        if result["members_lost"]:
+            text += f"，途中断裂 {result['members_lost']} 根杆件"
+        return text
+    text = f"{result['reason']}"
+    if result["failure_time"] is not None:
+        text += f" ({result['failure_time']:.2f}s，车辆行驶至 {result['progress'] * 100:.0f}%)"
+    if result["members_lost"]:
+        text += f"，断裂 {result['members_lost']} 根杆件"
+    return text
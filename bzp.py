@@ -1,32 +1,23 @@
-import base64
-import zlib
 import json
 
+from tool.codec import decode_save
+
 # 这里的字符串就是 Poly Bridge 存档或关卡里的核心加密数据
 original_str = """
 eAG9z88KwjAMBvB3ybnCNj1Ib44iiKAPIB5iVzTi/pBGtIy9u6NV0Lt6Ccl3+H6kB0O+u2DYYO1AQw4Ktoezs+JB73qQ0I1xpuAeZ4iTKtC5AmzsqeXFysQwXeXzGjtJli0bxlvJVB1TC6OkhfyaGlejkAUtfHWD+sTm71jxYyyL2KRI2vQvr7202be1/fAAmCuQ+w==
 """
 
-def decode_polybridge_save():
-    # 1. 清洗输入（防止多余的换行符和空格导致 Base64 解码失败）
-    clean_original = original_str.replace('\n', '').replace(' ', '').replace('\r', '')
-    
+def decode_polybridge_save(save_str=original_str):
     print("🔄 正在解码 Poly Bridge 数据...")
     
     try:
-        # 2. Base64 解码
-        compressed_data = base64.b64decode(clean_original)
-        
-        # 3. Zlib 解压缩
-        raw_bytes = zlib.decompress(compressed_data)
-        
-        # 4. 解析为 JSON 对象
-        json_obj = json.loads(raw_bytes)
+        # 清洗换行 / 空格、Base64 解码、Zlib 解压缩、解析为 JSON 对象 (见 tool/codec.py)
+        json_obj = decode_save(save_str)
         
         print("✅ 解码成功！\n")
         print("=== 存档 JSON 内容 ===")
         
-        # 5. 格式化输出 JSON，方便人类和大模型阅读
+        # 格式化输出 JSON，方便人类和大模型阅读
         formatted_json = json.dumps(json_obj, indent=4, ensure_ascii=False)
         print(formatted_json)
         
@@ -37,5 +28,11 @@ def decode_polybridge_save():
         return None
 
 if __name__ == "__main__":
-    # 运行并提取 JSON
-    level_json = decode_polybridge_save()
\ No newline at end of file
+    # 运行并提取 JSON；可传入存档文件路径，默认解码上面内置的示例字符串
+    import sys
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+            level_json = decode_polybridge_save(f.read())
+    else:
+        level_json = decode_polybridge_save()
\ No newline at end of file
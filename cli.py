@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import sys
+
+# ================= 统一命令行入口 =================
+# python cli.py <子命令> ...
+#   generate  参数化基线 -> 截图 (或 --image 使用已有截图) -> 调用大模型 -> 校验 + 静力预筛 -> 归档，通过的设计载入游戏
+#   baseline  只生成参数化桁架基线 (Warren / Pratt / Howe / 王柱 / 拱 / 绳索悬吊) 并列出预筛结果与造价
+#   validate  校验已有设计 (归档 JSON、拓扑 JSON 或存档字符串文件 "0") 并做静力预筛，可一次传入多个文件
+#   simulate  离线动力模拟 (近似游戏物理)：车辆能否过桥、哪些杆件在何时断裂，多个文件分批并行 (见 bridge_sim.py)
+#   optimize  造价估算与优化 (钢材降级 / 删除冗余杆件)，--write 时把优化后的设计归档到 gen/
+#   encode / decode  存档编解码，支持目录树并行批量转换 (见 tool/codec.py)
+#   load      把设计写入游戏存档槽并在游戏里载入
+#   run       运行模拟、保存回放、抽帧并判定通过 / 失败
+#   index     gen/ 归档索引：rebuild / query / top / levels / recall (见 design_index.py)
+# 每个子命令只在执行时导入自己需要的模块：离线子命令 (validate / simulate / baseline / encode / decode) 不会导入
+# pyautogui / PIL / openai / tenacity，也不读取 paths.py，在没有图形环境的机器上也能直接运行。
+
+
+def load_design(path):
+    """读取设计文件：存档 JSON ({"Objects": ...})、拓扑 JSON ({"nodes", "edges"}) 或加密的存档字符串"""
+    from bridge_design import BridgeDesign
+
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith(("{", "[")):
+        data = json.loads(text)
+    else:
+        from tool.codec import decode_save
+        data = decode_save(text)
+    if isinstance(data, dict) and "nodes" in data and "edges" in data:
+        return BridgeDesign.from_topology(data["nodes"], data["edges"])
+    return BridgeDesign.from_objects(data)
+
+
+def read_level(path):
+    """关卡初始存档 JSON；path 为空时使用内置的空关卡"""
+    if not path:
+        from config import DEFAULT_INITIAL_CODE
+        return DEFAULT_INITIAL_CODE
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def cmd_validate(args):
+    from cost_optimizer import member_costs
+    from design_validator import collect_violations, print_violations
+    from truss_solver import prescreen_design
+
+    failed = 0
+    for path in args.paths:
+        record = {"path": path}
+        try:
+            design = load_design(path)
+            violations = collect_violations(design)
+            record["violations"] = len(violations)
+            record["cost"] = round(float(member_costs(design).sum()), 2)
+            report = None if violations or args.no_prescreen else prescreen_design(design)
+            record["passed"] = not violations and (report is None or report["passed"])
+            if report is not None:
+                record["max_utilisation"] = report.get("max_utilisation")
+                record["reason"] = report.get("reason")
+        except Exception as e:
+            violations, report = [], None
+            record.update(passed=False, error=f"{type(e).__name__}: {e}")
+        failed += not record["passed"]
+
+        if args.json:
+            print(json.dumps(record, ensure_ascii=False))
+            continue
+        if "error" in record:
+            print(f"❌ {path}: 读取失败 ({record['error']})")
+            continue
+        if violations and not args.quiet:
+            print_violations(violations)
+        if violations:
+            summary = f"{len(violations)} 处违规"
+        elif report is None:
+            summary = "校验通过"
+        elif report["passed"]:
+            summary = f"校验与静力预筛通过，最大利用率 {report['max_utilisation']:.2f}"
+        else:
+            summary = f"静力预筛未通过：{report['reason']}"
+        print(f"{'✅' if record['passed'] else '❌'} {path}: {summary}，造价 ${record['cost']:.0f}")
+    return 1 if failed else 0
+
+
+def cmd_simulate(args):
+    import bridge_sim
+
+    designs, records = [], []
+    for path in args.paths:
+        try:
+            designs.append(load_design(path))
+            records.append({"path": path})
+        except Exception as e:
+            print(f"❌ {path}: 读取失败 ({type(e).__name__}: {e})")
+    results = bridge_sim.simulate_many(designs, workers=args.workers,
+                                       **({"batch_size": args.batch_size} if args.batch_size else {}))
+    for record, result in zip(records, results):
+        if args.json:
+            print(json.dumps({**record, **result}, ensure_ascii=False))
+            continue
+        print(f"{'✅' if result['success'] else '❌'} {record['path']}: {bridge_sim.describe_result(result)}")
+        if args.verbose:
+            for e in result["breaks"]:
+                print(f"   {e['time']:.2f}s 杆件 {e['id']} ({e['material']}) 断裂，轴力 {e['force']:.0f}")
+    return 0 if len(records) == len(args.paths) and all(r["success"] for r in results) else 1
+
+
+def cmd_optimize(args):
+    from datetime import datetime
+
+    from cost_optimizer import describe_savings, optimize_cost
+
+    failed = 0
+    for path in args.paths:
+        design, report = optimize_cost(load_design(path), budget=args.budget,
+                                       **({"utilisation_limit": args.limit} if args.limit else {}))
+        # 有预算时 (--budget / LEVEL_BUDGET) 优化后仍超出预算同样算失败
+        ok = report["optimized"] and report["within_budget"] is not False
+        failed += not ok
+        if args.json:
+            print(json.dumps({"path": path, **report}, ensure_ascii=False))
+        else:
+            print(f"{'💰' if ok else '❌'} {path}: {describe_savings(report)}")
+            if args.verbose:
+                for c in report["changes"]:
+                    action = f"{c['from']} -> {c['to']}" if c["action"] == "downgrade" else f"删除 {c['from']}"
+                    print(f"   杆件 {c['id']}: {action}，节省 ${c['saved']:.0f}")
+        if args.write and ok and report["changes"]:
+            import design_index
+            from save_pipeline import write_design_files
+
+            entry_id = datetime.now().strftime("%Y%m%d_%H%M%S") + "_opt"
+            written = write_design_files(design, entry_id)
+            design_index.index_saved_design(design, entry_id, written, violations=[],
+                                            report={"passed": True, "max_utilisation": report["max_utilisation"]})
+            print(f"   💾 已归档至 {written['json']}")
+    return 1 if failed else 0
+
+
+def cmd_baseline(args):
+    import truss_generator
+
+    allowed = [int(t) for t in args.materials.split(",") if t.strip()] if args.materials else None
+    candidates = truss_generator.generate_baselines(read_level(args.level), allowed_types=allowed,
+                                                    families=args.family or None)
+    if args.json:
+        for c in candidates:
+            print(json.dumps({k: c[k] for k in ("name", "family", "height", "panel", "passed", "reason", "cost", "max_utilisation")},
+                             ensure_ascii=False))
+    else:
+        truss_generator.print_candidates(candidates)
+    passing = [c for c in candidates if c["passed"]]
+    if args.write and passing:
+        from datetime import datetime
+
+        import design_index
+        from save_pipeline import write_design_files
+
+        best = passing[0]
+        entry_id = datetime.now().strftime("%Y%m%d_%H%M%S") + f"_{best['name']}"
+        written = write_design_files(best["design"], entry_id)
+        design_index.index_saved_design(best["design"], entry_id, written, model=f"baseline:{best['name']}", violations=[],
+                                        report={"passed": True, "max_utilisation": best["max_utilisation"]})
+        print(f"💾 最便宜的基线 {best['name']} 已归档至 {written['json']}")
+    return 0 if passing else 1
+
+
+def cmd_codec(args):
+    from tool import codec
+
+    argv = [args.command, *args.paths]
+    for flag in ("pattern", "out_dir", "name", "indent", "workers"):
+        value = getattr(args, flag, None)
+        if value is not None:
+            argv += [f"--{flag.replace('_', '-')}", str(value)]
+    if getattr(args, "force", False):
+        argv.append("--force")
+    return codec.main(argv)
+
+
+def cmd_generate(args):
+    import main2
+
+    if args.image is None:
+        from tool import screen_wait
+        print("▶️ 请在 3 秒内切换到游戏画面...")
+        screen_wait.wait_for_window_switch(3.0)
+    if args.no_baseline:
+        main2.BASELINE_FIRST = False
+    solved = main2.run_pipeline(read_level(args.level), image=args.image, load_into_game=not args.no_load)
+    return 0 if solved else 1
+
+
+def cmd_load(args):
+    from tool import auto_load_savefiles, screen_wait
+
+    if args.design:
+        import paths
+        from save_pipeline import SAVE_SLOT_NAME, atomic_write_text
+        from tool.codec import encode_save
+
+        slot = atomic_write_text(os.path.join(paths.GAME_SAVE_DIR, SAVE_SLOT_NAME),
+                                 encode_save(load_design(args.design).to_objects()))
+        print(f"📂 已写入游戏存档目录: {slot}")
+    if not args.no_wait:
+        print("⏳ 请在 3 秒内切换回游戏界面...")
+        screen_wait.wait_for_window_switch(3.0)
+    auto_load_savefiles.load_polybridge_save()
+    return 0
+
+
+def cmd_run(args):
+    from tool import auto_run, screen_wait
+
+    if not args.no_wait:
+        print("⏳ 请在 3 秒内切换回 Poly Bridge 游戏界面...")
+        screen_wait.wait_for_window_switch(3.0)
+    if args.capture_ref:
+        return 0 if auto_run.capture_share_button_ref() else 1
+    return 0 if auto_run.run_and_collect(entry_id=args.entry) else 1
+
+
+def cmd_index(args):
+    import design_index
+    return design_index.main(args.index_args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Poly Bridge 自动搭桥流水线")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("generate", help="截图并调用大模型生成设计 (需要 API_KEY)")
+    p.add_argument("--image", help="使用已有截图，不截屏 (无需图形环境)")
+    p.add_argument("--level", help="关卡初始存档 JSON 文件，默认使用内置的空关卡")
+    p.add_argument("--no-load", action="store_true", help="只归档到 gen/，不写入游戏存档槽、不载入")
+    p.add_argument("--no-baseline", action="store_true", help="不尝试参数化基线，直接调用大模型")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("baseline", help="生成参数化桁架基线并做静力预筛")
+    p.add_argument("--level", help="关卡初始存档 JSON 文件，默认使用内置的空关卡")
+    p.add_argument("--family", action="append", choices=["warren", "pratt", "howe", "king_post", "arch", "suspension"],
+                   help="只生成指定的族，可重复")
+    p.add_argument("--materials", help="本关已解锁的材料类型，例如 1,2,5，默认取全部")
+    p.add_argument("--write", action="store_true", help="把通过预筛且最便宜的基线归档到 gen/")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_baseline)
+
+    p = sub.add_parser("validate", help="校验设计文件并做静力预筛")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--no-prescreen", action="store_true", help="只做规则校验")
+    p.add_argument("--quiet", action="store_true", help="不逐条打印违规项")
+    p.add_argument("--json", action="store_true", help="每个文件输出一行 JSON，便于脚本解析")
+    p.set_defaults(func=cmd_validate)
+
+    p = sub.add_parser("simulate", help="离线动力模拟：车辆能否过桥 (近似游戏物理)")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--workers", type=int, help="并行进程数，默认 CPU 核数")
+    p.add_argument("--batch-size", type=int, help="每批一起向量化模拟的设计数，默认取 SIM_BATCH_SIZE")
+    p.add_argument("--verbose", action="store_true", help="逐条列出断裂的杆件")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_simulate)
+
+    p = sub.add_parser("optimize", help="造价估算与降级优化")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--budget", type=float, help="关卡预算 ($)，默认取 LEVEL_BUDGET")
+    p.add_argument("--limit", type=float, help="允许的最大利用率，默认取 OPTIMIZE_UTILISATION_LIMIT")
+    p.add_argument("--write", action="store_true", help="把优化后的设计归档到 gen/<时间戳>_opt")
+    p.add_argument("--verbose", action="store_true", help="逐条列出降级 / 删除的杆件")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_optimize)
+
+    for name, help_text in (("encode", "JSON -> 存档字符串"), ("decode", "存档字符串 -> JSON")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("paths", nargs="+", help="文件、目录或 glob (例如 'gen/*/0')")
+        p.add_argument("--pattern")
+        p.add_argument("--out-dir")
+        p.add_argument("--name")
+        p.add_argument("--workers", type=int)
+        if name == "decode":
+            p.add_argument("--indent", type=int)
+        else:
+            p.add_argument("--force", action="store_true", help="覆盖已存在的目标文件 (默认跳过，避免覆盖归档的存档)")
+        p.set_defaults(func=cmd_codec)
+
+    p = sub.add_parser("load", help="把设计写入游戏存档槽并在游戏里载入 (需要图形环境)")
+    p.add_argument("design", nargs="?", help="要载入的设计文件，省略时直接载入存档槽里已有的存档")
+    p.add_argument("--no-wait", action="store_true", help="不等待切换到游戏窗口")
+    p.set_defaults(func=cmd_load)
+
+    p = sub.add_parser("run", help="运行模拟、保存回放并判定 (需要图形环境)")
+    p.add_argument("--no-wait", action="store_true", help="不等待切换到游戏窗口")
+    p.add_argument("--entry", help="判定结果记到该设计 id 上 (默认取最近一个写入游戏存档槽的设计)")
+    p.add_argument("--capture-ref", action="store_true", help="在结果界面截取分享按钮参考图，之后等待模拟结束时用它匹配")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("index", help="gen/ 归档索引 (rebuild / query / top / levels / recall)", add_help=False)
+    p.add_argument("index_args", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_index)
+    return parser
+
+
+def main(argv=None):
+    from config import load_env
+
+    args = build_parser().parse_args(argv)
+    load_env()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
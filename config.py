@@ -0,0 +1,24 @@
+import os
+from pathlib import Path
+
+# ================= 运行配置 =================
+# .env 加载与内置的默认关卡。导入本模块没有任何副作用：
+# 由入口 (cli.main、直接运行 main.py / main2.py) 显式调用 load_env()，离线子命令取默认关卡也不必导入 main2。
+
+
+def load_env(env_file: str = ".env"):
+    """从 .env 文件加载环境变量"""
+    env_path = Path(env_file)
+    if env_path.exists():
+        with open(env_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    os.environ[key.strip()] = value.strip()
+
+
+# 测试用的初始存档数据 (只有 4 个锚点的空关卡)
+DEFAULT_INITIAL_CODE = """
+{"DisplayName":"1","Objects":[{"type":0,"x":0,"y":0,"id":1,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true},{"type":0,"x":8,"y":0,"id":2,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true},{"type":0,"x":0,"y":-2,"id":3,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true},{"type":0,"x":8,"y":-2,"id":4,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true}]}
+"""
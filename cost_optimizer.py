@@ -0,0 +1,204 @@
+import os
+import time
+
+import numpy as np
+
+from bridge_design import BridgeDesign
+from design_validator import collect_violations
+from materials import MATERIALS, ROAD_TYPE
+from truss_solver import prescreen_design
+
+# ================= 造价估算与降级优化 =================
+# 造价 = Σ 杆件长度 × 材料单价，由节点坐标一次性向量化算出 (单价表见 materials.py)。
+# 优化器在静力预筛通过的设计上贪心地降低造价：
+#   1. 把够短的钢材 (≤ 木材最大长度) 降级为木材；
+#   2. 删除几乎不受力的冗余杆件 (以及因此悬空的节点)。
+# 每一步都重新做静力预筛 (毫秒级)，保证利用率不超过上限、长度不超过材料上限；路面与液压杆不动。
+# 先尝试一次性降级全部候选，不通过再逐根尝试，尽量少做预筛。
+
+OPTIMIZE_UTILISATION_LIMIT = float(os.getenv("OPTIMIZE_UTILISATION_LIMIT", "0.9"))  # 比预筛的 1.0 留一点余量
+REMOVE_UTILISATION = float(os.getenv("OPTIMIZE_REMOVE_UTILISATION", "0.05"))        # 利用率低于此值的杆件视为冗余候选
+LEVEL_BUDGET = float(os.getenv("LEVEL_BUDGET", "0")) or None                         # 关卡预算 ($)，0 表示不限
+DOWNGRADES = {8: 2}            # 钢材 -> 木材
+PROTECTED_TYPES = {ROAD_TYPE, 4}   # 路面与液压杆不参与降级 / 删除
+
+# 材料类型 -> 单价 / 最大长度 查找表 (未知类型单价为 0，长度不限)
+_UNIT_COST = np.zeros(max(MATERIALS) + 1)
+_MAX_LENGTH = np.full(max(MATERIALS) + 1, np.inf)
+for _type, _mat in MATERIALS.items():
+    _UNIT_COST[_type] = _mat["cost"]
+    if _mat["max_length"] is not None:
+        _MAX_LENGTH[_type] = _mat["max_length"]
+
+
+def _lookup(table, types, default):
+    types = np.asarray(types, dtype=np.int64)
+    known = (types >= 0) & (types < len(table))
+    return np.where(known, table[np.clip(types, 0, len(table) - 1)], default)
+
+
+def member_costs(design_data):
+    """各杆件造价 (m,)，锚点缺失的杆件记为 0"""
+    design = BridgeDesign.coerce(design_data)
+    return np.nan_to_num(design.edge_lengths()) * _lookup(_UNIT_COST, design.edge_type, 0.0)
+
+
+def estimate_cost(design_data, budget=None):
+    """
+    返回 {"total", "by_material": {材料名: {"count", "length", "cost"}}, "members": [{"id", "material", "length", "cost"}],
+          "budget", "within_budget"}
+    """
+    design = BridgeDesign.coerce(design_data)
+    lengths = np.nan_to_num(design.edge_lengths())
+    costs = lengths * _lookup(_UNIT_COST, design.edge_type, 0.0)
+    names = [MATERIALS[t]["name"] if t in MATERIALS else f"Unknown({t})" for t in design.edge_type.tolist()]
+
+    by_material = {}
+    for t in np.unique(design.edge_type).tolist():
+        mask = design.edge_type == t
+        name = MATERIALS[t]["name"] if t in MATERIALS else f"Unknown({t})"
+        by_material[name] = {"count": int(mask.sum()), "length": float(lengths[mask].sum()), "cost": float(costs[mask].sum())}
+
+    total = float(costs.sum())
+    budget = LEVEL_BUDGET if budget is None else budget
+    return {
+        "total": total,
+        "by_material": by_material,
+        "members": [{"id": i, "material": n, "length": l, "cost": c}
+                    for i, n, l, c in zip(design.edge_ids.tolist(), names, lengths.tolist(), costs.tolist())],
+        "budget": budget,
+        "within_budget": None if budget is None else total <= budget,
+    }
+
+
+def _rebuild(design, keep, types):
+    """按杆件掩码 keep 与新的材料表 types 构造新设计，并去掉因此悬空的非锚点节点"""
+    edge_nodes = design.edge_nodes[keep]
+    used = np.zeros(design.n_nodes, dtype=bool)
+    used[edge_nodes[edge_nodes >= 0]] = True
+    node_keep = used | design.node_kinematic
+    return BridgeDesign(
+        design.display_name,
+        design.node_ids[node_keep], design.node_xy[node_keep], design.node_kinematic[node_keep], design.node_split[node_keep],
+        design.edge_ids[keep], types[keep], design.edge_anchor_ids[keep],
+        edge_xy=design.edge_xy[keep], edge_rate=design.edge_rate[keep], edge_split=design.edge_split[keep],
+    )
+
+
+def _passes(design, limit):
+    report = prescreen_design(design, utilisation_limit=limit)
+    return report["passed"], report
+
+
+def optimize_cost(design_data, budget=None, utilisation_limit=OPTIMIZE_UTILISATION_LIMIT, remove_members=True):
+    """
+    在保持静力预筛通过 (利用率 ≤ utilisation_limit) 与材料长度上限的前提下降低造价。
+    返回 (优化后的 BridgeDesign, 报告)；原设计存在规则违规或不通过预筛时原样返回，报告中 optimized=False。
+    报告：{"optimized", "original_cost", "optimized_cost", "savings", "savings_pct", "changes", "violations",
+           "max_utilisation", "budget", "within_budget", "prescreens", "elapsed_ms"}
+    """
+    started = time.perf_counter()
+    design = BridgeDesign.coerce(design_data)
+    budget = LEVEL_BUDGET if budget is None else budget
+    original_cost = float(member_costs(design).sum())
+    # 先做规则校验：有违规的设计 (超长、重复 id 等) 预筛可能照样通过，但游戏里不可用，不做优化
+    violations = collect_violations(design)
+    if violations:
+        prescreens = 0
+        ok, report = False, {"max_utilisation": None, "reason": f"{len(violations)} 处违规，如 {violations[0]['message']}"}
+    else:
+        prescreens = 1
+        ok, report = _passes(design, utilisation_limit)
+
+    changes = []
+    if ok:
+        keep = np.ones(design.n_edges, dtype=bool)
+        types = design.edge_type.copy()
+        lengths = np.nan_to_num(design.edge_lengths())
+        unit = _lookup(_UNIT_COST, types, 0.0)
+
+        # ---------- 1. 钢材降级 ----------
+        for src, dst in DOWNGRADES.items():
+            candidates = np.flatnonzero((types == src) & (lengths <= _lookup(_MAX_LENGTH, [dst], np.inf)[0]))
+            if len(candidates) == 0:
+                continue
+            trial = types.copy()
+            trial[candidates] = dst
+            trial_ok, trial_report = _passes(_rebuild(design, keep, trial), utilisation_limit)
+            prescreens += 1
+            if trial_ok:
+                accepted, report = candidates, trial_report
+            else:
+                # 一次性降级不通过：按省钱多少逐根尝试，利用率已经很高的直接跳过
+                util = {m["id"]: m["utilisation"] for m in report["members"]}
+                ratio = MATERIALS[src]["strength"] / MATERIALS[dst]["strength"]
+                savings = lengths[candidates] * (unit[candidates] - _UNIT_COST[dst])
+                accepted = []
+                for i in candidates[np.argsort(-savings)]:
+                    if util[int(design.edge_ids[i])] * ratio > utilisation_limit:
+                        continue
+                    trial = types.copy()
+                    trial[i] = dst
+                    trial_ok, trial_report = _passes(_rebuild(design, keep, trial), utilisation_limit)
+                    prescreens += 1
+                    if trial_ok:
+                        types, report = trial, trial_report
+                        util = {m["id"]: m["utilisation"] for m in report["members"]}
+                        accepted.append(i)
+            types[accepted] = dst
+            for i in accepted:
+                changes.append({"id": int(design.edge_ids[i]), "action": "downgrade",
+                                "from": MATERIALS[src]["name"], "to": MATERIALS[dst]["name"],
+                                "saved": float(lengths[i] * (unit[i] - _UNIT_COST[dst]))})
+
+        # ---------- 2. 删除冗余杆件 ----------
+        if remove_members:
+            util = {m["id"]: m["utilisation"] for m in report["members"]}
+            unit = _lookup(_UNIT_COST, types, 0.0)
+            protected = np.isin(types, list(PROTECTED_TYPES))
+            candidates = [i for i in np.argsort(-(lengths * unit))
+                          if keep[i] and not protected[i] and util.get(int(design.edge_ids[i]), 1.0) < REMOVE_UTILISATION]
+            for i in candidates:
+                trial_keep = keep.copy()
+                trial_keep[i] = False
+                trial_ok, trial_report = _passes(_rebuild(design, trial_keep, types), utilisation_limit)
+                prescreens += 1
+                if trial_ok:
+                    keep, report = trial_keep, trial_report
+                    changes.append({"id": int(design.edge_ids[i]), "action": "remove",
+                                    "from": MATERIALS.get(int(types[i]), {}).get("name"), "to": None,
+                                    "saved": float(lengths[i] * unit[i])})
+
+        design = _rebuild(design, keep, types)
+
+    optimized_cost = float(member_costs(design).sum())
+    savings = original_cost - optimized_cost
+    return design, {
+        "optimized": bool(ok),
+        "original_cost": original_cost,
+        "optimized_cost": optimized_cost,
+        "savings": savings,
+        "savings_pct": savings / original_cost * 100.0 if original_cost else 0.0,
+        "changes": changes,
+        "violations": len(violations),
+        "max_utilisation": report["max_utilisation"],
+        "reason": None if ok else report["reason"],
+        "budget": budget,
+        "within_budget": None if budget is None else optimized_cost <= budget,
+        "prescreens": prescreens,
+        "elapsed_ms": (time.perf_counter() - started) * 1000.0,
+    }
+
+
+def describe_savings(report):
+    """一行中文摘要，供日志使用"""
+    if not report["optimized"]:
+        return f"未优化：原设计未通过{'规则校验' if report['violations'] else '静力预筛'} ({report['reason']})"
+    downgraded = sum(c["action"] == "downgrade" for c in report["changes"])
+    removed = sum(c["action"] == "remove" for c in report["changes"])
+    text = (f"造价 ${report['original_cost']:.0f} -> ${report['optimized_cost']:.0f}，节省 ${report['savings']:.0f} "
+            f"({report['savings_pct']:.1f}%)：降级 {downgraded} 根，删除 {removed} 根，"
+            f"最大利用率 {report['max_utilisation']:.2f}")
+    if report["budget"] is not None:
+        text += f"，{'未超出' if report['within_budget'] else '仍超出'}预算 ${report['budget']:.0f}"
+    return text
@@ -0,0 +1,53 @@
+import hashlib
+import json
+
+import numpy as np
+
+from bridge_design import BridgeDesign
+from materials import HYDRAULIC_TYPE
+
+# ================= 设计的规范形式与结构 hash =================
+# 大模型的多个候选经常是同一个桁架，只是节点 / 杆件 id 编号不同或列出顺序不同。
+# 规范形式与 id 和顺序无关：节点一律按坐标标识 (锚点本身就由坐标固定)，按 (x, y) 排序后重新编号；
+# 杆件写成 (材料, 较小端点号, 较大端点号) 并排序；液压杆再带上按坐标精度取整的 rate (活塞伸缩量不同就是不同的设计)。
+# 两个设计的规范形式相同 <=> 结构完全相同。
+
+COORD_DIGITS = 3   # 坐标保留的小数位数，吸收浮点序列化误差
+
+
+def canonical_form(design_data, ndigits=COORD_DIGITS):
+    """
+    返回 {"nodes": [[x, y, 是否锚点, split], ...], "edges": [[type, a, b, split], ...]}，
+    a / b 为节点在规范顺序中的下标 (a <= b)，锚点不存在的一端记为 -1；液压杆写成 [type, a, b, split, rate]。
+    design_data 可以是 BridgeDesign，也可以是 convert_topology_to_objects 的输出
+    """
+    design = BridgeDesign.coerce(design_data)
+    xy = np.round(design.node_xy, ndigits) + 0.0   # + 0.0 把 -0.0 统一成 0.0
+    order = np.lexsort((design.node_split, design.node_kinematic, xy[:, 1], xy[:, 0]))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    if len(rank):
+        ends = np.where(design.edge_nodes >= 0, rank[np.clip(design.edge_nodes, 0, None)], -1)
+    else:
+        ends = np.full(design.edge_nodes.shape, -1, dtype=np.int64)
+    ends.sort(axis=1)
+    edges = np.column_stack([design.edge_type.astype(np.int64), ends, design.edge_split.astype(np.int64)])
+    hydraulic = design.edge_type == HYDRAULIC_TYPE
+    rate = np.where(hydraulic, np.round(design.edge_rate, ndigits), 0.0) + 0.0
+    edge_order = np.lexsort((rate, *edges.T[::-1])) if len(edges) else np.zeros(0, dtype=np.int64)
+    edges = [row + [float(r)] if h else row
+             for row, h, r in zip(edges[edge_order].tolist(), hydraulic[edge_order].tolist(), rate[edge_order].tolist())]
+
+    nodes = [[float(x), float(y), bool(k), int(s)] for (x, y), k, s in
+             zip(xy[order].tolist(), design.node_kinematic[order].tolist(), design.node_split[order].tolist())]
+    return {"nodes": nodes, "edges": edges}
+
+
+def canonical_json(design_data, ndigits=COORD_DIGITS):
+    return json.dumps(canonical_form(design_data, ndigits), separators=(',', ':'))
+
+
+def design_hash(design_data, ndigits=COORD_DIGITS):
+    """规范形式的 sha256 前 16 位，作为设计的结构 hash"""
+    return hashlib.sha256(canonical_json(design_data, ndigits).encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,510 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from materials import MATERIALS
+
+# ================= gen/ 归档的 SQLite 索引 =================
+# 每个归档设计一行：关卡、模型、prompt 前缀 hash、各材料杆件数、总长度与造价估算、
+# 校验 / 静力预筛结果、回放判定结果以及文件路径。save_to_layout_file 写盘后即时更新，
+# rebuild() 扫描 gen/ (以及 pic/ 下的 score.json) 回填历史数据，之后按条件查询不必再逐个解析 JSON。
+# 关卡 id 取设计中固定锚点 (isKinematic 节点) 坐标的 hash：同一关卡的锚点相同，历史归档也能据此归类。
+# design_memo 表按结构 hash (见 design_canon.py) 记录校验 / 预筛 / 回放结果：
+# 与已测设计结构相同的新候选直接复用结果，不必再进游戏跑一遍。
+
+DEFAULT_INDEX_FILE = os.path.join("gen", "index.sqlite3")
+REPLAY_MATCH_WINDOW = 1800.0    # 回放与设计按时间配对时，回放最多晚于设计写出多少秒
+MATERIAL_COLUMNS = {t: f"n_{m['name'].lower()}" for t, m in MATERIALS.items()}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS designs (
+    id TEXT PRIMARY KEY,
+    design_hash TEXT,
+    created_at REAL,
+    level_id TEXT,
+    level_name TEXT,
+    model TEXT,
+    prompt_hash TEXT,
+    run_id TEXT,
+    n_nodes INTEGER,
+    n_edges INTEGER,
+    {", ".join(f"{c} INTEGER" for c in MATERIAL_COLUMNS.values())},
+    n_other INTEGER,
+    total_length REAL,
+    cost REAL,
+    violations INTEGER,
+    valid INTEGER,
+    prescreen_passed INTEGER,
+    max_utilisation REAL,
+    replay_success INTEGER,
+    replay_confidence REAL,
+    failure_time REAL,
+    replay_dir TEXT,
+    json_path TEXT,
+    encoded_path TEXT,
+    game_slot TEXT,
+    source_mtime REAL,
+    indexed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_designs_level ON designs (level_id, valid, cost);
+CREATE INDEX IF NOT EXISTS idx_designs_created ON designs (created_at);
+CREATE INDEX IF NOT EXISTS idx_designs_prompt ON designs (prompt_hash);
+CREATE TABLE IF NOT EXISTS design_memo (
+    design_hash TEXT PRIMARY KEY,
+    first_entry TEXT,
+    last_entry TEXT,
+    valid INTEGER,
+    violations INTEGER,
+    prescreen_passed INTEGER,
+    max_utilisation REAL,
+    replay_success INTEGER,
+    replay_confidence REAL,
+    failure_time REAL,
+    replay_entry TEXT,
+    updated_at REAL
+);
+"""
+
+
+def level_signature(design):
+    """固定锚点坐标 (按坐标排序、保留 3 位小数) 的 sha1 前 12 位；没有锚点时返回 None"""
+    anchors = design.node_xy[design.node_kinematic]
+    if len(anchors) == 0:
+        return None
+    coords = sorted((round(float(x), 3), round(float(y), 3)) for x, y in anchors)
+    return hashlib.sha1(json.dumps(coords).encode('utf-8')).hexdigest()[:12]
+
+
+def material_summary(design):
+    """各材料杆件数、总长度与造价估算 (见 cost_optimizer.py，锚点缺失的杆件长度记为 0)"""
+    import numpy as np
+    from cost_optimizer import member_costs
+
+    lengths = np.nan_to_num(design.edge_lengths())
+    types = design.edge_type
+    counts = {column: int(np.count_nonzero(types == t)) for t, column in MATERIAL_COLUMNS.items()}
+    return {
+        **counts,
+        "n_other": int(len(types) - sum(counts.values())),
+        "total_length": round(float(lengths.sum()), 3),
+        "cost": round(float(member_costs(design).sum()), 2),
+    }
+
+
+def entry_created_at(entry_id, fallback=None):
+    """归档目录名以 YYYYmmdd_HHMMSS 开头 (候选会带 _c<n> 后缀)，解析失败时用 fallback"""
+    try:
+        return datetime.strptime(entry_id[:15], "%Y%m%d_%H%M%S").timestamp()
+    except ValueError:
+        return fallback
+
+
+class DesignIndex:
+    def __init__(self, path=DEFAULT_INDEX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            # 早期建立的索引没有 design_hash 列，补上即可 (rebuild --full 会回填)
+            columns = {r[1] for r in self._conn.execute("PRAGMA table_info(designs)")}
+            if "design_hash" not in columns:
+                self._conn.execute("ALTER TABLE designs ADD COLUMN design_hash TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_designs_hash ON designs (design_hash)")
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- 写入 ----------
+    def upsert(self, row, commit=True):
+        """按 id 插入或覆盖更新给出的字段 (未给出的字段保持原值)"""
+        row = dict(row, indexed_at=time.time())
+        columns = list(row)
+        updates = ", ".join(f"{c}=excluded.{c}" for c in columns if c != "id")
+        sql = (f"INSERT INTO designs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+               f"ON CONFLICT(id) DO UPDATE SET {updates}")
+        with self._lock:
+            self.conn.execute(sql, [row[c] for c in columns])
+            if commit:
+                self.conn.commit()
+
+    def record_design(self, design_data, entry_id, files=None, model=None, prompt_hash=None, run_id=None,
+                      level_name=None, prescreen=True, violations=None, report=None, commit=True):
+        """
+        索引一个设计：files 为 write_design_files 的返回值。
+        violations / report 为调用方已有的规则校验结果与预筛报告 (违规时没有报告，传 None)：
+        给出 violations 即视为已经筛查过，直接沿用，不再校验或预筛；
+        否则现场校验一次，prescreen=True 时对没有违规的设计再现场预筛一次。返回写入的行
+        """
+        from bridge_design import BridgeDesign
+        from design_canon import design_hash
+        from design_validator import collect_violations
+
+        design = BridgeDesign.coerce(design_data)
+        if violations is None:
+            violations = collect_violations(design)
+            if report is None and prescreen and not violations:
+                from truss_solver import prescreen_design
+                report = prescreen_design(design)
+
+        files = files or {}
+        json_path = files.get("json")
+        row = {
+            "id": entry_id,
+            "design_hash": design_hash(design),
+            "created_at": entry_created_at(entry_id, os.path.getmtime(json_path) if json_path else time.time()),
+            "level_id": level_signature(design),
+            "level_name": level_name,
+            "model": model,
+            "prompt_hash": prompt_hash,
+            "run_id": run_id,
+            "n_nodes": design.n_nodes,
+            "n_edges": design.n_edges,
+            **material_summary(design),
+            "violations": len(violations),
+            "valid": int(not violations),
+            "prescreen_passed": None if report is None else int(bool(report["passed"])),
+            "max_utilisation": None if report is None else report.get("max_utilisation"),
+            "json_path": json_path,
+            "encoded_path": files.get("encoded"),
+            "game_slot": files.get("game_slot"),
+            "source_mtime": os.path.getmtime(json_path) if json_path and os.path.exists(json_path) else None,
+        }
+        self.upsert({k: v for k, v in row.items() if v is not None or k in ("prescreen_passed", "max_utilisation")},
+                    commit=False)
+        self._memo_validation(row, commit)
+        return row
+
+    def _memo_validation(self, row, commit=True):
+        """把校验 / 预筛结果记进 design_memo (first_entry 保留第一次见到该结构的设计)"""
+        sql = """
+            INSERT INTO design_memo (design_hash, first_entry, last_entry, valid, violations,
+                                     prescreen_passed, max_utilisation, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(design_hash) DO UPDATE SET
+                last_entry = excluded.last_entry, valid = excluded.valid, violations = excluded.violations,
+                prescreen_passed = COALESCE(excluded.prescreen_passed, prescreen_passed),
+                max_utilisation = COALESCE(excluded.max_utilisation, max_utilisation),
+                updated_at = excluded.updated_at
+        """
+        with self._lock:
+            self.conn.execute(sql, (row["design_hash"], row["id"], row["id"], row["valid"], row["violations"],
+                                    row["prescreen_passed"], row["max_utilisation"], time.time()))
+            if commit:
+                self.conn.commit()
+
+    def record_replay(self, entry_id, result, replay_dir=None, commit=True):
+        """写入回放判定结果 (tool/replay_score.py 的输出)"""
+        self.upsert({
+            "id": entry_id,
+            "replay_success": None if result.get("success") is None else int(result["success"]),
+            "replay_confidence": result.get("confidence"),
+            "failure_time": result.get("failure_time"),
+            "replay_dir": replay_dir,
+        }, commit=False)
+        if result.get("success") is not None:
+            with self._lock:
+                self.conn.execute(
+                    "UPDATE design_memo SET replay_success = ?, replay_confidence = ?, failure_time = ?, "
+                    "replay_entry = ?, updated_at = ? WHERE design_hash = (SELECT design_hash FROM designs WHERE id = ?)",
+                    (int(result["success"]), result.get("confidence"), result.get("failure_time"),
+                     entry_id, time.time(), entry_id))
+        if commit:
+            with self._lock:
+                self.conn.commit()
+
+    def recall(self, design_hash):
+        """按结构 hash 查 design_memo，返回 dict (含 seen：归档中该结构出现的次数)；没见过返回 None"""
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM design_memo WHERE design_hash = ?", (design_hash,)).fetchone()
+            if row is None:
+                return None
+            seen = self.conn.execute("SELECT COUNT(*) FROM designs WHERE design_hash = ?", (design_hash,)).fetchone()[0]
+        return dict(row, seen=seen)
+
+    def attach_replay(self, replay_dir, result=None, at=None, entry_id=None, loaded_only=True, commit=True):
+        """
+        把一个回放目录的判定结果挂到对应的设计上：给出 entry_id 时直接记到该设计上；
+        否则取回放时间之前最近一个写过游戏存档槽的设计 (loaded_only=False 时通过预筛的设计也算，
+        仅供 rebuild 回填早期没有记录存档槽的归档)。返回设计 id，找不到时返回 None
+        """
+        if result is None:
+            with open(os.path.join(replay_dir, "score.json"), 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        if entry_id is None:
+            if at is None:
+                at = entry_created_at(os.path.basename(os.path.normpath(replay_dir)), time.time())
+            loaded = "game_slot IS NOT NULL" if loaded_only else "(game_slot IS NOT NULL OR prescreen_passed = 1)"
+            with self._lock:
+                row = self.conn.execute(
+                    f"SELECT id FROM designs WHERE created_at <= ? AND created_at >= ? AND {loaded} "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (at, at - REPLAY_MATCH_WINDOW)).fetchone()
+            if row is None:
+                return None
+            entry_id = row["id"]
+        self.record_replay(entry_id, result, replay_dir, commit=commit)
+        return entry_id
+
+    def rebuild(self, gen_dir="gen", pic_dir=None, full=False, prescreen=True):
+        """
+        扫描 gen/ 回填索引：gen/<ts>/<ts>.json 与早期的 gen/<ts>.json 都会收录；
+        full=False 时跳过文件未修改过的条目。给出 pic_dir 时再把其中的 score.json 挂到对应设计上。
+        返回 {"indexed", "skipped", "failed", "replays"}
+        """
+        known = {}
+        with self._lock:
+            for r in self.conn.execute("SELECT id, source_mtime FROM designs"):
+                known[r["id"]] = r["source_mtime"]
+
+        stats = {"indexed": 0, "skipped": 0, "failed": 0, "replays": 0}
+        for entry_id, json_path, encoded_path in _scan_gen(gen_dir):
+            mtime = os.path.getmtime(json_path)
+            if not full and known.get(entry_id) == mtime:
+                stats["skipped"] += 1
+                continue
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.record_design(data, entry_id, {"json": json_path, "encoded": encoded_path},
+                                   prescreen=prescreen, commit=False)
+                stats["indexed"] += 1
+            except Exception as e:
+                print(f"⚠️ 索引 {json_path} 失败: {e}")
+                stats["failed"] += 1
+
+        if pic_dir and os.path.isdir(pic_dir):
+            for name in sorted(os.listdir(pic_dir)):
+                replay_dir = os.path.join(pic_dir, name)
+                if os.path.exists(os.path.join(replay_dir, "score.json")):
+                    stats["replays"] += self.attach_replay(replay_dir, loaded_only=False, commit=False) is not None
+        with self._lock:
+            self.conn.commit()
+        return stats
+
+    # ---------- 查询 ----------
+    def query(self, level_id=None, model=None, prompt_hash=None, valid=None, prescreen_passed=None,
+              replay_success=None, since=None, order_by="created_at DESC", limit=None):
+        """按条件筛选，返回 dict 列表；条件为 None 表示不限"""
+        filters = {"level_id": level_id, "model": model, "prompt_hash": prompt_hash, "valid": valid,
+                   "prescreen_passed": prescreen_passed, "replay_success": replay_success}
+        where, params = [], []
+        for column, value in filters.items():
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(int(value) if isinstance(value, bool) else value)
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        sql = "SELECT * FROM designs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {_safe_order(order_by)}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            return [dict(r) for r in self.conn.execute(sql, params)]
+
+    def top_k(self, k=10, level_id=None, by="cost", passed_only=True):
+        """
+        某关卡 (或全部) 的前 k 个设计，默认按造价从低到高；passed_only 时只看通过的设计
+        (有回放结果时以回放为准，否则要求校验与静力预筛都通过)
+        """
+        where, params = [], []
+        if level_id is not None:
+            where.append("level_id = ?")
+            params.append(level_id)
+        if passed_only:
+            where.append("(replay_success = 1 OR (replay_success IS NULL AND valid = 1 AND prescreen_passed = 1))")
+        sql = "SELECT * FROM designs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {_safe_order(by)}, created_at DESC LIMIT ?"
+        with self._lock:
+            return [dict(r) for r in self.conn.execute(sql, params + [int(k)])]
+
+    def level_stats(self):
+        """按关卡汇总：设计数、通过校验 / 预筛 / 回放的数量、最低造价"""
+        sql = """
+            SELECT level_id, MAX(level_name) AS level_name, COUNT(*) AS designs,
+                   TOTAL(valid) AS valid, TOTAL(prescreen_passed = 1) AS prescreen_passed,
+                   TOTAL(replay_success = 1) AS replay_success,
+                   MIN(CASE WHEN valid = 1 AND prescreen_passed = 1 THEN cost END) AS best_cost
+            FROM designs GROUP BY level_id ORDER BY designs DESC
+        """
+        with self._lock:
+            return [dict(r) for r in self.conn.execute(sql)]
+
+
+def _safe_order(order_by):
+    """ORDER BY 只允许 "<列名> [ASC|DESC]"，避免拼接任意 SQL"""
+    parts = order_by.split()
+    column = parts[0]
+    direction = parts[1].upper() if len(parts) > 1 else "ASC"
+    if not column.replace("_", "").isalnum() or direction not in ("ASC", "DESC") or len(parts) > 2:
+        raise ValueError(f"不支持的排序方式: {order_by}")
+    return f"{column} {direction}"
+
+
+def _scan_gen(gen_dir):
+    """产出 (条目 id, JSON 路径, 加密文件路径或 None)"""
+    if not os.path.isdir(gen_dir):
+        return
+    for entry in sorted(os.scandir(gen_dir), key=lambda e: e.name):
+        if entry.is_dir():
+            json_path = os.path.join(entry.path, f"{entry.name}.json")
+            if os.path.exists(json_path):
+                encoded_path = os.path.join(entry.path, "0")
+                yield entry.name, json_path, encoded_path if os.path.exists(encoded_path) else None
+        elif entry.name.endswith(".json"):
+            yield entry.name[:-5], entry.path, None
+
+
+_default_index = None
+
+
+def default_index():
+    """进程级共享的索引，路径由 DESIGN_INDEX_FILE 控制 (设为空字符串即关闭，返回 None)"""
+    global _default_index
+    path = os.getenv("DESIGN_INDEX_FILE", DEFAULT_INDEX_FILE)
+    if not path:
+        return None
+    if _default_index is None or _default_index.path != path:
+        _default_index = DesignIndex(path)
+    return _default_index
+
+
+def index_saved_design(design_data, entry_id, files, model=None, violations=None, report=None):
+    """
+    save_to_layout_file 写盘后调用：把设计记进默认索引，并带上当前运行上下文 (run_id、prompt hash、关卡名)；
+    调用方已经做过校验 / 预筛时传入 violations 与预筛报告 report (违规时为 None)，避免重复求解
+    """
+    index = default_index()
+    if index is None:
+        return None
+    from llm_metrics import get_run_context
+
+    context = get_run_context()
+    try:
+        return index.record_design(design_data, entry_id, files, model=model,
+                                   prompt_hash=context.get("prompt_prefix"), run_id=context.get("run_id"),
+                                   level_name=context.get("level"), violations=violations, report=report)
+    except Exception as e:
+        print(f"⚠️ 更新设计索引失败: {e}")
+        return None
+
+
+def recall_outcome(design_data):
+    """
+    在默认索引的 design_memo 中查找结构相同的已测设计，返回 memo 记录 (replay_success 不为 None 时
+    说明该结构已经在游戏里跑过)；索引关闭、没见过或查询失败时返回 None
+    """
+    index = default_index()
+    if index is None:
+        return None
+    from design_canon import design_hash
+
+    try:
+        return index.recall(design_hash(design_data))
+    except Exception as e:
+        print(f"⚠️ 查询设计 memo 失败: {e}")
+        return None
+
+
+def print_rows(rows):
+    for r in rows:
+        replay = {None: "-", 1: "✅", 0: "❌"}[r["replay_success"]]
+        checks = "✅" if r["valid"] and r["prescreen_passed"] else "❌"
+        materials = " ".join(f"{c[2:]}={r[c]}" for c in MATERIAL_COLUMNS.values() if r[c])
+        print(f"{r['id']:20s} level={r['level_id'] or '-'} 校验/预筛{checks} 回放{replay} "
+              f"cost=${r['cost']:.0f} len={r['total_length']:.1f}m {materials} model={r['model'] or '-'}")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="gen/ 归档索引")
+    parser.add_argument("--index", default=os.getenv("DESIGN_INDEX_FILE") or DEFAULT_INDEX_FILE)
+    sub = parser.add_subparsers(dest="action", required=True)
+    p = sub.add_parser("rebuild", help="扫描 gen/ (和 pic/) 回填索引")
+    p.add_argument("--gen-dir", default="gen")
+    p.add_argument("--pic-dir", help="回放归档目录，默认为运行目录上一级的 pic")
+    p.add_argument("--full", action="store_true", help="忽略修改时间，全部重新索引")
+    p.add_argument("--no-prescreen", action="store_true")
+    p = sub.add_parser("query", help="按条件列出设计")
+    p.add_argument("--level")
+    p.add_argument("--model")
+    p.add_argument("--prompt")
+    p.add_argument("--passed", action="store_true", help="只看校验与静力预筛都通过的")
+    p.add_argument("--order-by", default="created_at DESC")
+    p.add_argument("--limit", type=int, default=20)
+    p.add_argument("--json", action="store_true")
+    p = sub.add_parser("top", help="造价最低 (或按其他字段排序) 的前 k 个通过的设计")
+    p.add_argument("-k", type=int, default=10)
+    p.add_argument("--level")
+    p.add_argument("--by", default="cost")
+    p.add_argument("--json", action="store_true")
+    sub.add_parser("levels", help="按关卡汇总")
+    p = sub.add_parser("recall", help="按结构 hash 查找与给定设计文件相同的已测设计")
+    p.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+
+    index = DesignIndex(args.index)
+    if args.action == "rebuild":
+        if args.pic_dir is None:
+            from tool.replay_collector import default_replay_dirs
+            args.pic_dir = default_replay_dirs()[1]
+        started = time.perf_counter()
+        stats = index.rebuild(args.gen_dir, args.pic_dir, full=args.full, prescreen=not args.no_prescreen)
+        print(f"🗂️ 索引完成：新增 / 更新 {stats['indexed']}，未变化跳过 {stats['skipped']}，失败 {stats['failed']}，"
+              f"关联回放 {stats['replays']} ({time.perf_counter() - started:.2f}s) -> {index.path}")
+    elif args.action == "recall":
+        from cli import load_design
+        from design_canon import design_hash
+        for path in args.paths:
+            digest = design_hash(load_design(path))
+            known = index.recall(digest)
+            if known is None:
+                print(f"🆕 {path}: hash {digest}，未见过")
+                continue
+            replay = {None: "未跑过", 1: "通过", 0: "失败"}[known["replay_success"]]
+            print(f"♻️ {path}: hash {digest}，已见过 {known['seen']} 次 (首次 {known['first_entry']})，"
+                  f"校验{'通过' if known['valid'] else '未通过'}，回放{replay}")
+    elif args.action == "levels":
+        for r in index.level_stats():
+            best = f"${r['best_cost']:.0f}" if r["best_cost"] is not None else "-"
+            print(f"{r['level_id'] or '-'} ({r['level_name'] or '-'}): {r['designs']} 个设计，校验通过 {r['valid']:.0f}，"
+                  f"预筛通过 {r['prescreen_passed']:.0f}，回放通过 {r['replay_success']:.0f}，最低造价 {best}")
+    else:
+        if args.action == "query":
+            rows = index.query(level_id=args.level, model=args.model, prompt_hash=args.prompt,
+                               valid=True if args.passed else None, prescreen_passed=True if args.passed else None,
+                               order_by=args.order_by, limit=args.limit)
+        else:
+            rows = index.top_k(args.k, level_id=args.level, by=args.by)
+        if args.json:
+            for r in rows:
+                print(json.dumps(r, ensure_ascii=False))
+        else:
+            print_rows(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
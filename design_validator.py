@@ -0,0 +1,112 @@
+import numpy as np
+
+from bridge_design import MISSING_ID, BridgeDesign
+from materials import MATERIALS, NODE_TYPE
+
+# ================= 向量化设计校验 =================
+# 基于 BridgeDesign 的节点表 / 杆件表 (numpy 数组)，所有规则整体比对，
+# 不在第一个错误处停下，而是把全部违规项收集成结构化列表返回，方便一次性修复。
+
+MIDPOINT_TOLERANCE = 0.001
+MIN_LENGTH = 1e-6
+LENGTH_TOLERANCE = 1e-6
+
+# 材料类型 -> 最大长度 查找表 (不限长或未知类型为 inf)
+_MAX_LENGTH = np.full(max(MATERIALS) + 1, np.inf)
+for _type, _mat in MATERIALS.items():
+    if _mat["max_length"] is not None:
+        _MAX_LENGTH[_type] = _mat["max_length"]
+
+
+def _violation(code, obj_id, message, **detail):
+    return {"code": code, "id": obj_id, "message": message, **detail}
+
+
+def collect_violations(design_data):
+    """
+    一次性检查设计中的全部违规项，返回列表 (为空表示通过)。
+    每项形如 {"code": ..., "id": 物体 id, "message": 中文说明, ...附加字段}。
+    design_data 可以是 BridgeDesign，也可以是存档格式的 dict。
+
+    检查项：missing_field / duplicate_id / type0_edge / unknown_material / dangling_anchor /
+           midpoint_mismatch / zero_length / over_length
+    """
+    if design_data is None or (isinstance(design_data, dict) and "Objects" not in design_data):
+        return [_violation("missing_objects", None, "缺少 'Objects' 数组。")]
+    design = BridgeDesign.coerce(design_data)
+    if design.n_nodes + design.n_edges == 0:
+        return [_violation("missing_objects", None, "'Objects' 数组为空。")]
+
+    violations = []
+
+    # ---------- 缺失字段 (from_objects 不再补 0) ----------
+    for kind, ids, columns in (
+            ("节点", design.node_ids, {"id": design.node_ids == MISSING_ID, "x": np.isnan(design.node_xy[:, 0]),
+                                     "y": np.isnan(design.node_xy[:, 1])}),
+            ("杆件", design.edge_ids, {"id": design.edge_ids == MISSING_ID, "x": np.isnan(design.edge_xy[:, 0]),
+                                     "y": np.isnan(design.edge_xy[:, 1]),
+                                     "anchorAID": design.edge_anchor_ids[:, 0] == MISSING_ID,
+                                     "anchorBID": design.edge_anchor_ids[:, 1] == MISSING_ID})):
+        flags = np.column_stack(list(columns.values())) if len(ids) else np.zeros((0, len(columns)), dtype=bool)
+        for i in np.flatnonzero(flags.any(axis=1)):
+            fields = [name for name, flag in zip(columns, flags[i]) if flag]
+            obj_id = None if ids[i] == MISSING_ID else int(ids[i])
+            violations.append(_violation("missing_field", obj_id,
+                                         f"{kind} {'(无 id)' if obj_id is None else f'ID {obj_id}'} 缺少字段 {', '.join(fields)}。",
+                                         fields=fields))
+    missing = np.any(design.edge_anchor_ids == MISSING_ID, axis=1)
+
+    # ---------- 重复 id ----------
+    all_ids = np.concatenate([design.node_ids, design.edge_ids])
+    unique_ids, counts = np.unique(all_ids[all_ids != MISSING_ID], return_counts=True)
+    for dup_id, count in zip(unique_ids[counts > 1], counts[counts > 1]):
+        violations.append(_violation("duplicate_id", int(dup_id), f"id {dup_id} 重复出现 {count} 次。", count=int(count)))
+
+    # ---------- 杆件类型 ----------
+    edge_ids, edge_types = design.edge_ids, design.edge_type
+    for obj_id in edge_ids[edge_types == NODE_TYPE]:
+        violations.append(_violation("type0_edge", int(obj_id), f"物体 ID {obj_id} 带有锚点却使用了 type 0 (节点专用类型)。"))
+
+    unknown = (edge_types != NODE_TYPE) & ~np.isin(edge_types, list(MATERIALS))
+    for obj_id, edge_type in zip(edge_ids[unknown], edge_types[unknown]):
+        violations.append(_violation("unknown_material", int(obj_id), f"物体 ID {obj_id} 使用了未知材料类型 {edge_type}。", type=int(edge_type)))
+
+    # ---------- 锚点存在性 ----------
+    ok = design.resolved()
+    anchors = design.edge_anchor_ids
+    for obj_id, (aid, bid) in zip(edge_ids[~ok & ~missing], anchors[~ok & ~missing]):
+        violations.append(_violation("dangling_anchor", int(obj_id), f"物体 ID {obj_id} 引用了不存在的锚点 ({aid} 或 {bid})。",
+                                     anchorAID=int(aid), anchorBID=int(bid)))
+
+    # ---------- 几何检查 (仅针对锚点都存在的杆件) ----------
+    if np.any(ok):
+        ok_ids, ok_types = edge_ids[ok], edge_types[ok]
+        expected = design.midpoints()[ok]
+        actual = design.edge_xy[ok]
+        bad_mid = np.any(np.abs(expected - actual) > MIDPOINT_TOLERANCE, axis=1)
+        for i in np.flatnonzero(bad_mid):
+            violations.append(_violation(
+                "midpoint_mismatch", int(ok_ids[i]),
+                f"物体 ID {ok_ids[i]} 坐标计算错误！模型:({actual[i, 0]}, {actual[i, 1]}), 正确:({expected[i, 0]}, {expected[i, 1]})",
+                expected=tuple(expected[i].tolist()), actual=tuple(actual[i].tolist())))
+
+        length = design.edge_lengths()[ok]
+        for i in np.flatnonzero(length < MIN_LENGTH):
+            violations.append(_violation("zero_length", int(ok_ids[i]), f"物体 ID {ok_ids[i]} 两端锚点重合，长度为 0。"))
+
+        in_table = (ok_types >= 0) & (ok_types < len(_MAX_LENGTH))
+        max_length = np.where(in_table, _MAX_LENGTH[np.where(in_table, ok_types, 0)], np.inf)
+        for i in np.flatnonzero(length > max_length + LENGTH_TOLERANCE):
+            name = MATERIALS[int(ok_types[i])]["name"]
+            violations.append(_violation(
+                "over_length", int(ok_ids[i]),
+                f"物体 ID {ok_ids[i]} ({name}) 长度 {length[i]:.2f}m 超过上限 {max_length[i]:.0f}m。",
+                length=float(length[i]), max_length=float(max_length[i])))
+
+    return violations
+
+
+def print_violations(violations):
+    """按现有日志风格逐条打印违规项"""
+    for v in violations:
+        print(f"❌ 校验失败：{v['message']}")
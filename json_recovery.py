@@ -0,0 +1,251 @@
+import json
+import re
+
+from stream_parser import IncrementalTopologyParser
+
+# ================= 容错 JSON 恢复 =================
+# 大模型的回答被截断、夹带前后说明文字或有个别语法小错时，不直接丢弃整次昂贵的调用：
+# 先做常见修复 (代码块标记、注释、尾逗号、缺逗号、Python 字面量、未闭合的括号)，
+# 仍不行再用增量解析器把所有完整的 nodes / edges 元素抢救出来。每一步修复都记录在 repairs 里。
+
+MAX_TRUNCATION_ATTEMPTS = 200
+NODE_KEYS = ("id", "x", "y")
+EDGE_KEYS = ("id", "type", "anchorAID", "anchorBID")
+# 游戏存档 Objects 格式：节点 (type 0) 与杆件共用一个数组
+OBJECT_NODE_KEYS = ("type", "id", "x", "y")
+OBJECT_EDGE_KEYS = EDGE_KEYS
+
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _segments(text):
+    """按字符串边界切分，返回 [(是否为字符串, 片段)]；未闭合的字符串一直延伸到末尾"""
+    segments = []
+    i, start, n = 0, 0, len(text)
+    while i < n:
+        if text[i] == '"':
+            if i > start:
+                segments.append((False, text[start:i]))
+            j = i + 1
+            while j < n and text[j] != '"':
+                j += 2 if text[j] == '\\' else 1
+            segments.append((True, text[i:j + 1]))
+            i = start = j + 1
+        else:
+            i += 1
+    if start < n:
+        segments.append((False, text[start:]))
+    return segments
+
+
+def _map_outside_strings(text, fn):
+    return "".join(seg if is_str else fn(seg) for is_str, seg in _segments(text))
+
+
+def _strip_comments(text):
+    """去掉字符串之外的 // 行注释与 /* */ 块注释"""
+    out, i, n = [], 0, len(text)
+    in_string = escape = False
+    while i < n:
+        c = text[i]
+        if in_string:
+            out.append(c)
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_string = False
+            i += 1
+        elif c == '"':
+            in_string = True
+            out.append(c)
+            i += 1
+        elif text.startswith('//', i):
+            i = text.find('\n', i)
+            i = n if i < 0 else i
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out)
+
+
+def _scan(text):
+    """扫描结构字符，返回 (括号栈, 是否停在字符串内, 最外层对象闭合处下标或 None, 可截断位置列表)"""
+    stack, cut_points = [], []
+    in_string = escape = False
+    for i, c in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in '{[':
+            stack.append(c)
+            cut_points.append(i + 1)
+        elif c in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                return stack, False, i, cut_points
+            cut_points.append(i + 1)
+        elif c == ',':
+            cut_points.append(i)
+    return stack, in_string, None, cut_points
+
+
+def _close_truncated(prefix):
+    """把被截断的前缀补全：去掉结尾的逗号 / 冒号 / 半截字面量，再按栈补上括号"""
+    stack, in_string, _, _ = _scan(prefix)
+    if in_string:
+        prefix += '"'
+    prefix = prefix.rstrip()
+    while prefix and prefix[-1] in ',:':
+        prefix = prefix[:-1].rstrip()
+    closers = "".join('}' if c == '{' else ']' for c in reversed(stack))
+    return prefix + closers
+
+
+def recover_json(text):
+    """
+    尽力从模型回答中恢复出一个 JSON 对象，返回 (对象或 None, repairs)。
+    repairs 是按顺序记录的修复项列表，为空表示原文里就有合法的 JSON 对象。
+    """
+    repairs = []
+    if not text:
+        return None, ["empty_response"]
+
+    if '```' in text:
+        text = re.sub(r'```[a-zA-Z]*', '', text)
+        repairs.append("code_fence")
+
+    start = text.find('{')
+    if start < 0:
+        return None, repairs + ["no_object"]
+    if text[:start].strip():
+        repairs.append("leading_text")
+    text = text[start:]
+
+    stripped = _strip_comments(text)
+    if stripped != text:
+        repairs.append("comments")
+        text = stripped
+
+    _, _, end, _ = _scan(text)
+    truncated = end is None
+    if not truncated:
+        if text[end + 1:].strip():
+            repairs.append("trailing_text")
+        text = text[:end + 1]
+
+    fixed = _map_outside_strings(text, lambda seg: re.sub(r'\b(True|False|None)\b', lambda m: _PY_LITERALS[m.group(1)], seg))
+    if fixed != text:
+        repairs.append("python_literals")
+        text = fixed
+
+    fixed = _map_outside_strings(text, lambda seg: re.sub(r'([}\]])(\s*)(?=[{\["])', r'\1,\2', seg))
+    if fixed != text:
+        repairs.append("missing_commas")
+        text = fixed
+
+    fixed = _map_outside_strings(text, lambda seg: re.sub(r',(\s*[}\]])', r'\1', seg))
+    if fixed != text:
+        repairs.append("trailing_commas")
+        text = fixed
+
+    if not truncated:
+        try:
+            return json.loads(text), repairs
+        except json.JSONDecodeError:
+            pass
+
+    # 截断 (或仍有语法错误)：从尾部逐个可截断位置往回退，补齐括号后重试。
+    # 截断时不尝试原样补全，因为末尾的数字可能只写了一半 (例如 12 被截成 1)，只在逗号 / 括号处截断
+    _, _, _, cut_points = _scan(text)
+    candidates = sorted(set(cut_points), reverse=True)
+    if not truncated:
+        candidates.insert(0, len(text))
+    for cut in candidates[:MAX_TRUNCATION_ATTEMPTS]:
+        candidate = _map_outside_strings(_close_truncated(text[:cut]), lambda seg: re.sub(r',(\s*[}\]])', r'\1', seg))
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        repairs.append("truncated_closed" if truncated else "cut_invalid_tail")
+        return data, repairs
+    return None, repairs + ["unrecoverable"]
+
+
+def recover_topology(text):
+    """
+    针对 {"thought_process", "nodes", "edges"} 负载的恢复：
+    先走 recover_json；若结果里缺少 nodes / edges 列表，再用增量解析器抢救所有完整的元素。
+    返回 (含 nodes / edges 的 dict 或 None, repairs)
+    """
+    data, repairs = recover_json(text)
+    if isinstance(data, dict) and isinstance(data.get("nodes"), list) and isinstance(data.get("edges"), list):
+        # 补齐括号时可能把半截的元素也闭合成了对象，缺字段的一律丢弃
+        nodes = [n for n in data["nodes"] if isinstance(n, dict) and all(k in n for k in NODE_KEYS)]
+        edges = [e for e in data["edges"] if isinstance(e, dict) and all(k in e for k in EDGE_KEYS)]
+        dropped = len(data["nodes"]) + len(data["edges"]) - len(nodes) - len(edges)
+        if dropped:
+            data = dict(data, nodes=nodes, edges=edges)
+            repairs = repairs + [f"dropped_incomplete({dropped})"]
+        return data, repairs
+
+    parser = IncrementalTopologyParser()
+    events = parser.feed(text or "")
+    nodes = [item for kind, item in events if kind == "node"]
+    edges = [item for kind, item in events if kind == "edge"]
+    if not nodes:
+        return None, repairs
+    salvaged = dict(data) if isinstance(data, dict) else {}
+    salvaged["nodes"], salvaged["edges"] = nodes, edges
+    return salvaged, repairs + [f"salvaged_items(nodes={len(nodes)}, edges={len(edges)})"]
+
+
+def _complete_object(obj):
+    if not isinstance(obj, dict) or "type" not in obj:
+        return False
+    is_edge = obj["type"] != 0 or obj.get("anchorAID") or obj.get("anchorBID")
+    return all(k in obj for k in (OBJECT_EDGE_KEYS if is_edge else OBJECT_NODE_KEYS))
+
+
+def recover_objects(text):
+    """
+    针对游戏存档 {"DisplayName", "Objects"} 负载的恢复：先走 recover_json，
+    再与 recover_topology 一样丢弃补括号时被闭合成对象的半截元素 (节点要有 type/id/x/y，杆件要有 id/type/锚点)，
+    避免 {"type":0,"x":5 这类残片变成 id 0 的幽灵节点。返回 (含 Objects 的 dict 或 None, repairs)
+    """
+    data, repairs = recover_json(text)
+    if not isinstance(data, dict) or not isinstance(data.get("Objects"), list):
+        return data, repairs
+    objects = [obj for obj in data["Objects"] if _complete_object(obj)]
+    dropped = len(data["Objects"]) - len(objects)
+    if dropped:
+        data = dict(data, Objects=objects)
+        repairs = repairs + [f"dropped_incomplete({dropped})"]
+    return data, repairs
+
+
+def describe_repairs(repairs):
+    """把修复项翻译成日志里可读的中文说明"""
+    names = {
+        "code_fence": "去掉 ``` 代码块标记",
+        "leading_text": "去掉 JSON 之前的说明文字",
+        "trailing_text": "去掉 JSON 之后的多余文字",
+        "comments": "去掉注释",
+        "python_literals": "True/False/None 转为 JSON 字面量",
+        "missing_commas": "补上缺失的逗号",
+        "trailing_commas": "删除尾逗号",
+        "truncated_closed": "补齐被截断的括号",
+        "cut_invalid_tail": "截掉无法解析的尾部",
+    }
+    return "，".join(names.get(r, r) for r in repairs)
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# ================= 大模型响应的内容寻址磁盘缓存 =================
+# key = sha256(规范化后的请求参数：model、messages (含截图 base64)、temperature、response_format 等)，
+# 同一关卡、同一截图、同一 prompt 和模型重复运行时直接返回上次的回答。
+# 目录按 key 前两位分片，总大小超过上限时按最近访问时间 (LRU) 淘汰。
+# replay 模式只读缓存、从不联网，未命中直接抛 CacheMissError，用于离线回归和基准测试。
+
+DEFAULT_CACHE_DIR = ".llm_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class CacheMissError(RuntimeError):
+    """replay 模式下请求不在缓存中"""
+
+
+def request_key(request_params, sample=None):
+    """
+    对请求参数做规范化 JSON 序列化后取 sha256；鉴权相关的 extra_headers 不参与计算。
+    sample 区分同一请求的多次独立采样 (temperature > 0 的并发候选)，为 None 时与单次请求的 key 相同
+    """
+    payload = {k: v for k, v in request_params.items() if k not in ("extra_headers", "stream")}
+    if sample is not None:
+        payload["_sample"] = sample
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, replay=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> 文件大小，按最近访问从旧到新排列
+        self._total_bytes = 0
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        """启动时扫描一次缓存目录，按文件 mtime (即最近访问时间) 重建 LRU 顺序"""
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for shard in os.scandir(self.cache_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+    def get(self, key):
+        """命中返回缓存的回答文本，未命中返回 None (replay 模式下抛 CacheMissError)"""
+        path = self._path(key)
+        with self._lock:
+            if key in self._index:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        record = json.load(f)
+                    os.utime(path)  # 刷新 mtime，作为下次启动时的 LRU 顺序
+                except (OSError, ValueError):
+                    self._forget(key)
+                else:
+                    self._index.move_to_end(key)
+                    self.hits += 1
+                    return record["content"]
+            self.misses += 1
+        if self.replay:
+            raise CacheMissError(f"replay 模式下缓存未命中: {key}")
+        return None
+
+    def put(self, key, content, model=None):
+        """写入一条回答 (原子替换)，并在超出容量时淘汰最久未访问的条目"""
+        if self.replay or not isinstance(content, str):
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"key": key, "model": model, "created": time.time(), "content": content}, ensure_ascii=False)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            self._total_bytes -= self._index.pop(key, 0)
+            self._index[key] = size
+            self._total_bytes += size
+            self.stores += 1
+            while self._total_bytes > self.max_bytes and len(self._index) > 1:
+                old_key = next(iter(self._index))
+                self._forget(old_key)
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+                self.evictions += 1
+
+    def _forget(self, key):
+        self._total_bytes -= self._index.pop(key, 0)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": len(self._index),
+            "bytes": self._total_bytes,
+        }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """
+    按环境变量开启进程级共享缓存：LLM_CACHE_DIR 设置时启用，LLM_CACHE_MAX_MB 控制容量，
+    LLM_CACHE_REPLAY=1 进入只读回放模式。未设置 LLM_CACHE_DIR 时返回 None (不缓存)。
+    """
+    global _default_cache
+    cache_dir = os.getenv("LLM_CACHE_DIR")
+    if not cache_dir:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            max_mb = float(os.getenv("LLM_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 1024 / 1024))
+            replay = os.getenv("LLM_CACHE_REPLAY", "0") == "1"
+            _default_cache = ResponseCache(cache_dir, max_bytes=int(max_mb * 1024 * 1024), replay=replay)
+        return _default_cache
@@ -1,60 +1,328 @@
+import asyncio
+import threading
+import httpx
 import openai
-import tiktoken
 import time
 import os
-from typing import Dict, List, Optional
-from tenacity import retry, wait_random_exponential, stop_after_attempt
+from typing import Dict, Iterator, List, Optional
+from tenacity import AsyncRetrying, Retrying, retry_if_not_exception_type, wait_random_exponential, stop_after_attempt
+
+from llm_cache import CacheMissError, ResponseCache, default_cache, request_key
+from llm_metrics import MetricsLogger, count_text_tokens, default_logger, estimate_prompt_tokens
+
+# ================= 连接池配置 (可用环境变量调整) =================
+DEFAULT_BASE_URL = 'http://openai.infly.tech/v1/'
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+
+# replay 模式下的缓存未命中不是网络故障，不应重试
+RETRY_POLICY = dict(
+    wait=wait_random_exponential(min=1, max=60),
+    stop=stop_after_attempt(6),
+    retry=retry_if_not_exception_type(CacheMissError),
+)
 
 
 class LLMHandler_inf:
-    def __init__(self, api_key: str, model: str = "gpt-4o"):
+    """
+    每个实例持有自己的同步 / 异步 OpenAI 客户端 (带连接池与 keep-alive)，不再改动 openai 模块的全局配置，
+    因此同一进程里可以同时连多个网关。同步客户端可跨线程共享；异步客户端按事件循环各建一个，可跨 task 共享。
+    重试统一交给 tenacity，SDK 自带的重试关闭 (max_retries=0)，避免两层重试叠加。
+    cache 为 None 时使用 llm_cache.default_cache() (由 LLM_CACHE_DIR 等环境变量控制是否启用)。
+    metrics 为 None 时使用 llm_metrics.default_logger()，每次调用向 JSONL 指标文件追加一条记录。
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gpt-4o",
+        base_url: Optional[str] = None,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+        timeout: float = REQUEST_TIMEOUT,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        cache: Optional[ResponseCache] = None,
+        metrics: Optional[MetricsLogger] = None,
+    ):
         self.model = model
-        openai.base_url = os.getenv("OPENAI_BASE_URL", 'http://openai.infly.tech/v1/')
-        openai.api_key = 'no-modify'  # 不是改这个值，改下面的
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL", DEFAULT_BASE_URL)
         self.api_key = api_key
         self.extra = {}
+        self.cache = cache if cache is not None else default_cache()
+        self.metrics = metrics if metrics is not None else default_logger()
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._client = openai.OpenAI(
+            base_url=self.base_url,
+            api_key='no-modify',  # 不是改这个值，真正的 key 通过 apikey 请求头传递
+            max_retries=0,
+            http_client=httpx.Client(limits=self._limits, timeout=self._timeout),
+        )
+        self._async_clients = {}
+        self._lock = threading.Lock()
+
+    def _get_async_client(self):
+        """返回当前事件循环对应的异步客户端 (httpx.AsyncClient 不能跨事件循环复用)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                # 清理已关闭事件循环遗留的客户端
+                self._async_clients = {l: c for l, c in self._async_clients.items() if not l.is_closed()}
+                client = openai.AsyncOpenAI(
+                    base_url=self.base_url,
+                    api_key='no-modify',
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=self._limits, timeout=self._timeout),
+                )
+                self._async_clients[loop] = client
+            return client
+
+    def close(self):
+        """关闭同步客户端的连接池"""
+        self._client.close()
+
+    async def aclose(self):
+        """关闭当前事件循环上的异步客户端"""
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    def _build_request_params(self, messages, temperature, max_tokens, response_format, model, kwargs):
+        """构建请求参数 (同步 / 异步调用共用)"""
+        request_params = {
+            "model": model or self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "extra_body": self.extra,
+            "extra_headers": {'apikey': self.api_key},
+            "stream": False,
+        }
+
+        # 添加可选参数
+        if max_tokens is not None:
+            request_params["max_tokens"] = max_tokens
+        if response_format is not None:
+            request_params["response_format"] = response_format
+
+        # 添加其他额外参数
+        request_params.update(kwargs)
+        return request_params
+
+    def _cache_lookup(self, request_params, sample=None):
+        """
+        返回 (缓存 key, 命中的回答)；未启用缓存时 key 为 None。
+        sample 为同一请求的第几次采样 (多候选并发时传候选序号)，计入 key，避免 N 个候选共用同一条缓存
+        """
+        if self.cache is None:
+            return None, None
+        key = request_key(request_params, sample)
+        return key, self.cache.get(key)
+
+    def _cache_store(self, key, request_params, result):
+        if key is not None:
+            self.cache.put(key, result, model=request_params["model"])
+
+    def _start_record(self, request_params, mode):
+        """发送前记录模型名与估算的 prompt / 图片 token"""
+        text_tokens, image_tokens = estimate_prompt_tokens(request_params["messages"])
+        return {
+            "event": "call",
+            "mode": mode,
+            "model": request_params["model"],
+            "estimated_prompt_tokens": text_tokens,
+            "estimated_image_tokens": image_tokens,
+            "retries": 0,
+            "started": time.perf_counter(),
+        }
+
+    def _finish_record(self, record, response=None, ok=True, error=None, cached=False, attempt_started=None, **extra):
+        """补上耗时与实际 usage 后写入指标文件"""
+        now = time.perf_counter()
+        started = record.pop("started")
+        record.update(ok=ok, cached=cached, latency=now - started, **extra)
+        if attempt_started is not None:
+            record["attempt_latency"] = now - attempt_started
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+            record["completion_tokens"] = getattr(usage, "completion_tokens", None)
+            details = getattr(usage, "prompt_tokens_details", None)
+            if details is not None and getattr(details, "cached_tokens", None) is not None:
+                record["cached_prompt_tokens"] = details.cached_tokens
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        try:
+            self.metrics.log(record)
+        except OSError as e:
+            print(f"⚠️ 写入调用指标失败: {e}")
+
+    @staticmethod
+    def _unwrap_message(response):
+        message = response.choices[0].message
+
+        # 如果使用了 tools，检查是否有 tool_calls
+        if hasattr(message, 'tool_calls') and message.tool_calls:
+            return message  # 返回完整的 message 对象以便处理 tool_calls
+
+        return message.content
 
-    @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
     def get_completion(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         response_format: Optional[Dict] = None,
+        model: Optional[str] = None,
+        cache_sample: Optional[int] = None,
+        **kwargs
+    ) -> str:
+        request_params = self._build_request_params(messages, temperature, max_tokens, response_format, model, kwargs)
+        record = self._start_record(request_params, "sync")
+        cache_key, cached = self._cache_lookup(request_params, cache_sample)
+        if cached is not None:
+            self._finish_record(record, cached=True)
+            return cached
+
+        attempt_started = None
+        try:
+            for attempt in Retrying(**RETRY_POLICY):
+                with attempt:
+                    record["retries"] = attempt.retry_state.attempt_number - 1
+                    attempt_started = time.perf_counter()
+                    try:
+                        response = self._client.chat.completions.create(**request_params)
+                    except Exception as e:
+                        print(f"调用API时发生错误: {str(e)}")
+                        raise
+        except Exception as e:
+            self._finish_record(record, ok=False, error=e, attempt_started=attempt_started)
+            raise
+
+        self._finish_record(record, response=response, attempt_started=attempt_started)
+        result = self._unwrap_message(response)
+        self._cache_store(cache_key, request_params, result)
+        return result
+
+    async def aget_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict] = None,
+        model: Optional[str] = None,
+        cache_sample: Optional[int] = None,
         **kwargs
     ) -> str:
+        """get_completion 的异步版本，可在同一事件循环里并发发起多个候选请求"""
+        request_params = self._build_request_params(messages, temperature, max_tokens, response_format, model, kwargs)
+        record = self._start_record(request_params, "async")
+        cache_key, cached = self._cache_lookup(request_params, cache_sample)
+        if cached is not None:
+            self._finish_record(record, cached=True)
+            return cached
 
+        attempt_started = None
         try:
-            # 构建请求参数
-            request_params = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature,
-                "extra_body": self.extra,
-                "extra_headers": {'apikey': self.api_key},
-                "stream": False,
-            }
-            
-            # 添加可选参数
-            if max_tokens is not None:
-                request_params["max_tokens"] = max_tokens
-            if response_format is not None:
-                request_params["response_format"] = response_format
-            
-            # 添加其他额外参数
-            request_params.update(kwargs)
-            
-            response = openai.chat.completions.create(**request_params)
-            message = response.choices[0].message
-
-            # 如果使用了 tools，检查是否有 tool_calls
-            if hasattr(message, 'tool_calls') and message.tool_calls:
-                return message  # 返回完整的 message 对象以便处理 tool_calls
-
-            return message.content
+            async for attempt in AsyncRetrying(**RETRY_POLICY):
+                with attempt:
+                    record["retries"] = attempt.retry_state.attempt_number - 1
+                    attempt_started = time.perf_counter()
+                    try:
+                        response = await self._get_async_client().chat.completions.create(**request_params)
+                    except Exception as e:
+                        print(f"调用API时发生错误: {str(e)}")
+                        raise
+        except BaseException as e:
+            # 候选被取消 (asyncio.CancelledError) 同样记录下来，便于统计浪费的请求
+            self._finish_record(record, ok=False, error=e, attempt_started=attempt_started)
+            raise
+
+        self._finish_record(record, response=response, attempt_started=attempt_started)
+        result = self._unwrap_message(response)
+        self._cache_store(cache_key, request_params, result)
+        return result
+
+    def iter_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict] = None,
+        model: Optional[str] = None,
+        cache_sample: Optional[int] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        流式版本：逐段 yield 模型输出的文本增量。
+        调用方中途停止迭代 (break / close) 时会立即关闭底层 HTTP 流，服务端随之停止生成。
+        流式调用不走 tenacity 重试；完整读完的回答同样写入缓存，缓存命中时一次性 yield 全文。
+        指标里额外记录 time_to_first_token；服务端不返回 usage 时 completion_tokens 按已收到的文本估算。
+        """
+        request_params = self._build_request_params(messages, temperature, max_tokens, response_format, model, kwargs)
+        record = self._start_record(request_params, "stream")
+        cache_key, cached = self._cache_lookup(request_params, cache_sample)
+        if cached is not None:
+            self._finish_record(record, cached=True)
+            yield cached
+            return
+
+        request_params["stream"] = True
+        attempt_started = time.perf_counter()
+        try:
+            stream = self._client.chat.completions.create(**request_params)
         except Exception as e:
-            print(f"调用API时发生错误: {str(e)}")
-            raise e
+            self._finish_record(record, ok=False, error=e, attempt_started=attempt_started)
+            raise
+        parts = []
+        completed = False
+        first_token = None
+        usage_chunk = None
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage_chunk = chunk
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token is None:
+                        first_token = time.perf_counter() - record["started"]
+                    parts.append(delta)
+                    yield delta
+            completed = True
+        finally:
+            stream.close()
+            text = "".join(parts)
+            estimated = {} if usage_chunk is not None else {"completion_tokens": count_text_tokens(text)}
+            self._finish_record(record, response=usage_chunk, completed=completed, attempt_started=attempt_started,
+                                time_to_first_token=first_token, **estimated)
+            if completed:
+                self._cache_store(cache_key, request_params, text)
+
+_shared_handlers = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_handler(api_key: str, model: str = "gpt-4o", base_url: Optional[str] = None) -> LLMHandler_inf:
+    """按 (api_key, model, base_url) 复用同一个 handler，使连接池在多次调用之间保持复用"""
+    key = (api_key, model, base_url or os.getenv("OPENAI_BASE_URL", DEFAULT_BASE_URL))
+    with _shared_lock:
+        handler = _shared_handlers.get(key)
+        if handler is None:
+            handler = LLMHandler_inf(api_key, model=model, base_url=key[2])
+            _shared_handlers[key] = handler
+        return handler
+
 
 if __name__ == '__main__':
     handler = LLMHandler_inf(os.getenv("OPENAI_API_KEY"))
@@ -0,0 +1,180 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+# ================= 大模型调用的 token 与耗时统计 =================
+# 每次调用追加一行 JSON 到指标文件 (append-only)：发送前估算的 prompt / 图片 token、
+# 响应里的实际 usage、总耗时与最后一次请求耗时 (两者之差即排队 / 重试退避的时间)、重试次数与模型名。
+# main 流程结束时再追加一行 outcome 记录 (关卡是否解出)，summarize() 据此统计 p50/p95/p99 与每关 token。
+
+DEFAULT_METRICS_FILE = "llm_metrics.jsonl"
+IMAGE_TOKEN_ESTIMATE = int(os.getenv("LLM_IMAGE_TOKENS", "1100"))   # 单张图片按固定 token 数估算
+
+_run_context = contextvars.ContextVar("llm_run_context", default={})
+_encoding = None
+
+
+def _get_encoding():
+    """延迟加载 tiktoken 编码表；离线环境取不到时退化为按字符数估算"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding
+
+
+def count_text_tokens(text):
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def estimate_prompt_tokens(messages):
+    """估算一组 chat messages 的输入 token，返回 (文本 token, 图片 token)"""
+    text_tokens, image_tokens = 0, 0
+    for message in messages:
+        text_tokens += 4  # 每条消息的角色与分隔符开销
+        content = message["content"]
+        if isinstance(content, str):
+            text_tokens += count_text_tokens(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                text_tokens += count_text_tokens(part["text"])
+            elif part.get("type") == "image_url":
+                image_tokens += IMAGE_TOKEN_ESTIMATE
+    return text_tokens, image_tokens
+
+
+def estimate_message_tokens(messages):
+    """文本 + 图片的输入 token 估算总数"""
+    return sum(estimate_prompt_tokens(messages))
+
+
+def set_run_context(**fields):
+    """设置当前运行的上下文 (如 run_id、level)，之后的调用记录都会带上；asyncio task 会继承"""
+    _run_context.set(dict(fields))
+
+
+def get_run_context():
+    return _run_context.get()
+
+
+class MetricsLogger:
+    """线程安全地向 JSONL 文件追加记录；path 为空时不记录"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def log(self, record):
+        if not self.path:
+            return
+        record = {"ts": time.time(), **get_run_context(), **record}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+
+_default_logger = None
+
+
+def default_logger():
+    """进程级共享的记录器，路径由 LLM_METRICS_FILE 控制 (设为空字符串即关闭)"""
+    global _default_logger
+    if _default_logger is None:
+        _default_logger = MetricsLogger(os.getenv("LLM_METRICS_FILE", DEFAULT_METRICS_FILE))
+    return _default_logger
+
+
+def log_outcome(solved, **fields):
+    """记录一次关卡求解的结果，用于统计每个解出关卡消耗的 token"""
+    default_logger().log({"event": "outcome", "solved": bool(solved), **fields})
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    import numpy as np
+    p50, p95, p99 = np.percentile(np.asarray(values, dtype=float), [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "n": len(values)}
+
+
+def load_records(path=None):
+    path = path or os.getenv("LLM_METRICS_FILE", DEFAULT_METRICS_FILE)
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # 进程被杀时可能留下半行
+    return records
+
+
+def summarize(records):
+    """
+    汇总调用记录：延迟与 token 的 p50/p95/p99、按模型分组的调用数与 token，
+    以及 tokens_per_solved_level = 所有运行的 token 总数 / 解出的关卡数。
+    """
+    calls = [r for r in records if r.get("event") == "call"]
+    outcomes = [r for r in records if r.get("event") == "outcome"]
+    live = [r for r in calls if not r.get("cached")]
+
+    def total_tokens(r):
+        if r.get("prompt_tokens") is not None:
+            return r["prompt_tokens"] + (r.get("completion_tokens") or 0)
+        return r.get("estimated_prompt_tokens", 0) + r.get("estimated_image_tokens", 0)
+
+    by_model = {}
+    for r in calls:
+        stats = by_model.setdefault(r.get("model"), {"calls": 0, "errors": 0, "retries": 0, "tokens": 0})
+        stats["calls"] += 1
+        stats["errors"] += 0 if r.get("ok", True) else 1
+        stats["retries"] += r.get("retries", 0)
+        stats["tokens"] += total_tokens(r)
+
+    solved = sum(1 for r in outcomes if r.get("solved"))
+    all_tokens = sum(total_tokens(r) for r in calls)
+    return {
+        "calls": len(calls),
+        "cache_hits": len(calls) - len(live),
+        "latency": _percentiles([r["latency"] for r in live if "latency" in r]),
+        "queue_time": _percentiles([r["latency"] - r["attempt_latency"] for r in live if "attempt_latency" in r]),
+        "prompt_tokens": _percentiles([r["prompt_tokens"] for r in live if r.get("prompt_tokens") is not None]),
+        "completion_tokens": _percentiles([r["completion_tokens"] for r in live if r.get("completion_tokens") is not None]),
+        "by_model": by_model,
+        "levels": len(outcomes),
+        "solved_levels": solved,
+        "tokens_per_solved_level": all_tokens / solved if solved else None,
+    }
+
+
+def print_summary(summary):
+    print(f"📊 共 {summary['calls']} 次调用 (缓存命中 {summary['cache_hits']})，"
+          f"{summary['levels']} 关中解出 {summary['solved_levels']} 关")
+    for name in ("latency", "queue_time", "prompt_tokens", "completion_tokens"):
+        stats = summary[name]
+        if stats:
+            print(f"   {name:18s} p50={stats['p50']:.2f} p95={stats['p95']:.2f} p99={stats['p99']:.2f} (n={stats['n']})")
+    for model, stats in summary["by_model"].items():
+        print(f"   [{model}] 调用 {stats['calls']} 次，失败 {stats['errors']}，重试 {stats['retries']}，token {stats['tokens']}")
+    if summary["tokens_per_solved_level"] is not None:
+        print(f"   每个解出关卡平均消耗 {summary['tokens_per_solved_level']:.0f} tokens")
+
+
+if __name__ == "__main__":
+    import sys
+    print_summary(summarize(load_records(sys.argv[1] if len(sys.argv) > 1 else None)))
@@ -1,40 +1,38 @@
-import json
-import time
-import base64
-import pyautogui
 import os
 from datetime import datetime
-from io import BytesIO
-from pathlib import Path
-from PIL import Image
-
-# 引入你提供的自定义 LLM Handler
-from llm_inf import LLMHandler_inf
-# 引入 encode.py 的加密函数
-from tool.encode import encode_save
-# 引入路径配置
-import paths
-# 引入自动加载存档模块
-from tool import auto_load_savefiles
+
+# 引入 .env 加载与内置默认关卡
+from config import load_env
+
+# 引入单次序列化的存档写出流水线
+from save_pipeline import write_design_files
+# 引入截图裁剪 / 缩放 / 单次编码模块
+from tool import cut_pic
+# 引入离线静力预筛
+from truss_solver import prescreen_design
+# 引入向量化设计校验
+from design_validator import collect_violations, print_violations
+# 引入紧凑的桥梁设计模型
+from bridge_design import BridgeDesign
+# 引入容错 JSON 恢复
+from json_recovery import recover_objects, describe_repairs
+# 引入稳定前缀的 prompt 组装
+from prompt_builder import PromptBuilder
+# 引入调用指标记录
+import llm_metrics
+# 引入 gen/ 归档索引
+import design_index
 
 # ================= 加载环境变量 =================
-def load_env(env_file: str = ".env"):
-    """从 .env 文件加载环境变量"""
-    env_path = Path(env_file)
-    if env_path.exists():
-        with open(env_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
-
-load_env()
+# 下面的配置项在导入时读取环境变量：直接运行本脚本时先加载 .env；被 cli.py 导入时由 cli.main 负责加载
+if __name__ == "__main__":
+    load_env()
 
 # ================= 配置区域 =================
 API_KEY = os.getenv("API_KEY", "")
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-5.2")
 SCREENSHOT_PATH = "current_level.png"
+SCREENSHOT_MIME = cut_pic.MIME_TYPES[cut_pic.DEFAULT_FORMAT]
 
 # 请在这里粘贴你完整的 Prompt (包括所有的物理规则和 Few-shot examples)
 SYSTEM_PROMPT = """
@@ -125,68 +123,37 @@ If a beam connects **Node A** $(x_1, y_1)$ and **Node B** $(x_2, y_2)$:
 Part 4: Current Task Execution
 Input Data:
 Level Image: [See Uploaded Image] (Analyze geometry, gap size, and obstacles).
-{picture}
-Initial Save Code: [Provided Code] (Use this to extract the coordinate system and existing Anchor IDs).
-{initial_save_code}
+Initial Save Code: [Provided Code in the user message] (Use this to extract the coordinate system and existing Anchor IDs).
 
 Requirement:
 Analyze the input level. Select the appropriate materials (Wood vs Steel vs Rope) based on the "Game Physics" section (Part 1). Construct a solution that connects the anchor points.
 Output ONLY the valid JSON code block representing the final save file, strictly following the "Generation Logic" in Part 2. Do not explain the math, just output the JSON.
 
 """
+# 固定前缀只构造一次，保证每次请求逐字节一致
+PROMPT = PromptBuilder(SYSTEM_PROMPT, image_mime=SCREENSHOT_MIME)
 # ===========================================
 
-def take_screenshot_and_get_base64(save_path):
-    """截取屏幕，保存图片，并返回可供 API 使用的 Base64 字符串"""
-    print("📸 正在截图...")
-    screenshot = pyautogui.screenshot()
-    screenshot.save(save_path)
-    
-    # 将图片转换为 Base64
-    buffered = BytesIO()
-    screenshot.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    return img_str
-
-def clean_json_response(response_text):
-    """清理大模型可能返回的 Markdown 标记 (例如 ```json ... ```)"""
-    cleaned = response_text.strip()
-    if cleaned.startswith("```json"):
-        cleaned = cleaned[7:]
-    elif cleaned.startswith("```"):
-        cleaned = cleaned[3:]
-    if cleaned.endswith("```"):
-        cleaned = cleaned[:-3]
-    return cleaned.strip()
+def get_handler():
+    """共享的 LLM Handler (openai / httpx / tenacity 在第一次真正调用大模型时才导入)"""
+    from llm_inf import get_shared_handler
+    return get_shared_handler(api_key=API_KEY, model=MODEL_NAME)
+
+def take_screenshot_and_get_base64(save_path, source=None):
+    """截取屏幕 (或使用 source 指定的已有截图)，裁剪游戏区域与材料栏并缩放，单次编码后返回可供 API 使用的 Base64 字符串 (图片在后台落盘)"""
+    print("📸 正在截图..." if source is None else f"🖼️ 使用已有截图: {source}")
+    result = cut_pic.capture_for_llm(save_path=save_path, source=source)
+    print(f"🖼️ 截图已压缩为 {result['size'][0]}x{result['size'][1]} {result['mime']} ({result['bytes'] / 1024:.0f} KB)")
+    return result["base64"]
 
 def generate_bridge_design(base64_image, initial_save_code):
     """通过你封装的 API 请求大模型生成桥梁设计"""
     print("🧠 正在调用 LLM 生成桥梁设计...")
     
-    handler = LLMHandler_inf(api_key=API_KEY, model=MODEL_NAME)
+    handler = get_handler()
     
-    # 构造给大模型的额外提示
-    task_prompt = f"Please design the bridge. Here is the initial save code for reference:\n```json\n{initial_save_code}\n```"
-
-    # OpenAI Vision 的标准 message 结构
-    messages = [
-        {
-            "role": "system", 
-            "content": SYSTEM_PROMPT
-        },
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": task_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{base64_image}"
-                    }
-                }
-            ]
-        }
-    ]
+    # 固定前缀 (system) + 关卡相关内容 (user 文本 + 截图)，前缀逐字节不变以命中服务端 prompt 缓存
+    messages = PROMPT.build_messages(base64_image, initial_save_code, model=MODEL_NAME)
 
     try:
         # 强制要求返回 JSON 格式 (利用你的 response_format 参数)
@@ -195,94 +162,68 @@ def generate_bridge_design(base64_image, initial_save_code):
             response_format={"type": "json_object"}
         )
         
-        # 解析返回结果
-        json_str = clean_json_response(raw_response)
-        return json.loads(json_str)
+        # 解析返回结果 (容错：截断、代码块标记、前后夹带文字、尾逗号等都会尝试修复)
+        save_data, repairs = recover_objects(raw_response)
+        if save_data is None:
+            print(f"❌ JSON 解析失败，模型返回的内容无法修复 ({describe_repairs(repairs)}):\n{raw_response}")
+            return None
+        if repairs:
+            print(f"🩹 JSON 已自动修复: {describe_repairs(repairs)}")
+        if not isinstance(save_data, dict) or "Objects" not in save_data:
+            print(f"❌ 模型返回的 JSON 缺少 'Objects' 数组:\n{raw_response}")
+            return None
+        # 解析边界：存档 JSON 立刻转成内部使用的 BridgeDesign
+        return BridgeDesign.from_objects(save_data)
         
-    except json.JSONDecodeError as e:
-        print(f"❌ JSON 解析失败，模型返回的内容可能格式有误:\n{raw_response}")
-        return None
     except Exception as e:
         print(f"❌ API 调用失败: {e}")
         return None
 
-def validate_design_json(design_data):
+def validate_design_json(design_data, violations=None):
     """
     质量检控：严格审查大模型生成的 JSON 是否符合规则
+    一次性报告全部违规项 (锚点、中点坐标、重复 id、type 0 杆件、超长、零长度)；violations 为已有的校验结果
     """
     print("🔍 正在审查生成的 JSON 质量...")
-    if not design_data or "Objects" not in design_data:
-        print("❌ 校验失败：缺少 'Objects' 数组。")
+    if violations is None:
+        violations = collect_violations(design_data)
+    if violations:
+        print_violations(violations)
+        print(f"❌ 共发现 {len(violations)} 处违规。")
         return False
-        
-    objects = design_data["Objects"]
-    nodes = {obj["id"]: (obj["x"], obj["y"]) for obj in objects if obj.get("type") == 0}
-            
-    for obj in objects:
-        obj_type = obj.get("type")
-        if obj_type > 0: # 连接材料
-            obj_id, aid, bid = obj.get("id"), obj.get("anchorAID"), obj.get("anchorBID")
-            
-            # 校验 1：锚点是否存在
-            if aid not in nodes or bid not in nodes:
-                print(f"❌ 校验失败：物体 ID {obj_id} 引用了不存在的锚点 ({aid} 或 {bid})。")
-                return False
-                
-            # 校验 2：检查中点坐标公式是否正确
-            node_a_x, node_a_y = nodes[aid]
-            node_b_x, node_b_y = nodes[bid]
-            expected_x = (node_a_x + node_b_x) / 2.0
-            expected_y = (node_a_y + node_b_y) / 2.0
-            actual_x, actual_y = obj.get("x"), obj.get("y")
-            
-            if abs(expected_x - actual_x) > 0.001 or abs(expected_y - actual_y) > 0.001:
-                print(f"❌ 校验失败：物体 ID {obj_id} 坐标计算错误！模型:({actual_x}, {actual_y}), 正确:({expected_x}, {expected_y})")
-                return False
 
     print("✅ 校验通过：拓扑关系与坐标计算准确无误！")
     return True
 
-def save_to_layout_file(design_data, timestamp):
-    """保存为游戏可读取的存档，自动存入 gen 目录下的时间子目录"""
-    # 创建以时间命名的子目录
-    save_dir = os.path.join("gen", timestamp)
-    os.makedirs(save_dir, exist_ok=True)
-
-    # 保存 JSON 文件
-    json_filename = f"{timestamp}.json"
-    json_filepath = os.path.join(save_dir, json_filename)
-    with open(json_filepath, 'w', encoding='utf-8') as f:
-        json.dump(design_data, f, indent=4)
-    print(f"💾 JSON 存档已落盘至: {json_filepath}")
-
-    # 采用 encode.py 的逻辑：读取 JSON 文件并用 json.loads 解析后再加密
-    with open(json_filepath, 'r', encoding='utf-8') as f:
-        raw_json_string = f.read()
-    my_modified_bridge = json.loads(raw_json_string)
-    encoded_data = encode_save(my_modified_bridge)
-
-    # 保存为文件 "0"（无后缀）
-    encoded_filepath = os.path.join(save_dir, "0")
-    with open(encoded_filepath, 'w', encoding='utf-8') as f:
-        f.write(encoded_data)
-    print(f"🔐 加密文件已落盘至: {encoded_filepath}")
-
-    # 复制到游戏存档目录，覆盖原有文件
-    target_dir = paths.GAME_SAVE_DIR
-    target_filepath = os.path.join(target_dir, "0")
+def save_to_layout_file(design_data, timestamp, load_into_game=True, model=None, screening=None):
+    """
+    保存为游戏可读取的存档，自动存入 gen 目录下的时间子目录，并记入 gen/ 索引
+    (screening 为已有的 {"violations", "report"} 筛查结果，给出时索引不再重新校验 / 预筛)
+    """
+    # 只序列化一次：归档 JSON、加密文件 "0" 与游戏存档槽并行写出，存档槽通过临时文件 + rename 原子替换
+    game_save_dir = None
+    if load_into_game:
+        import paths  # 只有写入游戏存档槽时才需要本机路径配置
+        game_save_dir = paths.GAME_SAVE_DIR
+
     try:
-        os.makedirs(target_dir, exist_ok=True)
-        with open(encoded_filepath, 'r', encoding='utf-8') as src:
-            content = src.read()
-        with open(target_filepath, 'w', encoding='utf-8') as dst:
-            dst.write(content)
-        print(f"📂 已复制到游戏存档目录: {target_filepath}")
-
-        # 加载存档到游戏界面
-        print("🎮 准备加载存档到游戏界面...")
-        auto_load_savefiles.load_polybridge_save()
+        written = write_design_files(design_data, timestamp, game_save_dir=game_save_dir)
     except Exception as e:
-        print(f"❌ 复制到游戏存档目录失败: {e}")
+        print(f"❌ 写入存档失败: {e}")
+        return
+    print(f"💾 JSON 存档已落盘至: {written['json']}")
+    print(f"🔐 加密文件已落盘至: {written['encoded']}")
+    design_index.index_saved_design(design_data, timestamp, written, model=model or MODEL_NAME, **(screening or {}))
+
+    if not load_into_game:
+        print("⏭️ 未通过校验或预筛，仅归档不送入游戏。")
+        return
+
+    print(f"📂 已写入游戏存档目录: {written['game_slot']}")
+    # 加载存档到游戏界面
+    print("🎮 准备加载存档到游戏界面...")
+    from tool import auto_load_savefiles
+    auto_load_savefiles.load_polybridge_save()
 
 if __name__ == "__main__":
     # 测试用的初始存档数据
@@ -290,8 +231,12 @@ if __name__ == "__main__":
     {"DisplayName":"1","Objects":[{"type":0,"x":0,"y":0,"id":1,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true},{"type":0,"x":8,"y":0,"id":2,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true},{"type":0,"x":0,"y":-2,"id":3,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true},{"type":0,"x":8,"y":-2,"id":4,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true}]}
     """
     
+    print(f"🧷 Prompt {PROMPT.describe()}")
+    # 本次运行的所有调用指标都带上 run_id 与前缀 hash，便于比较不同 prompt / 模型的耗时与开销
+    llm_metrics.set_run_context(run_id=datetime.now().strftime("%Y%m%d_%H%M%S"), script="main", prompt_prefix=PROMPT.prefix_hash)
+    from tool import screen_wait
     print("▶️ 请在 3 秒内切换到游戏画面...")
-    time.sleep(3)
+    screen_wait.wait_for_window_switch(3.0)
     
     # 1. 截图并转换为 Base64
     base64_img = take_screenshot_and_get_base64(SCREENSHOT_PATH)
@@ -299,19 +244,34 @@ if __name__ == "__main__":
     # 2. 调用 GPT-4o 生成设计
     bridge_json = generate_bridge_design(base64_img, initial_code)
     
-    # 3. 无论对错强制保存，然后再校验
-    if bridge_json:
+    # 3. 校验 + 静力预筛，再保存
+    prescreen_passed = False
+    if bridge_json is not None:
         # 按照当前时间生成文件名 (例如: 20240520_153022)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-        # 立刻保存 (存入 gen/时间戳 子目录)
-        save_to_layout_file(bridge_json, timestamp)
-
-        # 保存完了再检查内容质量
-        if validate_design_json(bridge_json):
+        # 先做质量检查和静力预筛，只有都通过的设计才送进游戏跑模拟
+        violations = collect_violations(bridge_json)
+        report = None
+        is_valid = validate_design_json(bridge_json, violations)
+        if is_valid:
+            report = prescreen_design(bridge_json)
+            prescreen_passed = report["passed"]
+            if prescreen_passed:
+                print(f"🧮 静力预筛通过：最大利用率 {report['max_utilisation']:.2f} (耗时 {report['elapsed_ms']:.1f} ms)")
+            else:
+                print(f"🧮 静力预筛未通过：{report['reason']}")
+
+        # 无论对错都保存 (存入 gen/时间戳 子目录)，但只有通过的才加载进游戏
+        save_to_layout_file(bridge_json, timestamp, load_into_game=prescreen_passed,
+                            screening={"violations": violations, "report": report})
+
+        if prescreen_passed:
             print("✅ 此 JSON 文件质量达标，准备进入模拟流程...")
             # 成功后，这里可以无缝衔接你加载存档跑模拟的代码
         else:
-            print("⚠️ 注意：生成的 JSON 未通过严谨校验。已保存供事后排查分析。")
+            print("⚠️ 注意：生成的 JSON 未通过严谨校验或静力预筛。已保存供事后排查分析。")
     else:
-        print("❌ 流程终止：大模型未能生成有效的 JSON 格式数据。")
\ No newline at end of file
+        print("❌ 流程终止：大模型未能生成有效的 JSON 格式数据。")
+
+    llm_metrics.log_outcome(prescreen_passed, stage="prescreen")
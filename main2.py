@@ -1,40 +1,71 @@
 import json
 import time
-import base64
-import pyautogui
+import asyncio
 import os
-import re
 from datetime import datetime
-from io import BytesIO
-from pathlib import Path
-
-# 引入你提供的自定义 LLM Handler
-from llm_inf import LLMHandler_inf
-# 引入 encode.py 的加密函数
-from tool.encode import encode_save
-# 引入路径配置
-import paths
-# 引入自动加载存档模块
-from tool import auto_load_savefiles
+
+# 引入 .env 加载与内置默认关卡
+from config import load_env, DEFAULT_INITIAL_CODE
+
+# 引入单次序列化的存档写出流水线
+from save_pipeline import write_design_files
+# 引入截图裁剪 / 缩放 / 单次编码模块
+from tool import cut_pic
+# 引入离线静力预筛
+from truss_solver import prescreen_design
+# 引入向量化设计校验
+from design_validator import collect_violations, print_violations
+# 引入紧凑的桥梁设计模型
+from bridge_design import BridgeDesign
+# 引入每关都解锁的基础材料
+from materials import BASIC_MATERIALS
+# 引入流式增量解析与提前中止
+from stream_parser import consume_topology_stream
+# 引入容错 JSON 恢复
+from json_recovery import recover_topology, describe_repairs
+# 引入稳定前缀的 prompt 组装
+from prompt_builder import PromptBuilder
+# 引入调用指标记录
+import llm_metrics
+# 引入 gen/ 归档索引
+import design_index
+# 引入设计的结构 hash
+from design_canon import design_hash
+# 引入多轮修正会话
+import refinement
 
 # ================= 加载环境变量 =================
-def load_env(env_file: str = ".env"):
-    """从 .env 文件加载环境变量"""
-    env_path = Path(env_file)
-    if env_path.exists():
-        with open(env_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
-
-load_env()
+# 下面的配置项在导入时读取环境变量：直接运行本脚本时先加载 .env；被 cli.py 导入时由 cli.main 负责加载
+if __name__ == "__main__":
+    load_env()
 
 # ================= 配置区域 =================
 API_KEY = os.getenv("API_KEY", "")
 MODEL_NAME = os.getenv("MODEL_NAME", "claude-opus-4-5-2025110")
 SCREENSHOT_PATH = "current_level.png"
+SCREENSHOT_MIME = cut_pic.MIME_TYPES[cut_pic.DEFAULT_FORMAT]
+# 并发候选数量 (>1 时启用并发多候选模式)，以及候选之间轮换的模型 / 温度
+N_CANDIDATES = int(os.getenv("N_CANDIDATES", "1"))
+CANDIDATE_MODELS = [m.strip() for m in os.getenv("CANDIDATE_MODELS", MODEL_NAME).split(",") if m.strip()]
+CANDIDATE_TEMPERATURES = [float(t) for t in os.getenv("CANDIDATE_TEMPERATURES", "0.7").split(",") if t.strip()]
+# 流式模式：边生成边解析校验，发现致命错误立即中止请求；ALLOWED_MATERIALS 为本关已解锁的材料类型 (如 "1,2")
+STREAM_MODE = os.getenv("STREAM_MODE", "0") == "1"
+ALLOWED_MATERIALS = [int(t) for t in os.getenv("ALLOWED_MATERIALS", "").split(",") if t.strip()] or None
+# 多轮修正模式：失败后只发送紧凑反馈继续改图，轮数与 token 预算见 refinement.py (REFINE_MAX_ITERATIONS / REFINE_TOKEN_BUDGET)
+REFINE_MODE = os.getenv("REFINE_MODE", "0") == "1"
+# 多轮修正时通过预筛的设计先在游戏里跑一次 (需要图形环境)，失败就把回放判定与关键帧缩略图作为反馈继续修正
+REFINE_SIMULATE = os.getenv("REFINE_SIMULATE", "0") == "1"
+# 造价优化：通过预筛的设计在送进游戏前先做钢材降级 / 冗余杆件删除 (关卡预算由 LEVEL_BUDGET 给出)
+OPTIMIZE_COST = os.getenv("OPTIMIZE_COST", "0") == "1"
+# 拓扑自动修复 (可选，默认关闭)：转换前合并重合节点、删除重复杆件、把超长杆件等分 (见 topology_repair.py)，
+# 能本地修的就不再重新调用大模型
+REPAIR_TOPOLOGY = os.getenv("REPAIR_TOPOLOGY", "0") == "1"
+# 参数化桁架基线：先用 Warren / Pratt / Howe / 王柱 / 拱 / 绳索悬吊 直接生成候选 (见 truss_generator.py)，
+# 有通过静力预筛的就不截图、不调用大模型；全部不通过时再回退到大模型
+BASELINE_FIRST = os.getenv("BASELINE_FIRST", "1") == "1"
+# 基线不看截图，不知道本关解锁了哪些材料：没有设置 ALLOWED_MATERIALS 时只用每关都有的路面 + 木材，
+# 以免把含未解锁材料 (如钢材) 的基线载入游戏损坏存档
+BASELINE_MATERIALS = ALLOWED_MATERIALS or list(BASIC_MATERIALS)
 
 SYSTEM_PROMPT = """
 # Role & Objective
@@ -133,10 +164,9 @@ Your output MUST be a **SINGLE, VALID JSON OBJECT** containing exactly three key
 ---
 
 # Part 5: Current Task Execution
-**Input Data:**
+**Input Data (attached in the user message):**
 Level Image: [See Uploaded Image]
-{picture}
-Initial Save Code: {initial_save_code}
+Initial Save Code: [See the JSON in the user message]
 
 **Requirement:**
 1. Visually inspect the bottom-left toolbar.
@@ -144,219 +174,503 @@ Initial Save Code: {initial_save_code}
 3. Output the exact topological JSON payload according to the Schema.
 """
 
+# 固定前缀只构造一次，保证每次请求逐字节一致，便于服务端 prompt 缓存命中
+PROMPT = PromptBuilder(SYSTEM_PROMPT, image_mime=SCREENSHOT_MIME)
+
 # ================= 核心转换函数 =================
-def convert_topology_to_objects(nodes, edges):
+def convert_topology_to_objects(nodes, edges, repair=None):
     """
     将拓扑结构 (nodes + edges) 转换为游戏存档格式的 Objects 数组
     系统自动计算 edges 的中点坐标，并遵循引擎序列化规则剔除默认的 false 字段
     """
-    objects = []
-
-    # 添加所有 nodes
-    for node in nodes:
-        obj = {
-            "type": 0,
-            "x": node["x"],
-            "y": node["y"],
-            "id": node["id"],
-            "anchorAID": 0,
-            "anchorBID": 0,
-            "splitForDrawBridge": 0,
-            "rate": 0
-        }
-        
-        # 只有大模型明确给出 True 时，才把 isKinematic 写进游戏存档
-        if node.get("isKinematic") is True:
-            obj["isKinematic"] = True
-            
-        objects.append(obj)
-
-    node_coords = {node["id"]: (node["x"], node["y"]) for node in nodes}
-
-    # 添加所有 edges (自动计算中点坐标)
+    return build_design_from_topology(nodes, edges, repair=repair).to_objects()
+
+def build_design_from_topology(nodes, edges, repair=None):
+    """
+    将拓扑结构构造成内部使用的 BridgeDesign，引用不存在节点的 edge 会被剔除。
+    repair (默认取 REPAIR_TOPOLOGY) 为真时先合并重合节点、删除重复杆件、等分超长杆件，并打印每一处修改
+    """
+    if REPAIR_TOPOLOGY if repair is None else repair:
+        from topology_repair import print_repairs, repair_topology
+        nodes, edges, report = repair_topology(nodes, edges)
+        print_repairs(report)
+
+    node_ids = {node["id"] for node in nodes}
+    kept_edges = []
     for edge in edges:
         node_a_id = edge["anchorAID"]
         node_b_id = edge["anchorBID"]
-
-        if node_a_id not in node_coords or node_b_id not in node_coords:
+        if node_a_id not in node_ids or node_b_id not in node_ids:
             print(f"⚠️ 警告：Edge {edge['id']} 引用的节点不存在 ({node_a_id} 或 {node_b_id})")
             continue
+        kept_edges.append(edge)
 
-        x1, y1 = node_coords[node_a_id]
-        x2, y2 = node_coords[node_b_id]
-
-        mid_x = (x1 + x2) / 2.0
-        mid_y = (y1 + y2) / 2.0
-
-        obj = {
-            "type": edge["type"],
-            "x": mid_x,
-            "y": mid_y,
-            "id": edge["id"],
-            "anchorAID": node_a_id,
-            "anchorBID": node_b_id,
-            "splitForDrawBridge": 0,
-            "rate": edge.get("rate", 0)  # 液压杆动态参数，默认 0
-        }
-        objects.append(obj)
-
-    return {"DisplayName": "Bridge_Generated", "Objects": objects}
+    return BridgeDesign.from_topology(nodes, kept_edges, display_name="Bridge_Generated")
 
 # ================= 辅助函数 =================
-def take_screenshot_and_get_base64(save_path):
-    print("📸 正在截图...")
-    screenshot = pyautogui.screenshot()
-    screenshot.save(save_path)
-    
-    buffered = BytesIO()
-    screenshot.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    return img_str
+def get_handler():
+    """共享的 LLM Handler (openai / httpx / tenacity 在第一次真正调用大模型时才导入)"""
+    from llm_inf import get_shared_handler
+    return get_shared_handler(api_key=API_KEY, model=MODEL_NAME)
+
+def take_screenshot_and_get_base64(save_path, source=None):
+    """截取屏幕 (或使用 source 指定的已有截图)，裁剪游戏区域与材料栏并缩放，单次编码后返回可供 API 使用的 Base64 字符串 (图片在后台落盘)"""
+    print("📸 正在截图..." if source is None else f"🖼️ 使用已有截图: {source}")
+    result = cut_pic.capture_for_llm(save_path=save_path, source=source)
+    print(f"🖼️ 截图已压缩为 {result['size'][0]}x{result['size'][1]} {result['mime']} ({result['bytes'] / 1024:.0f} KB)")
+    return result["base64"]
 
 def extract_json_from_text(text):
-    """暴力提取文本中的 JSON 块，并返回解析结果及可能的错误信息"""
-    match = re.search(r'\{.*\}', text, re.DOTALL)
-    if match:
-        json_str = match.group(0)
-        try:
-            return json.loads(json_str), None
-        except json.JSONDecodeError as e:
-            return None, f"JSONDecodeError: {str(e)}"
-    return None, "No JSON object found in the response (Missing { and })."
+    """容错提取文本中的 JSON 块 (截断、前后夹带文字、尾逗号等会先尝试修复)，并返回解析结果及可能的错误信息"""
+    topology_data, repairs = recover_topology(text)
+    if topology_data is None:
+        return None, f"无法从回答中恢复出 JSON ({describe_repairs(repairs)})"
+    if repairs:
+        print(f"🩹 JSON 已自动修复: {describe_repairs(repairs)}")
+    return topology_data, None
 
 # 这里请将下方的 SYSTEM_PROMPT 字符串放置于此或外部导入
 # from prompt_file import SYSTEM_PROMPT
 
+def build_messages(base64_image, initial_save_code):
+    """构造发给大模型的 system (固定前缀) + user(关卡文本 + 截图) 消息"""
+    return PROMPT.build_messages(base64_image, initial_save_code, model=MODEL_NAME)
+
+def parse_design_response(raw_response):
+    """把模型原始返回解析成 BridgeDesign，失败时返回 (None, 错误信息)"""
+    # 强制转为 string
+    response_text = str(getattr(raw_response, 'content', raw_response))
+
+    # 使用正则提取并尝试解析 JSON
+    topology_data, error_msg = extract_json_from_text(response_text)
+
+    # 如果解析成功，且包含我们需要的核心字段
+    if topology_data and "nodes" in topology_data and "edges" in topology_data:
+        return build_design_from_topology(topology_data["nodes"], topology_data["edges"]), None
+    return None, f"{error_msg if error_msg else 'Missing nodes or edges'}\n模型原始返回内容:\n{response_text}"
+
 def generate_bridge_design(base64_image, initial_save_code):
     """请求大模型生成桥梁设计 (纯文本架构，单次请求无重试)"""
     print("🧠 正在调用 LLM 生成桥梁设计...")
 
-    handler = LLMHandler_inf(api_key=API_KEY, model=MODEL_NAME)
-    task_prompt = f"Please design the bridge. Here is the initial save code for reference:\n```json\n{initial_save_code}\n```"
-
-    messages = [
-        {
-            "role": "system",
-            "content": SYSTEM_PROMPT
-        },
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": task_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{base64_image}"
-                    }
-                }
-            ]
-        }
-    ]
+    handler = get_handler()
+    messages = build_messages(base64_image, initial_save_code)
 
     try:
         # 单次请求，无 tools 参数
         raw_response = handler.get_completion(messages=messages)
-        
-        # 强制转为 string
-        response_text = str(getattr(raw_response, 'content', raw_response))
-        
-        # 使用正则提取并尝试解析 JSON
-        topology_data, error_msg = extract_json_from_text(response_text)
-
-        # 如果解析成功，且包含我们需要的核心字段
-        if topology_data and "nodes" in topology_data and "edges" in topology_data:
+        design, error_msg = parse_design_response(raw_response)
+        if design is not None:
             print("✅ JSON 提取解析成功！")
-            design_data = convert_topology_to_objects(
-                topology_data["nodes"],
-                topology_data["edges"]
-            )
-            return design_data
-        else:
-            print(f"❌ 解析失败: {error_msg if error_msg else 'Missing nodes or edges'}")
-            print(f"模型原始返回内容:\n{response_text}")
-            return None
+            return design
+        print(f"❌ 解析失败: {error_msg}")
+        return None
+
+    except Exception as e:
+        print(f"❌ API 调用通信失败: {e}")
+        return None
+
+def generate_bridge_design_streaming(base64_image, initial_save_code, allowed_types=ALLOWED_MATERIALS):
+    """流式请求大模型：nodes/edges 边到达边校验，出现不可挽回的错误时立即取消请求"""
+    print("🧠 正在以流式模式调用 LLM 生成桥梁设计...")
 
+    handler = get_handler()
+    messages = build_messages(base64_image, initial_save_code)
+
+    try:
+        result = consume_topology_stream(handler.iter_completion(messages=messages), allowed_types)
     except Exception as e:
         print(f"❌ API 调用通信失败: {e}")
         return None
 
-def validate_design_json(design_data):
-    """质量检控：严格审查大模型生成的 JSON 是否符合规则"""
+    metrics = result["metrics"]
+    ttfe = metrics["time_to_first_edge"]
+    print(f"⏱️ 首 token {metrics['time_to_first_token'] or 0:.1f}s，首条 edge {f'{ttfe:.1f}s' if ttfe is not None else '-'}，"
+          f"总耗时 {metrics['elapsed']:.1f}s，共 {metrics['chars']} 字符")
+    if result["violation"]:
+        action = "已提前中止请求" if result["aborted"] else "生成结束后发现"
+        print(f"❌ {action}：{result['violation']['message']}")
+        return None
+    if not result["nodes"] or not result["edges"]:
+        print(f"❌ 解析失败: Missing nodes or edges\n模型原始返回内容:\n{result['text']}")
+        return None
+
+    if result["repaired_items"]:
+        print(f"🩹 已修复 {len(result['repaired_items'])} 个格式有误的元素: "
+              f"{describe_repairs([r for item in result['repaired_items'] for r in item['repairs']])}")
+    if result["skipped_items"]:
+        print(f"⚠️ 跳过 {len(result['skipped_items'])} 个无法解析的元素: {result['skipped_items']}")
+    print("✅ 流式解析成功！")
+    return build_design_from_topology(result["nodes"], result["edges"])
+
+async def generate_bridge_candidates(base64_image, initial_save_code, n_candidates=N_CANDIDATES,
+                                     models=None, temperatures=None, max_concurrency=None):
+    """
+    并发请求 n_candidates 个候选设计，按完成先后依次 yield
+    每个结果形如 {"index", "model", "temperature", "design", "error", "elapsed"}
+    第 i 个候选轮流使用 models[i % len] 与 temperatures[i % len]；
+    调用方提前退出 (例如已找到合格设计) 时，其余未完成的请求会被取消。
+    """
+    models = models or CANDIDATE_MODELS
+    temperatures = temperatures or CANDIDATE_TEMPERATURES
+    handler = get_handler()
+    messages = build_messages(base64_image, initial_save_code)
+    semaphore = asyncio.Semaphore(max_concurrency or n_candidates)
+
+    async def request_one(index):
+        model = models[index % len(models)]
+        temperature = temperatures[index % len(temperatures)]
+        result = {"index": index, "model": model, "temperature": temperature, "design": None, "error": None}
+        started = time.perf_counter()
+        async with semaphore:
+            try:
+                raw_response = await handler.aget_completion(messages=messages, temperature=temperature, model=model,
+                                                              cache_sample=index)
+                result["design"], result["error"] = parse_design_response(raw_response)
+            except Exception as e:
+                result["error"] = f"API 调用通信失败: {e}"
+        result["elapsed"] = time.perf_counter() - started
+        return result
+
+    print(f"🧠 正在并发请求 {n_candidates} 个候选设计...")
+    tasks = [asyncio.create_task(request_one(i)) for i in range(n_candidates)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def run_in_game(design, screening, timestamp):
+    """
+    把通过预筛的设计载入游戏跑一次并判定回放，返回 (设计 id, 判定结果, 回放帧目录)；
+    没能载入或没有拿到判定结果时对应项为 None
+    """
+    entry_id = save_to_layout_file(design, timestamp, screening=screening)
+    if entry_id is None:
+        return None, None, None
+    from tool import auto_run
+    frames_dir = auto_run.run_and_collect(entry_id=entry_id)
+    score_path = os.path.join(frames_dir, "score.json") if frames_dir else None
+    if not score_path or not os.path.exists(score_path):
+        return entry_id, None, frames_dir
+    with open(score_path, 'r', encoding='utf-8') as f:
+        return entry_id, json.load(f), frames_dir
+
+def refine_bridge_design(base64_image, initial_save_code, max_iterations=None, token_budget=None, simulate=False):
+    """
+    多轮修正：首轮发送完整 prompt + 截图，之后每轮只追加一条紧凑反馈 (解析错误、违规杆件、超载杆件)，
+    直到设计通过校验与静力预筛，或轮数 / token 预算用完。返回 (通过的设计或 None, 会话摘要)，通过时摘要中带上预筛报告 prescreen。
+    simulate=True 时通过预筛的设计 (造价优化后) 直接载入游戏跑测，失败则把回放判定与关键帧缩略图作为反馈继续修正；
+    此时摘要中的 entry_id 为已经载入并跑过的设计
+    """
+    handler = get_handler()
+    session = refinement.RefinementSession(
+        build_messages(base64_image, initial_save_code),
+        max_iterations=max_iterations or refinement.DEFAULT_MAX_ITERATIONS,
+        token_budget=token_budget or refinement.DEFAULT_TOKEN_BUDGET,
+    )
+
+    while session.can_continue():
+        round_no = len(session.iterations) + 1
+        print(f"🧠 第 {round_no}/{session.max_iterations} 轮：正在调用 LLM {'生成' if round_no == 1 else '修正'}桥梁设计...")
+        started = time.perf_counter()
+        try:
+            raw_response = handler.get_completion(messages=session.messages)
+        except Exception as e:
+            print(f"❌ API 调用通信失败: {e}")
+            break
+        raw_response = str(getattr(raw_response, 'content', raw_response))
+        stats = session.record_reply(raw_response, time.perf_counter() - started)
+        print(f"⏱️ 输入约 {stats['input_tokens']} tokens，输出约 {stats['output_tokens']} tokens，耗时 {stats['elapsed']:.1f}s "
+              f"(累计 {session.tokens_used}/{session.token_budget})")
+
+        design, error_msg = parse_design_response(raw_response)
+        if design is None:
+            print(f"❌ 解析失败: {error_msg}")
+            session.add_feedback(refinement.build_feedback(parse_error=error_msg))
+            continue
+
+        violations = collect_violations(design)
+        report = None
+        if violations:
+            print_violations(violations)
+        else:
+            report = prescreen_design(design)
+            if report["passed"]:
+                print(f"✅ 第 {round_no} 轮设计通过校验与静力预筛 (最大利用率 {report['max_utilisation']:.2f})")
+                design, screening = optimize_design(design, {"violations": [], "report": report})
+                if not screening["report"]["passed"]:
+                    session.add_feedback(refinement.build_feedback(cost_note=refinement.describe_budget(screening["report"])))
+                    continue
+                if not simulate:
+                    return design, dict(session.summary(), prescreen=screening["report"])
+                entry_id, result, frames_dir = run_in_game(design, screening, datetime.now().strftime("%Y%m%d_%H%M%S"))
+                # 没能跑测或无法判定时不再消耗轮数，按通过预筛的设计交给调用方
+                if result is None or result["success"] is not False:
+                    return design, dict(session.summary(), prescreen=screening["report"], entry_id=entry_id, replay=result)
+                from tool import replay_score
+                print(f"💥 第 {round_no} 轮设计在游戏中失败：{replay_score.describe(result)}")
+                session.add_feedback(refinement.build_feedback(
+                    simulation_note=refinement.describe_replay(result),
+                    thumbnails=refinement.replay_thumbnails(frames_dir, failure_time=result.get("failure_time"))))
+                continue
+            print(f"🧮 静力预筛未通过：{report['reason']}")
+        session.add_feedback(refinement.build_feedback(violations=violations, prescreen_report=report))
+
+    print(f"⛔ 多轮修正结束：共 {len(session.iterations)} 轮，约 {session.tokens_used} tokens，仍未得到合格设计。")
+    return None, session.summary()
+
+def screen_design(design):
+    """
+    质量检查 + 静力预筛，返回 (是否值得送进游戏, 筛查结果)；
+    筛查结果 {"violations", "report"} (有违规时 report 为 None) 原样交给 save_to_layout_file 记入索引，不再重复求解
+    """
+    violations = collect_violations(design)
+    if not validate_design_json(design, violations):
+        return False, {"violations": violations, "report": None}
+    report = prescreen_design(design)
+    if report["passed"]:
+        print(f"🧮 静力预筛通过：最大利用率 {report['max_utilisation']:.2f} (耗时 {report['elapsed_ms']:.1f} ms)")
+    else:
+        print(f"🧮 静力预筛未通过：{report['reason']}")
+    return report["passed"], {"violations": violations, "report": report}
+
+def passed_screening(max_utilisation):
+    """已知通过校验与预筛的设计 (参数化基线、造价优化结果) 的筛查结果"""
+    return {"violations": [], "report": {"passed": True, "max_utilisation": max_utilisation}}
+
+def recall_known_outcome(design):
+    """结构相同的设计已经在游戏里跑过时直接返回上次的回放结果 (True / False)，否则返回 None"""
+    known = design_index.recall_outcome(design)
+    if known is None or known["replay_success"] is None:
+        return None
+    verdict = "通过" if known["replay_success"] else "失败"
+    print(f"♻️ 与已测设计 {known['replay_entry']} 结构相同 (hash {known['design_hash']})，"
+          f"直接复用回放结果：{verdict}，跳过游戏内模拟")
+    return bool(known["replay_success"])
+
+def optimize_design(design, screening=None):
+    """
+    OPTIMIZE_COST=1 时对通过预筛的设计做造价优化；设置了关卡预算 (LEVEL_BUDGET) 时，(优化后) 仍超出预算的设计判为不合格。
+    返回 ((可能更便宜的) 设计, 对应的筛查结果)；超出预算时筛查结果的 report 为 passed=False，并带上 cost / budget / reason
+    """
+    from cost_optimizer import LEVEL_BUDGET, describe_savings, member_costs, optimize_cost
+
+    if OPTIMIZE_COST:
+        optimized, report = optimize_cost(design)
+        print(f"💰 {describe_savings(report)} (耗时 {report['elapsed_ms']:.0f} ms)")
+        if report["optimized"] and report["savings"] > 0:
+            design, screening = optimized, passed_screening(report["max_utilisation"])
+    if LEVEL_BUDGET is None:
+        return design, screening
+    cost = float(member_costs(design).sum())
+    if cost <= LEVEL_BUDGET:
+        return design, screening
+    reason = f"造价 ${cost:.0f} 超出关卡预算 ${LEVEL_BUDGET:.0f}"
+    print(f"💸 {reason}，按不合格处理")
+    screening = screening or {"violations": []}
+    report = dict(screening.get("report") or {}, passed=False, cost=cost, budget=LEVEL_BUDGET, reason=reason)
+    return design, dict(screening, report=report)
+
+def try_baseline_designs(initial_code, timestamp, load_into_game=True):
+    """
+    参数化基线按造价从低到高逐个尝试：跳过结构相同且已在游戏中失败过的，第一个可用的归档并载入。
+    返回是否得到合格设计；没有任何基线通过预筛时返回 False，由调用方回退到大模型
+    """
+    import truss_generator
+
+    candidates = truss_generator.generate_baselines(initial_code, allowed_types=BASELINE_MATERIALS)
+    passing = [c for c in candidates if c["passed"]]
+    print(f"📐 参数化基线：{len(passing)}/{len(candidates)} 个通过静力预筛")
+    truss_generator.print_candidates(candidates, limit=5)
+    for c in passing:
+        design = build_design_from_topology(c["topology"]["nodes"], c["topology"]["edges"])
+        known = recall_known_outcome(design)
+        if known is False:
+            continue
+        screening = passed_screening(c["max_utilisation"])
+        if known is None:
+            design, screening = optimize_design(design, screening)
+            if not screening["report"]["passed"]:
+                save_to_layout_file(design, f"{timestamp}_{c['name']}", load_into_game=False,
+                                    model=f"baseline:{c['name']}", screening=screening)
+                continue
+        save_to_layout_file(design, f"{timestamp}_{c['name']}", load_into_game=load_into_game,
+                            model=f"baseline:{c['name']}", screening=screening)
+        print(f"✅ 采用基线 {c['name']} (造价 ${c['cost']:.0f})，跳过大模型调用")
+        return True
+    return False
+
+async def find_first_passing_candidate(base64_image, initial_save_code, timestamp, load_into_game=True):
+    """
+    候选一到达就立刻校验 + 预筛并归档，返回第一个通过的设计 (其余请求随即取消)；load_into_game=False 时只归档。
+    与本轮之前的候选结构相同的直接跳过，与已测设计结构相同的直接复用回放结果
+    """
+    candidates = generate_bridge_candidates(base64_image, initial_save_code)
+    seen = {}
+    try:
+        async for result in candidates:
+            tag = f"候选 #{result['index']} ({result['model']}, T={result['temperature']}, {result['elapsed']:.1f}s)"
+            if result["design"] is None:
+                print(f"❌ {tag} 解析失败: {result['error']}")
+                continue
+            print(f"📥 {tag} 已返回")
+            digest = design_hash(result["design"])
+            if digest in seen:
+                print(f"♻️ {tag} 与候选 #{seen[digest]} 结构相同 (hash {digest})，跳过")
+                continue
+            seen[digest] = result["index"]
+            known = recall_known_outcome(result["design"])
+            if known is not None:
+                # 结果已知：只省掉模拟，已知通过的设计照样写入存档槽并载入游戏
+                save_to_layout_file(result["design"], f"{timestamp}_c{result['index']}", load_into_game=known and load_into_game,
+                                    model=result["model"])
+                if known:
+                    return result
+                continue
+            passed, screening = screen_design(result["design"])
+            if passed:
+                result["design"], screening = optimize_design(result["design"], screening)
+                passed = screening["report"]["passed"]
+            save_to_layout_file(result["design"], f"{timestamp}_c{result['index']}", load_into_game=passed and load_into_game,
+                                model=result["model"], screening=screening)
+            if passed:
+                return result
+    finally:
+        await candidates.aclose()
+    return None
+
+def validate_design_json(design_data, violations=None):
+    """
+    质量检控：严格审查大模型生成的 JSON 是否符合规则
+    一次性报告全部违规项 (锚点、中点坐标、重复 id、type 0 杆件、超长、零长度)；violations 为已有的校验结果
+    """
     print("🔍 正在审查生成的 JSON 质量...")
-    if not design_data or "Objects" not in design_data:
+    if violations is None:
+        violations = collect_violations(design_data)
+    if violations:
+        print_violations(violations)
+        print(f"❌ 共发现 {len(violations)} 处违规。")
         return False
-        
-    objects = design_data["Objects"]
-    nodes = {obj["id"]: (obj["x"], obj["y"]) for obj in objects if obj.get("type") == 0}
-            
-    for obj in objects:
-        obj_type = obj.get("type")
-        if obj_type > 0: # 连接材料
-            obj_id, aid, bid = obj.get("id"), obj.get("anchorAID"), obj.get("anchorBID")
-            if aid not in nodes or bid not in nodes:
-                print(f"❌ 校验失败：物体 ID {obj_id} 引用了不存在的锚点 ({aid} 或 {bid})。")
-                return False
-                
-            node_a_x, node_a_y = nodes[aid]
-            node_b_x, node_b_y = nodes[bid]
-            expected_x = (node_a_x + node_b_x) / 2.0
-            expected_y = (node_a_y + node_b_y) / 2.0
-            actual_x, actual_y = obj.get("x"), obj.get("y")
-            
-            if abs(expected_x - actual_x) > 0.001 or abs(expected_y - actual_y) > 0.001:
-                print(f"❌ 校验失败：物体 ID {obj_id} 坐标计算错误！")
-                return False
 
     print("✅ 校验通过：拓扑关系与坐标计算准确无误！")
     return True
 
-def save_to_layout_file(design_data, timestamp):
-    """保存为游戏可读取的存档"""
-    save_dir = os.path.join("gen", timestamp)
-    os.makedirs(save_dir, exist_ok=True)
-
-    json_filepath = os.path.join(save_dir, f"{timestamp}.json")
-    with open(json_filepath, 'w', encoding='utf-8') as f:
-        json.dump(design_data, f, indent=4)
-    print(f"💾 JSON 存档已落盘至: {json_filepath}")
-
-    with open(json_filepath, 'r', encoding='utf-8') as f:
-        my_modified_bridge = json.loads(f.read())
-    encoded_data = encode_save(my_modified_bridge)
-
-    encoded_filepath = os.path.join(save_dir, "0")
-    with open(encoded_filepath, 'w', encoding='utf-8') as f:
-        f.write(encoded_data)
+def save_to_layout_file(design_data, timestamp, load_into_game=True, model=None, screening=None):
+    """
+    保存为游戏可读取的存档，并记入 gen/ 索引 (model 为生成该设计的模型，默认 MODEL_NAME)；载入游戏时返回设计 id。
+    screening 为 screen_design 的筛查结果，给出时索引直接沿用，不再重新校验 / 预筛
+    """
+    # 只序列化一次：归档 JSON、加密文件 "0" 与游戏存档槽并行写出，存档槽通过临时文件 + rename 原子替换
+    game_save_dir = None
+    if load_into_game:
+        import paths  # 只有写入游戏存档槽时才需要本机路径配置
+        game_save_dir = paths.GAME_SAVE_DIR
 
-    target_dir = paths.GAME_SAVE_DIR
-    target_filepath = os.path.join(target_dir, "0")
     try:
-        os.makedirs(target_dir, exist_ok=True)
-        with open(encoded_filepath, 'r', encoding='utf-8') as src:
-            with open(target_filepath, 'w', encoding='utf-8') as dst:
-                dst.write(src.read())
-        print("🎮 准备加载存档到游戏界面...")
-        auto_load_savefiles.load_polybridge_save()
+        written = write_design_files(design_data, timestamp, game_save_dir=game_save_dir)
     except Exception as e:
-        print(f"❌ 复制到游戏存档目录失败: {e}")
+        print(f"❌ 写入存档失败: {e}")
+        return
+    print(f"💾 JSON 存档已落盘至: {written['json']}")
+    print(f"🔐 加密文件已落盘至: {written['encoded']}")
+    design_index.index_saved_design(design_data, timestamp, written, model=model or MODEL_NAME, **(screening or {}))
+
+    if not load_into_game:
+        print("⏭️ 未通过校验或预筛 (或已知在游戏中失败)，仅归档不送入游戏。")
+        return
+
+    print(f"📂 已写入游戏存档目录: {written['game_slot']}")
+    # 加载存档到游戏界面
+    print("🎮 准备加载存档到游戏界面...")
+    from tool import auto_load_savefiles
+    auto_load_savefiles.load_polybridge_save()
+    # 跑测时把回放判定记到这次载入的设计上 (不靠时间窗口猜)
+    print(f"▶️ 跑测并记录判定: python cli.py run --entry {timestamp}")
+    return timestamp
+
+def level_name(initial_code):
+    """关卡初始存档里的 DisplayName，用于在指标与 gen/ 索引中标注关卡"""
+    try:
+        return json.loads(initial_code).get("DisplayName")
+    except (ValueError, AttributeError):
+        return None
 
-if __name__ == "__main__":
-    initial_code = """
-    {"DisplayName":"1","Objects":[{"type":0,"x":0,"y":0,"id":1,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true},{"type":0,"x":8,"y":0,"id":2,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true},{"type":0,"x":0,"y":-2,"id":3,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true},{"type":0,"x":8,"y":-2,"id":4,"anchorAID":0,"anchorBID":0,"splitForDrawBridge":0,"rate":0,"isKinematic":true}]}
+def run_pipeline(initial_code=DEFAULT_INITIAL_CODE, image=None, load_into_game=True):
     """
-    
-    print("▶️ 请在 3 秒内切换到游戏画面...")
-    time.sleep(3)
-    
-    base64_img = take_screenshot_and_get_base64(SCREENSHOT_PATH)
-    bridge_json = generate_bridge_design(base64_img, initial_code)
-    
-    if bridge_json:
+    完整的生成流程：参数化基线 (BASELINE_FIRST) -> 截图 (image 给出已有截图时不截屏) -> 调用大模型 -> 校验 + 静力预筛 -> 归档，
+    通过的设计在 load_into_game=True 时写入游戏存档槽并载入。返回是否得到合格设计
+    """
+    print(f"🧷 Prompt {PROMPT.describe()}")
+    # 本次运行的所有调用指标都带上 run_id 与前缀 hash，便于比较不同 prompt / 模型的耗时与开销
+    llm_metrics.set_run_context(run_id=datetime.now().strftime("%Y%m%d_%H%M%S"), script="main2", prompt_prefix=PROMPT.prefix_hash,
+                                level=level_name(initial_code))
+
+    if BASELINE_FIRST and try_baseline_designs(initial_code, datetime.now().strftime("%Y%m%d_%H%M%S"), load_into_game):
+        llm_metrics.log_outcome(True, stage="baseline")
+        return True
+
+    base64_img = take_screenshot_and_get_base64(SCREENSHOT_PATH, source=image)
+
+    solved = False
+    if N_CANDIDATES > 1:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        winner = asyncio.run(find_first_passing_candidate(base64_img, initial_code, timestamp, load_into_game))
+        solved = winner is not None
+        if winner:
+            print(f"✅ 候选 #{winner['index']} 质量达标，准备进入模拟流程...")
+        else:
+            print("❌ 流程终止：所有候选都未通过校验或静力预筛。已保存供事后排查分析。")
+    elif REFINE_MODE:
+        design, summary = refine_bridge_design(base64_img, initial_code, simulate=REFINE_SIMULATE and load_into_game)
+        solved = design is not None
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        save_to_layout_file(bridge_json, timestamp)
-        if validate_design_json(bridge_json):
-            print("✅ 此 JSON 文件质量达标，准备进入模拟流程...")
+        if design is not None and summary.get("entry_id"):
+            print(f"🗂️ 设计 {summary['entry_id']} 已在修正过程中归档、载入并跑测")
+        elif design is not None:
+            # 修正循环里已经做过造价优化与预算检查
+            save_to_layout_file(design, timestamp, load_into_game=load_into_game,
+                                screening={"violations": [], "report": summary["prescreen"]})
+            print(f"✅ 经过 {summary['iterations']} 轮修正得到合格设计 (约 {summary['tokens_used']} tokens，"
+                  f"{summary['elapsed']:.1f}s)，准备进入模拟流程...")
         else:
-            print("⚠️ 注意：生成的 JSON 未通过严谨校验。已保存供事后排查分析。")
+            print("❌ 流程终止：多轮修正未能得到通过校验与静力预筛的设计。")
     else:
-        print("❌ 流程终止：大模型未能生成有效的 JSON 格式数据。")
\ No newline at end of file
+        if STREAM_MODE:
+            bridge_json = generate_bridge_design_streaming(base64_img, initial_code)
+        else:
+            bridge_json = generate_bridge_design(base64_img, initial_code)
+
+        if bridge_json is not None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            known = recall_known_outcome(bridge_json)
+            if known is None:
+                prescreen_passed, screening = screen_design(bridge_json)
+                solved = prescreen_passed
+                if prescreen_passed:
+                    bridge_json, screening = optimize_design(bridge_json, screening)
+                    prescreen_passed = solved = screening["report"]["passed"]
+                save_to_layout_file(bridge_json, timestamp, load_into_game=prescreen_passed and load_into_game,
+                                    screening=screening)
+            else:
+                prescreen_passed = solved = known
+                save_to_layout_file(bridge_json, timestamp, load_into_game=known and load_into_game)
+            if known is not None:
+                print(f"{'✅ 该结构此前已在游戏中通过' if known else '❌ 该结构此前已在游戏中失败'}，无需再跑模拟。")
+            elif prescreen_passed:
+                print("✅ 此 JSON 文件质量达标，准备进入模拟流程...")
+            else:
+                print("⚠️ 注意：生成的 JSON 未通过严谨校验或静力预筛。已保存供事后排查分析。")
+        else:
+            print("❌ 流程终止：大模型未能生成有效的 JSON 格式数据。")
+
+    llm_metrics.log_outcome(solved, stage="prescreen")
+    return solved
+
+if __name__ == "__main__":
+    from tool import screen_wait
+
+    print("▶️ 请在 3 秒内切换到游戏画面...")
+    screen_wait.wait_for_window_switch(3.0)
+    run_pipeline()
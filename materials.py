@@ -0,0 +1,26 @@
+# ================= 材料参数表 =================
+# 与 SYSTEM_PROMPT 中 "Material Properties" 一节保持一致，供离线计算模块共用
+# strength: 强度 (PN)；max_length: 最大长度 (m)，None 表示不限；cost: 造价 ($/m)
+# tension_only: 只能受拉 (绳索类)；stiffness: 相对轴向刚度 EA，仅用于超静定结构的内力分配
+
+NODE_TYPE = 0
+
+MATERIALS = {
+    1: {"name": "Road", "strength": 900.0, "max_length": 2.0, "cost": 200.0, "tension_only": False, "stiffness": 1.0e5},
+    2: {"name": "Wood", "strength": 800.0, "max_length": 2.0, "cost": 180.0, "tension_only": False, "stiffness": 1.0e5},
+    4: {"name": "Hydraulics", "strength": 1800.0, "max_length": 4.0, "cost": 750.0, "tension_only": False, "stiffness": 2.0e5},
+    # 游戏里 Cable 与 Rope 同为 type 5 (视地图而定)，这里按更保守的 Rope 参数计算
+    5: {"name": "Rope", "strength": 1200.0, "max_length": None, "cost": 220.0, "tension_only": True, "stiffness": 5.0e4},
+    8: {"name": "Steel", "strength": 2000.0, "max_length": 4.0, "cost": 450.0, "tension_only": False, "stiffness": 3.0e5},
+}
+
+ROAD_TYPE = 1
+WOOD_TYPE = 2
+BASIC_MATERIALS = (ROAD_TYPE, WOOD_TYPE)   # 每一关都解锁的材料 (路面 + 木材)
+HYDRAULIC_TYPE = 4   # 液压杆：rate (活塞伸缩量) 是设计的一部分
+
+
+def material_name(edge_type):
+    """返回材料名称，未知类型返回 'Unknown(<type>)'"""
+    mat = MATERIALS.get(edge_type)
+    return mat["name"] if mat else f"Unknown({edge_type})"
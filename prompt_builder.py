@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+# ================= 稳定前缀的 prompt 组装 =================
+# 网关 / 服务端的 prompt 缓存只对 "逐字节相同的前缀" 生效。
+# 规则、材料表、Schema、few-shot 全部放进一个固定不变的 system 消息，
+# 关卡相关的内容 (初始存档、截图) 只追加在最后一条 user 消息里。
+# prefix_hash 用于在日志里确认前缀确实没有变化；支持的模型会额外带上 cache_control 提示。
+
+DEFAULT_TASK_TEMPLATE = "Please design the bridge. Here is the initial save code for reference:\n```json\n{initial_save_code}\n```"
+
+# auto：仅对已知支持显式缓存标记的模型 (Anthropic Claude 系列) 添加 cache_control；on / off 强制开关
+CACHE_HINTS = os.getenv("PROMPT_CACHE_HINTS", "auto").lower()
+CACHE_HINT_MODEL_PREFIXES = ("claude", "anthropic/")
+
+
+class PromptBuilder:
+    """
+    static_prefix：固定不变的 system prompt (不得含任何占位符)；
+    task_template：关卡相关的 user 文本模板，只允许使用 {initial_save_code}。
+    """
+
+    def __init__(self, static_prefix, task_template=DEFAULT_TASK_TEMPLATE, image_mime="image/png", cache_hints=CACHE_HINTS):
+        if "{initial_save_code}" in static_prefix or "{picture}" in static_prefix:
+            raise ValueError("静态前缀中不能包含关卡相关的占位符")
+        self.static_prefix = static_prefix
+        self.task_template = task_template
+        self.image_mime = image_mime
+        self.cache_hints = cache_hints
+        self.prefix_hash = hashlib.sha256(static_prefix.encode('utf-8')).hexdigest()[:16]
+
+    def supports_cache_hints(self, model):
+        if self.cache_hints == "on":
+            return True
+        if self.cache_hints == "off" or not model:
+            return False
+        return model.lower().startswith(CACHE_HINT_MODEL_PREFIXES)
+
+    def system_message(self, model=None):
+        """固定的 system 消息；支持的模型在前缀末尾打上 cache_control 断点"""
+        if not self.supports_cache_hints(model):
+            return {"role": "system", "content": self.static_prefix}
+        return {
+            "role": "system",
+            "content": [{"type": "text", "text": self.static_prefix, "cache_control": {"type": "ephemeral"}}],
+        }
+
+    def task_message(self, base64_image, initial_save_code):
+        """关卡相关的 user 消息 (文本在前、截图在后)，放在整个请求的最末尾"""
+        content = [{"type": "text", "text": self.task_template.format(initial_save_code=initial_save_code.strip())}]
+        if base64_image:
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:{self.image_mime};base64,{base64_image}"}
+            })
+        return {"role": "user", "content": content}
+
+    def build_messages(self, base64_image, initial_save_code, model=None):
+        return [self.system_message(model), self.task_message(base64_image, initial_save_code)]
+
+    def describe(self):
+        return f"静态前缀 hash={self.prefix_hash}，{len(self.static_prefix)} 字符"
@@ -0,0 +1,201 @@
+import base64
+import json
+import os
+
+from json_recovery import recover_topology
+from llm_metrics import count_text_tokens, estimate_message_tokens
+from materials import material_name
+from tool import cut_pic
+
+# ================= 多轮修正会话 =================
+# 设计失败后不再从头重发整段 prompt + 全屏截图，而是在同一会话里追加一条紧凑的反馈
+# (违规杆件 id、超载杆件、回放缩略图)，让模型只针对问题改图。
+# 历史里的助手回答只保留去掉 thought_process 的紧凑 JSON；首轮之后的截图换成一句占位文字，
+# system prompt 保持字节不变，方便网关做前缀缓存。每轮按 llm_metrics 的 tiktoken 估算输入 / 输出 token，超出预算即停止。
+
+DEFAULT_MAX_ITERATIONS = int(os.getenv("REFINE_MAX_ITERATIONS", "3"))
+DEFAULT_TOKEN_BUDGET = int(os.getenv("REFINE_TOKEN_BUDGET", "60000"))
+MAX_FEEDBACK_ITEMS = 8          # 每类反馈最多列出的条目数
+MAX_RAW_REPLY_CHARS = 2000      # 无法解析的回答在历史中保留的最大长度
+THUMBNAIL_MAX_SIDE = 256
+THUMBNAIL_COUNT = int(os.getenv("REFINE_THUMBNAILS", "4"))   # 游戏内失败时随反馈发送的回放关键帧数
+
+IMAGE_PLACEHOLDER = "[The level screenshot was attached in the first turn and is omitted here.]"
+
+
+def make_thumbnails(image_paths, max_side=THUMBNAIL_MAX_SIDE):
+    """把回放关键帧缩成小图 (JPEG base64)，用于随反馈一起发送"""
+    from PIL import Image
+
+    thumbnails = []
+    for path in image_paths:
+        with Image.open(path) as image:
+            data = cut_pic.encode_image(cut_pic.downscale(image.convert("RGB"), max_side), "JPEG")
+        thumbnails.append(base64.b64encode(data).decode("utf-8"))
+    return thumbnails
+
+
+def replay_thumbnails(frames_dir, count=THUMBNAIL_COUNT, failure_time=None, max_side=THUMBNAIL_MAX_SIDE):
+    """
+    从回放帧目录 (tool/gif_frames.py 写出的 frames.json) 中均匀挑出最多 count 帧做成缩略图，
+    给出 failure_time 时保证离失败时刻最近的一帧在内；没有 frames.json 的早期目录按 frame_<n>.jpg 顺序取帧
+    """
+    index_path = os.path.join(frames_dir, "frames.json")
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            frames = json.load(f)["frames"]
+    else:
+        names = sorted((n for n in os.listdir(frames_dir) if n.startswith("frame_") and n.endswith(".jpg")),
+                       key=lambda n: int(n[len("frame_"):-len(".jpg")]))
+        frames = [{"path": n, "time": float(i)} for i, n in enumerate(names)]
+    if not frames or count <= 0:
+        return []
+    k = min(count, len(frames))
+    picked = sorted({round(i * (len(frames) - 1) / max(k - 1, 1)) for i in range(k)})
+    if failure_time is not None:
+        nearest = min(range(len(frames)), key=lambda i: abs(frames[i]["time"] - failure_time))
+        if nearest not in picked:
+            picked[min(range(len(picked)), key=lambda k: abs(picked[k] - nearest))] = nearest
+            picked.sort()
+    return make_thumbnails([os.path.join(frames_dir, frames[i]["path"]) for i in picked], max_side)
+
+
+def describe_replay(result):
+    """把 tool/replay_score.py 的判定结果写成一句英文说明，作为 build_feedback 的 simulation_note"""
+    if result.get("success"):
+        return "the vehicle reached the far side."
+    parts = ["the bridge collapsed" if result.get("collapsed") else "the vehicle did not reach the far side"]
+    if result.get("failure_time") is not None:
+        parts.append(f"failure at {result['failure_time']:.1f}s")
+    if result.get("members_lost"):
+        parts.append(f"about {result['members_lost'] * 100:.0f}% of the members were lost")
+    return ", ".join(parts) + ". The attached frames show where it failed."
+
+
+def describe_budget(report):
+    """把 main2.optimize_design 的超预算结果写成一句英文说明，作为 build_feedback 的 cost_note"""
+    return (f"total cost ${report['cost']:.0f} exceeds the level budget ${report['budget']:.0f}. "
+            "Use cheaper materials (wood instead of steel where the member is short enough) or fewer members.")
+
+
+def _format_violations(violations):
+    lines = [f"- {v['code']} (id {v['id']}): {v['message']}" for v in violations[:MAX_FEEDBACK_ITEMS]]
+    if len(violations) > MAX_FEEDBACK_ITEMS:
+        lines.append(f"- ... and {len(violations) - MAX_FEEDBACK_ITEMS} more")
+    return lines
+
+
+def _format_prescreen(report):
+    if report.get("max_utilisation") is None:
+        return [f"- static check failed: {report.get('reason')}"]
+    overloaded = sorted((m for m in report["members"] if m["utilisation"] > 1.0),
+                        key=lambda m: m["utilisation"], reverse=True)
+    lines = [f"- edge {m['id']} ({material_name(m['type'])}, {m['length']:.2f} m): "
+             f"force {m['force']:+.0f}, utilisation {m['utilisation']:.2f}"
+             for m in overloaded[:MAX_FEEDBACK_ITEMS]]
+    if len(overloaded) > MAX_FEEDBACK_ITEMS:
+        lines.append(f"- ... and {len(overloaded) - MAX_FEEDBACK_ITEMS} more overloaded edges")
+    return lines
+
+
+def build_feedback(violations=None, prescreen_report=None, parse_error=None, simulation_note=None, thumbnails=None,
+                   cost_note=None):
+    """
+    把一次失败的原因整理成一条紧凑的 user 消息：
+    解析错误 / 规则违规 / 静力预筛中超载的杆件 (拉为正、压为负) / 超出预算 / 模拟结果说明 + 回放缩略图。
+    """
+    lines = ["Your previous design was rejected. Keep everything that works, fix only the issues below, "
+             "and reply with the complete corrected JSON object in the same format."]
+    if parse_error:
+        lines += ["", "Parse error:", f"- {parse_error.splitlines()[0][:300]}"]
+    if violations:
+        lines += ["", "Rule violations:"] + _format_violations(violations)
+    if prescreen_report and not prescreen_report.get("passed"):
+        lines += ["", "Static check (overloaded edges, tension positive):"] + _format_prescreen(prescreen_report)
+    if cost_note:
+        lines += ["", f"Cost: {cost_note}"]
+    if simulation_note:
+        lines += ["", f"Simulation: {simulation_note}"]
+
+    text = "\n".join(lines)
+    if not thumbnails:
+        return {"role": "user", "content": text}
+    content = [{"type": "text", "text": text + "\n\nReplay frames of the failed run:"}]
+    content += [{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}} for b64 in thumbnails]
+    return {"role": "user", "content": content}
+
+
+def compact_reply(raw_response):
+    """助手回答写入历史前先压缩：能解析就只保留紧凑的 nodes / edges JSON，否则截断原文"""
+    topology, _ = recover_topology(raw_response)
+    if topology and "nodes" in topology and "edges" in topology:
+        return json.dumps({"nodes": topology["nodes"], "edges": topology["edges"]}, separators=(',', ':'))
+    return raw_response[:MAX_RAW_REPLY_CHARS]
+
+
+def _strip_images(message):
+    """把 user 消息里的图片换成占位文字 (首轮截图只发一次)"""
+    content = message["content"]
+    if isinstance(content, str):
+        return message
+    parts = [part for part in content if part.get("type") != "image_url"]
+    if len(parts) != len(content):
+        parts.append({"type": "text", "text": IMAGE_PLACEHOLDER})
+    return dict(message, content=parts)
+
+
+class RefinementSession:
+    """
+    维护多轮修正的会话状态与预算。
+    initial_messages：首轮完整的 system + user(文本 + 截图) 消息；
+    history_turns：历史中保留最近几轮 (助手回答 + 反馈)，更早的轮次直接丢弃。
+    """
+
+    def __init__(self, initial_messages, max_iterations=DEFAULT_MAX_ITERATIONS,
+                 token_budget=DEFAULT_TOKEN_BUDGET, history_turns=1, keep_image=False):
+        self.initial_messages = list(initial_messages)
+        self.max_iterations = max_iterations
+        self.token_budget = token_budget
+        self.history_turns = history_turns
+        self.keep_image = keep_image
+        self.turns = []            # [(assistant message, feedback message)]
+        self.iterations = []       # 每轮 {"input_tokens", "output_tokens", "elapsed"}
+        self.tokens_used = 0
+        self._pending_reply = None
+
+    @property
+    def messages(self):
+        """本轮要发送的消息列表"""
+        if not self.turns:
+            return self.initial_messages
+        base = self.initial_messages if self.keep_image else [_strip_images(m) for m in self.initial_messages]
+        recent = self.turns[-self.history_turns:] if self.history_turns > 0 else []
+        return base + [m for turn in recent for m in turn]
+
+    def can_continue(self):
+        """轮数与 token 预算都还有余量 (按本轮输入的估算值预判)"""
+        if len(self.iterations) >= self.max_iterations:
+            return False
+        return self.tokens_used + estimate_message_tokens(self.messages) <= self.token_budget
+
+    def record_reply(self, raw_response, elapsed, input_tokens=None):
+        """记录本轮的回答、耗时与 token 数"""
+        input_tokens = input_tokens if input_tokens is not None else estimate_message_tokens(self.messages)
+        output_tokens = count_text_tokens(raw_response)
+        self.tokens_used += input_tokens + output_tokens
+        self.iterations.append({"input_tokens": input_tokens, "output_tokens": output_tokens, "elapsed": elapsed})
+        self._pending_reply = {"role": "assistant", "content": compact_reply(raw_response)}
+        return self.iterations[-1]
+
+    def add_feedback(self, feedback_message):
+        """把上一轮的回答和本轮反馈一起追加进历史"""
+        self.turns.append((self._pending_reply, feedback_message))
+        self._pending_reply = None
+
+    def summary(self):
+        return {
+            "iterations": len(self.iterations),
+            "tokens_used": self.tokens_used,
+            "token_budget": self.token_budget,
+            "elapsed": sum(it["elapsed"] for it in self.iterations),
+        }
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from bridge_design import as_objects
+from tool.codec import encode_json_string
+
+# ================= 单次序列化的存档写出流水线 =================
+# 设计只 dumps 一次 (紧凑格式)，同一份字符串既作为归档 JSON，又直接在内存中加密；
+# 归档副本与游戏存档槽并行写出，游戏存档槽通过 "临时文件 + rename" 原子替换，
+# 保证游戏永远不会读到写了一半的存档。
+
+GEN_DIR = "gen"
+SAVE_SLOT_NAME = "0"
+
+_executor = None
+
+
+def _get_executor():
+    """全局复用的写盘线程池 (每个候选都要写存档，没必要每次新建)"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="save-writer")
+    return _executor
+
+
+def write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+def atomic_write_text(path, text):
+    """先写同目录下的临时文件并 fsync，再 os.replace 原子替换目标文件"""
+    target_dir = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def write_design_files(design_data, timestamp, game_save_dir=None, gen_dir=GEN_DIR, pretty=False):
+    """
+    把设计写成 gen/<timestamp>/<timestamp>.json 与 gen/<timestamp>/0，
+    若给出 game_save_dir 则同时原子写入游戏存档槽 <game_save_dir>/0。
+    pretty=True 时归档 JSON 额外按 indent=4 输出 (需要再序列化一次，仅供人工排查时使用)。
+    返回 {"json": 路径, "encoded": 路径, "game_slot": 路径或 None}
+    """
+    save_data = as_objects(design_data)
+    compact_json = json.dumps(save_data, separators=(',', ':'))
+    encoded_data = encode_json_string(compact_json)
+    archive_json = json.dumps(save_data, indent=4) if pretty else compact_json
+
+    save_dir = os.path.join(gen_dir, timestamp)
+    os.makedirs(save_dir, exist_ok=True)
+    if game_save_dir is not None:
+        os.makedirs(game_save_dir, exist_ok=True)
+
+    executor = _get_executor()
+    json_future = executor.submit(write_text, os.path.join(save_dir, f"{timestamp}.json"), archive_json)
+    encoded_future = executor.submit(write_text, os.path.join(save_dir, SAVE_SLOT_NAME), encoded_data)
+    slot_future = None
+    if game_save_dir is not None:
+        slot_future = executor.submit(atomic_write_text, os.path.join(game_save_dir, SAVE_SLOT_NAME), encoded_data)
+
+    return {
+        "json": json_future.result(),
+        "encoded": encoded_future.result(),
+        "game_slot": slot_future.result() if slot_future is not None else None,
+    }
@@ -0,0 +1,212 @@
+import json
+import time
+
+from materials import MATERIALS, NODE_TYPE
+
+# ================= 流式输出的增量解析与提前中止 =================
+# 模型逐 token 返回时，逐字符推进一个只关心 "nodes" / "edges" 两个数组的 JSON 状态机：
+# 每当数组里的一个元素 {...} 闭合就立刻解析并校验，发现不可挽回的错误
+# (禁用材料、type 0 的杆件、引用不存在的节点) 就马上停止读取，连带取消请求。
+# 单个元素的语法小错 (尾逗号、Python 字面量等) 不算致命：先用 json_recovery 修复，修不好的跳过并记录。
+
+
+class IncrementalTopologyParser:
+    """
+    feed(chunk) 返回本次新完成的事件列表：
+    ("node", dict) / ("edge", dict) / ("nodes_end", None) / ("edges_end", None) /
+    ("bad_item", ("node" 或 "edge", 原始文本))
+    第一个 '{' 之前的文字 (例如多余的说明、```json 标记) 会被忽略。
+    """
+
+    SECTIONS = ("nodes", "edges")
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._started = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+        self._pending_key = None
+        self._section = None
+        self._section_depth = 0
+        self._item_start = None
+
+    def feed(self, chunk):
+        self.text += chunk
+        events = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if not self._started:
+                if c != '{':
+                    continue
+                self._started = True
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:i]
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ':':
+                if self._stack and self._stack[-1] == '{':
+                    self._pending_key = self._last_string
+                self._last_string = None
+            elif c == ',':
+                self._pending_key = None
+                self._last_string = None
+            elif c in '{[':
+                if c == '[' and len(self._stack) == 1 and self._pending_key in self.SECTIONS:
+                    self._section = self._pending_key
+                    self._section_depth = 2
+                self._stack.append(c)
+                if c == '{' and self._section and len(self._stack) == self._section_depth + 1:
+                    self._item_start = i
+                self._pending_key = None
+            elif c in '}]':
+                if self._section:
+                    if c == '}' and len(self._stack) == self._section_depth + 1 and self._item_start is not None:
+                        raw = text[self._item_start:i + 1]
+                        try:
+                            events.append((self._section[:-1], json.loads(raw)))
+                        except json.JSONDecodeError:
+                            events.append(("bad_item", (self._section[:-1], raw)))
+                        self._item_start = None
+                    elif c == ']' and len(self._stack) == self._section_depth:
+                        events.append((f"{self._section}_end", None))
+                        self._section = None
+                if self._stack:
+                    self._stack.pop()
+                self._pending_key = None
+        self._pos = len(text)
+        return events
+
+
+def _fatal(code, obj_id, message):
+    return {"code": code, "id": obj_id, "message": message}
+
+
+class StreamingTopologyChecker:
+    """
+    逐个校验流式到达的节点 / 杆件，返回致命违规 (dict) 或 None。
+    allowed_types：本关已解锁的材料类型，默认是材料表里的全部类型。
+    杆件先于节点数组结束到达时，锚点检查延迟到 nodes_end 再做。
+    """
+
+    def __init__(self, allowed_types=None):
+        self.allowed_types = set(allowed_types) if allowed_types else set(MATERIALS)
+        self.node_ids = set()
+        self.nodes_closed = False
+        self._deferred_edges = []
+
+    def check_node(self, node):
+        if not isinstance(node, dict) or not all(k in node for k in ("id", "x", "y")):
+            return _fatal("bad_node", node.get("id") if isinstance(node, dict) else None, f"节点缺少 id/x/y 字段: {node}")
+        self.node_ids.add(node["id"])
+        return None
+
+    def _check_anchors(self, edge):
+        for key in ("anchorAID", "anchorBID"):
+            if edge[key] not in self.node_ids:
+                return _fatal("dangling_anchor", edge["id"], f"物体 ID {edge['id']} 引用了不存在的锚点 {edge[key]}。")
+        return None
+
+    def check_edge(self, edge):
+        if not isinstance(edge, dict) or not all(k in edge for k in ("id", "type", "anchorAID", "anchorBID")):
+            return _fatal("bad_edge", edge.get("id") if isinstance(edge, dict) else None, f"杆件缺少必要字段: {edge}")
+        if edge["type"] == NODE_TYPE:
+            return _fatal("type0_edge", edge["id"], f"物体 ID {edge['id']} 的杆件类型为 0 (节点专用类型)。")
+        if edge["type"] not in self.allowed_types:
+            return _fatal("forbidden_material", edge["id"], f"物体 ID {edge['id']} 使用了未解锁或未知的材料类型 {edge['type']}。")
+        if not self.nodes_closed:
+            self._deferred_edges.append(edge)
+            return None
+        return self._check_anchors(edge)
+
+    def close_nodes(self):
+        self.nodes_closed = True
+        for edge in self._deferred_edges:
+            violation = self._check_anchors(edge)
+            if violation:
+                return violation
+        self._deferred_edges = []
+        return None
+
+
+def consume_topology_stream(deltas, allowed_types=None):
+    """
+    消费文本增量迭代器 (例如 LLMHandler_inf.iter_completion)，边收边解析边校验。
+    遇到致命违规时关闭迭代器 (从而取消 HTTP 请求) 并立即返回；无法直接解析的元素先尝试 json_recovery 修复，
+    修好的记入 repaired_items，修不好的记入 skipped_items 并继续读取。
+    返回 {"text", "nodes", "edges", "aborted", "violation", "repaired_items", "skipped_items", "metrics"}，aborted 表示中途提前终止；
+    metrics 含 time_to_first_token / time_to_first_node / time_to_first_edge / elapsed (秒) 与 chars。
+    """
+    from json_recovery import EDGE_KEYS, NODE_KEYS, recover_json  # json_recovery 依赖本模块，这里延迟导入
+
+    parser = IncrementalTopologyParser()
+    checker = StreamingTopologyChecker(allowed_types)
+    nodes, edges, repaired, skipped = [], [], [], []
+    metrics = {"time_to_first_token": None, "time_to_first_node": None, "time_to_first_edge": None}
+    violation = None
+    started = time.perf_counter()
+
+    try:
+        for delta in deltas:
+            now = time.perf_counter() - started
+            if metrics["time_to_first_token"] is None:
+                metrics["time_to_first_token"] = now
+            for kind, item in parser.feed(delta):
+                if kind == "bad_item":
+                    kind, raw = item
+                    item, repairs = recover_json(raw)
+                    # 修复时截掉了必填字段的 (例如 "x": 后面缺值) 同样跳过，不当作缺字段的致命错误
+                    if not isinstance(item, dict) or not all(k in item for k in (NODE_KEYS if kind == "node" else EDGE_KEYS)):
+                        skipped.append(raw)
+                        continue
+                    repaired.append({"raw": raw, "repairs": repairs})
+                if kind == "node":
+                    if metrics["time_to_first_node"] is None:
+                        metrics["time_to_first_node"] = now
+                    nodes.append(item)
+                    violation = checker.check_node(item)
+                elif kind == "edge":
+                    if metrics["time_to_first_edge"] is None:
+                        metrics["time_to_first_edge"] = now
+                    edges.append(item)
+                    violation = checker.check_edge(item)
+                elif kind == "nodes_end":
+                    violation = checker.close_nodes()
+                if violation:
+                    break
+            if violation:
+                break
+    finally:
+        if hasattr(deltas, "close"):
+            deltas.close()
+
+    aborted = violation is not None
+    if violation is None and not checker.nodes_closed:
+        violation = checker.close_nodes()
+
+    metrics["elapsed"] = time.perf_counter() - started
+    metrics["chars"] = len(parser.text)
+    return {
+        "text": parser.text,
+        "nodes": nodes,
+        "edges": edges,
+        "aborted": aborted,
+        "violation": violation,
+        "repaired_items": repaired,
+        "skipped_items": skipped,
+        "metrics": metrics,
+    }
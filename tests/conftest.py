@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 仓库的模块都放在根目录，测试直接按根目录导入
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,108 @@
+import asyncio
+import functools
+import json
+
+import pytest
+
+import main2
+import truss_generator
+from config import DEFAULT_INITIAL_CODE
+
+
+class StubHandler:
+    """按 cache_sample (候选序号) 返回预设回答的 LLM Handler：replies[i] = (延迟秒数, 回答文本或异常)"""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.started, self.finished, self.cancelled = [], [], []
+
+    async def aget_completion(self, messages, temperature, model, cache_sample):
+        delay, reply = self.replies[cache_sample]
+        self.started.append(cache_sample)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(cache_sample)
+            raise
+        self.finished.append(cache_sample)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+@pytest.fixture(scope="module")
+def passing_reply():
+    best = next(c for c in truss_generator.generate_baselines(DEFAULT_INITIAL_CODE) if c["passed"])
+    return json.dumps({"nodes": best["topology"]["nodes"], "edges": best["topology"]["edges"]})
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """装上 StubHandler，并把归档 / 回放查询换成只记录调用，测试不写 gen/ 也不碰游戏"""
+    def install(replies, **candidate_options):
+        handler = StubHandler(replies)
+        monkeypatch.setattr(main2, "get_handler", lambda: handler)
+        monkeypatch.setattr(main2, "recall_known_outcome", lambda design: None)
+        monkeypatch.setattr(main2, "save_to_layout_file",
+                            lambda design, timestamp, load_into_game=True, **kwargs: handler.saved.append(
+                                (timestamp, load_into_game)))
+        monkeypatch.setattr(main2, "generate_bridge_candidates", functools.partial(
+            main2.generate_bridge_candidates, n_candidates=len(replies), models=["stub"], temperatures=[0.0],
+            **candidate_options))
+        handler.saved = []
+        return handler
+    return install
+
+
+def collect(handler, **options):
+    async def run():
+        return [r async for r in main2.generate_bridge_candidates("img", DEFAULT_INITIAL_CODE, **options)]
+    return asyncio.run(run())
+
+
+def test_candidates_are_yielded_in_completion_order(stub, passing_reply):
+    handler = stub({0: (0.06, passing_reply), 1: (0.0, passing_reply), 2: (0.03, passing_reply)})
+    results = collect(handler)
+    assert [r["index"] for r in results] == [1, 2, 0]
+    assert all(r["design"] is not None and r["error"] is None for r in results)
+
+
+def test_failed_requests_are_reported_not_raised(stub, passing_reply):
+    handler = stub({0: (0.0, RuntimeError("connection reset")), 1: (0.01, "no json at all"), 2: (0.02, passing_reply)})
+    results = {r["index"]: r for r in collect(handler)}
+    assert results[0]["design"] is None and "connection reset" in results[0]["error"]
+    assert results[1]["design"] is None and results[1]["error"]
+    assert results[2]["design"] is not None
+
+
+def test_max_concurrency_limits_requests_in_flight(stub, passing_reply):
+    handler = stub({0: (0.03, passing_reply), 1: (0.0, passing_reply), 2: (0.0, passing_reply)}, max_concurrency=1)
+    results = collect(handler)
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert handler.started == [0, 1, 2]
+
+
+def test_first_passing_candidate_cancels_the_rest(stub, passing_reply):
+    handler = stub({0: (5.0, passing_reply), 1: (0.0, "{\"nodes\": [], \"edges\": []}"), 2: (0.02, passing_reply),
+                    3: (5.0, passing_reply)})
+
+    async def run():
+        winner = await main2.find_first_passing_candidate("img", DEFAULT_INITIAL_CODE, "ts", load_into_game=True)
+        await asyncio.sleep(0)   # 让取消信号送达仍在等待的请求
+        # 在事件循环关闭 (asyncio.run 会取消剩余任务) 之前检查，确认是找到合格设计后主动取消的
+        return winner, sorted(handler.cancelled)
+
+    winner, cancelled = asyncio.run(asyncio.wait_for(run(), timeout=2.0))
+    assert winner["index"] == 2
+    assert cancelled == [0, 3]
+    assert handler.finished == [1, 2]
+    # 空设计只归档不载入，通过的设计载入游戏
+    assert handler.saved == [("ts_c1", False), ("ts_c2", True)]
+
+
+def test_duplicate_candidates_are_screened_once(stub, passing_reply):
+    handler = stub({0: (0.0, "garbage"), 1: (0.01, "{\"nodes\": [{\"id\": 1, \"x\": 0, \"y\": 0}], \"edges\": []}"),
+                    2: (0.02, "{\"nodes\": [{\"id\": 1, \"x\": 0, \"y\": 0}], \"edges\": []}")})
+    winner = asyncio.run(main2.find_first_passing_candidate("img", DEFAULT_INITIAL_CODE, "ts", load_into_game=True))
+    assert winner is None
+    assert handler.saved == [("ts_c1", False)]
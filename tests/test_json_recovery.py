@@ -0,0 +1,84 @@
+import json
+
+from json_recovery import recover_json, recover_objects, recover_topology
+
+NODES = '"nodes":[{"id":1,"x":0,"y":0,"isKinematic":true},{"id":2,"x":4,"y":0,"isKinematic":true},{"id":3,"x":2,"y":1}]'
+EDGE_10 = '{"id":10,"type":2,"anchorAID":1,"anchorBID":3}'
+EDGE_11 = '{"id":11,"type":2,"anchorAID":3,"anchorBID":2}'
+
+
+def test_valid_json_needs_no_repairs():
+    data, repairs = recover_json('{"a": [1, 2]}')
+    assert data == {"a": [1, 2]}
+    assert repairs == []
+
+
+def test_fences_leading_text_and_python_literals():
+    text = 'Here you go:\n```json\n{"ok": True, "missing": None, "items": [1, 2,],}\n```\nHope it helps.'
+    data, repairs = recover_json(text)
+    assert data == {"ok": True, "missing": None, "items": [1, 2]}
+    for repair in ("code_fence", "leading_text", "trailing_text", "python_literals", "trailing_commas"):
+        assert repair in repairs
+
+
+def test_missing_commas_between_objects():
+    data, repairs = recover_json('{"edges": [' + EDGE_10 + '\n' + EDGE_11 + ']}')
+    assert [e["id"] for e in data["edges"]] == [10, 11]
+    assert "missing_commas" in repairs
+
+
+def test_truncated_inside_number_cuts_back_to_a_separator():
+    # 末尾的 anchorBID 只写了一半 (可能是 2 也可能是 23)，不能原样补全
+    text = '{' + NODES + ',"edges":[' + EDGE_10 + ',{"id":11,"type":2,"anchorAID":3,"anchorBID":2'
+    data, repairs = recover_topology(text)
+    assert [e["id"] for e in data["edges"]] == [10]
+    assert "truncated_closed" in repairs
+    assert "dropped_incomplete(1)" in repairs
+
+
+def test_truncated_inside_string():
+    text = '{"thought_process": "I will add a node at the cen'
+    data, repairs = recover_json(text)
+    assert data == {}
+    assert "truncated_closed" in repairs
+
+
+def test_truncated_topology_keeps_complete_items():
+    text = '{' + NODES + ',"edges":[' + EDGE_10 + ',' + EDGE_11
+    data, repairs = recover_topology(text)
+    assert [n["id"] for n in data["nodes"]] == [1, 2, 3]
+    assert [e["id"] for e in data["edges"]] == [10, 11]
+    assert repairs == ["truncated_closed"]
+
+
+def test_truncated_before_edges_salvages_nodes():
+    text = '{' + NODES[:-1] + ',{"id":4,"x":'
+    data, repairs = recover_topology(text)
+    assert [n["id"] for n in data["nodes"]] == [1, 2, 3]
+    assert data["edges"] == []
+
+
+def test_unrecoverable_text():
+    assert recover_json("no json here") == (None, ["no_object"])
+    assert recover_json("") == (None, ["empty_response"])
+
+
+def test_truncated_objects_do_not_create_phantom_nodes():
+    # 截断在节点中间：补括号得到的 {"type":0,"x":5} 没有 id，转换时会变成 id 0 的幽灵节点
+    text = json.dumps({"DisplayName": "Bridge", "Objects": [
+        {"type": 0, "id": 1, "x": 0, "y": 0, "isKinematic": True},
+        {"type": 2, "id": 10, "anchorAID": 1, "anchorBID": 2},
+    ]})[:-2] + ', {"type": 0, "x": 5'
+    raw, _ = recover_json(text)
+    assert any("id" not in obj for obj in raw["Objects"])
+
+    data, repairs = recover_objects(text)
+    assert [obj["id"] for obj in data["Objects"]] == [1, 10]
+    assert "dropped_incomplete(1)" in repairs
+
+
+def test_truncated_objects_drop_edges_without_anchors():
+    text = '{"Objects":[{"type":0,"id":1,"x":0,"y":0},{"type":2,"id":10,"anchorAID":1'
+    data, repairs = recover_objects(text)
+    assert [obj["id"] for obj in data["Objects"]] == [1]
+    assert "dropped_incomplete(1)" in repairs
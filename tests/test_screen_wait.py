@@ -0,0 +1,76 @@
+from PIL import Image
+
+from tool import screen_wait
+from tool.screen_wait import RecordedScreenSource
+
+REGION = (10, 10, 40, 20)
+
+
+def frame(shade):
+    """整屏录制帧：背景为黑色，REGION 内填成 shade 灰度"""
+    image = Image.new("RGB", (120, 60), (0, 0, 0))
+    image.paste((shade, shade, shade), (10, 10, 50, 30))
+    return image
+
+
+def test_recorded_source_advances_and_holds_last_frame():
+    source = RecordedScreenSource([frame(0), frame(255)])
+    assert source.grab(REGION).getpixel((0, 0)) == (0, 0, 0)
+    assert source.grab(REGION).size == (40, 20)
+    assert source.grab().getpixel((20, 20)) == (255, 255, 255)
+    assert source.position == 3
+
+
+def test_wait_for_change_stops_at_first_changed_frame():
+    source = RecordedScreenSource([frame(0), frame(0), frame(0), frame(255)])
+    baseline = screen_wait.snapshot(REGION, source)
+    result = screen_wait.wait_for_change(REGION, baseline, timeout=1.0, interval=0.0, source=source)
+    assert result.ok and result.polls == 3
+    assert result.diff > 0.9
+
+
+def test_wait_for_change_ignores_changes_outside_region():
+    moved = frame(0)
+    moved.paste((255, 255, 255), (80, 40, 120, 60))
+    source = RecordedScreenSource([frame(0), moved])
+    baseline = screen_wait.snapshot(REGION, source)
+    result = screen_wait.wait_for_change(REGION, baseline, timeout=0.05, interval=0.01, source=source)
+    assert not result
+    assert result.polls > 1
+
+
+def test_wait_for_match_against_reference_image():
+    source = RecordedScreenSource([frame(0), frame(100), frame(200)])
+    result = screen_wait.wait_for_match(REGION, frame(200).crop((10, 10, 50, 30)), timeout=1.0, interval=0.0,
+                                        source=source)
+    assert result.ok and result.polls == 3
+
+
+def test_wait_for_transition_waits_for_the_region_to_settle():
+    # 按钮动画：变化 -> 过渡帧 -> 稳定在最终画面
+    source = RecordedScreenSource([frame(0), frame(80), frame(160), frame(255)])
+    baseline = screen_wait.snapshot(REGION, source)
+    result = screen_wait.wait_for_transition(REGION, baseline, timeout=2.0, settle=0.05, source=source)
+    assert result.ok
+    assert source.position > 4
+    assert result.elapsed >= 0.05
+
+
+def test_wait_for_ui_uses_reference_file_when_present(tmp_path):
+    path = screen_wait.capture_reference(REGION, str(tmp_path / "refs" / "button.png"),
+                                         RecordedScreenSource([frame(255)]))
+    assert Image.open(path).size == (40, 20)
+
+    source = RecordedScreenSource([frame(0), frame(128), frame(255)])
+    baseline = screen_wait.snapshot(REGION, source)
+    result = screen_wait.wait_for_ui(REGION, baseline, timeout=1.0, reference=path, source=source)
+    # 中间帧 128 已经变化，但与参考图不一致，要等到 255 才算出现
+    assert result.ok and source.position == 3
+
+
+def test_wait_for_ui_falls_back_to_transition_without_reference(tmp_path):
+    source = RecordedScreenSource([frame(0), frame(255)])
+    baseline = screen_wait.snapshot(REGION, source)
+    result = screen_wait.wait_for_ui(REGION, baseline, timeout=1.0, reference=str(tmp_path / "missing.png"),
+                                     settle=0.05, source=source)
+    assert result.ok
@@ -0,0 +1,81 @@
+from topology_repair import repair_topology
+
+
+def node(node_id, x, y, anchor=False):
+    return {"id": node_id, "x": x, "y": y, "isKinematic": anchor}
+
+
+def edge(edge_id, a, b, edge_type=2):
+    return {"id": edge_id, "type": edge_type, "anchorAID": a, "anchorBID": b}
+
+
+def actions(report):
+    return [change["action"] for change in report]
+
+
+def test_clean_topology_is_unchanged():
+    nodes = [node(1, 0, 0, True), node(2, 2, 0, True), node(3, 1, 1)]
+    edges = [edge(10, 1, 3), edge(11, 3, 2), edge(12, 1, 2, 1)]
+    kept, result, report = repair_topology(nodes, edges)
+    assert kept == nodes and result == edges and report == []
+
+
+def test_coincident_node_merges_into_anchor():
+    nodes = [node(1, 0, 0, True), node(2, 2, 0, True), node(3, 1, 1), node(4, 0.0001, 0)]
+    edges = [edge(10, 4, 3), edge(11, 3, 2), edge(12, 1, 3)]
+    kept, result, report = repair_topology(nodes, edges)
+    assert [n["id"] for n in kept] == [1, 2, 3]
+    # 节点 4 并入锚点 1 后，杆件 10 与杆件 12 端点、材料都相同
+    assert [(e["id"], e["anchorAID"], e["anchorBID"]) for e in result] == [(10, 1, 3), (11, 3, 2)]
+    assert actions(report) == ["merge_node", "duplicate_edge"]
+
+
+def test_duplicate_ids_and_self_loops():
+    nodes = [node(1, 0, 0, True), node(2, 2, 0, True), node(3, 1, 1), node(3, 1, 2), node(5, 1, 1)]
+    edges = [edge(3, 1, 5), edge(11, 5, 3), edge(12, 3, 2)]
+    kept, result, report = repair_topology(nodes, edges)
+    assert [n["id"] for n in kept] == [1, 2, 3]
+    assert [e["anchorAID"] for e in result] == [1, 3]
+    # 杆件 id 3 与节点重复，改为接在最大 id 之后
+    assert [e["id"] for e in result] == [13, 12]
+    assert actions(report) == ["duplicate_node", "merge_node", "self_loop", "reassign_id"]
+
+
+def test_split_reuses_existing_node_at_split_point():
+    # 3m 的木材下弦超长，等分点 (1.5, 0) 上已有节点 3 (由竖杆 11 连到上方节点 4)
+    nodes = [node(1, 0, 0, True), node(2, 3, 0, True), node(3, 1.5, 0), node(4, 1.5, 1)]
+    edges = [edge(10, 1, 2), edge(11, 3, 4), edge(12, 1, 4), edge(13, 4, 2)]
+    kept, result, report = repair_topology(nodes, edges)
+    assert [n["id"] for n in kept] == [1, 2, 3, 4]
+    assert [(e["id"], e["anchorAID"], e["anchorBID"]) for e in result][:2] == [(10, 1, 3), (14, 3, 2)]
+    assert actions(report) == ["split_edge"]
+    assert report[0]["reused_nodes"] == [3] and report[0]["new_nodes"] == []
+
+
+def test_split_drops_segments_that_duplicate_existing_edges():
+    nodes = [node(1, 0, 0, True), node(2, 3, 0, True), node(3, 1.5, 0), node(4, 1.5, 1)]
+    edges = [edge(10, 1, 2), edge(11, 1, 3), edge(12, 3, 4), edge(13, 4, 2)]
+    kept, result, report = repair_topology(nodes, edges)
+    # 第一段 (1, 3) 与杆件 11 重复不再添加，剩下的一段沿用原 id 10
+    assert [(e["id"], e["anchorAID"], e["anchorBID"]) for e in result] == [(10, 3, 2), (11, 1, 3), (12, 3, 4), (13, 4, 2)]
+    assert report[0]["segments"] == [10]
+
+
+def test_crossing_splits_share_one_node():
+    nodes = [node(1, 0, 0, True), node(2, 5, 5, True), node(3, 0, 5, True), node(4, 5, 0, True)]
+    edges = [edge(10, 1, 2, 8), edge(11, 3, 4, 8)]
+    kept, result, report = repair_topology(nodes, edges)
+    assert [n["id"] for n in kept] == [1, 2, 3, 4, 12]
+    assert all(12 in (e["anchorAID"], e["anchorBID"]) for e in result)
+    assert actions(report) == ["split_edge", "split_edge"]
+    assert report[1]["reused_nodes"] == [12]
+
+
+def test_lone_collinear_chain_is_not_reported_as_repaired():
+    nodes = [node(1, 0, 0, True), node(2, 5, 0, True)]
+    edges = [edge(10, 1, 2, 1)]
+    kept, result, report = repair_topology(nodes, edges)
+    assert [(n["id"], n["x"]) for n in kept[2:]] == [(11, 1.666667), (12, 3.333333)]
+    assert [(e["id"], e["anchorAID"], e["anchorBID"]) for e in result] == [(10, 1, 11), (13, 11, 12), (14, 12, 2)]
+    assert actions(report) == ["split_edge_unbraced"]
+    assert report[0]["unbraced_nodes"] == [11, 12]
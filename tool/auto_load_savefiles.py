@@ -1,30 +1,49 @@
-import pyautogui
-import time
+from tool import screen_wait
 
-def load_polybridge_save():
+# 按钮坐标 (1920x1080 全屏)
+SETTINGS_BUTTON = (45, 41)
+LOAD_BUTTON = (39, 112)
+SAVE_SLOT = (1192, 634)
+
+# 每一步的等待上限 = 原来写死的等待时长；界面一响应就继续
+WAIT_TIMEOUTS = {"menu": 0.5, "panel": 1.0, "load": 0.5}
+
+def load_polybridge_save(source=None):
     """
     自动载入 Poly Bridge 的指定存档
+    source：截图来源，默认实时截屏 (见 tool/screen_wait.py)
     """
+    import pyautogui  # 真正操作界面时才导入，导入本模块不需要图形环境
+
     print("开始执行自动载入...")
-    
-    # 步骤 1: 点击左上角的“设置”齿轮
-    pyautogui.click(x=45, y=41)
-    print("-> 已点击设置 (x=45, y=41)")
-    time.sleep(0.5)  # 等待下拉菜单展开
-
-    # 步骤 2: 点击下拉菜单中的“载入”按钮
-    pyautogui.click(x=39, y=112)
-    print("-> 已点击载入 (x=39, y=112)")
-    time.sleep(1.0)  # 等待存档面板完全弹出
-
-    # 步骤 3: 点击“自动存档槽”下方的特定存档
-    pyautogui.click(x=1192, y=634)
-    print("-> 已选中目标存档！ (x=1192, y=634)")
-    time.sleep(0.5)
-    
+
+    # 步骤 1: 点击左上角的“设置”齿轮，等待下拉菜单展开
+    menu_region = screen_wait.region_around(*LOAD_BUTTON)
+    baseline = screen_wait.snapshot(menu_region, source)
+    pyautogui.click(*SETTINGS_BUTTON)
+    print(f"-> 已点击设置 (x={SETTINGS_BUTTON[0]}, y={SETTINGS_BUTTON[1]})")
+    result = screen_wait.wait_for_transition(menu_region, baseline, WAIT_TIMEOUTS["menu"], source=source)
+    screen_wait.log_wait("下拉菜单展开", result, WAIT_TIMEOUTS["menu"])
+
+    # 步骤 2: 点击下拉菜单中的“载入”按钮，等待存档面板完全弹出
+    panel_region = screen_wait.region_around(*SAVE_SLOT)
+    baseline = screen_wait.snapshot(panel_region, source)
+    pyautogui.click(*LOAD_BUTTON)
+    print(f"-> 已点击载入 (x={LOAD_BUTTON[0]}, y={LOAD_BUTTON[1]})")
+    result = screen_wait.wait_for_transition(panel_region, baseline, WAIT_TIMEOUTS["panel"], source=source)
+    screen_wait.log_wait("存档面板弹出", result, WAIT_TIMEOUTS["panel"])
+
+    # 步骤 3: 点击“自动存档槽”下方的特定存档，等待面板关闭、设计载入
+    baseline = screen_wait.snapshot(panel_region, source)
+    pyautogui.click(*SAVE_SLOT)
+    print(f"-> 已选中目标存档！ (x={SAVE_SLOT[0]}, y={SAVE_SLOT[1]})")
+    result = screen_wait.wait_for_transition(panel_region, baseline, WAIT_TIMEOUTS["load"], source=source)
+    screen_wait.log_wait("存档载入", result, WAIT_TIMEOUTS["load"])
+
     print("🎉 载入流程执行完毕！")
 
 if __name__ == "__main__":
+    # 在仓库根目录下以 python -m tool.auto_load_savefiles 运行
     print("⏳ 请在 3 秒内切换回游戏界面...")
-    time.sleep(3)
-    load_polybridge_save()
\ No newline at end of file
+    screen_wait.wait_for_window_switch(3.0)
+    load_polybridge_save()
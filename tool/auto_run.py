@@ -1,71 +1,104 @@
-import pyautogui
-import time
 import os
 import shutil
 import glob
 from datetime import datetime
-from PIL import Image
 
-def run_and_save_replay():
+from tool import screen_wait
+from tool import replay_collector
+from tool import gif_frames
+from tool import replay_score
+
+# 按钮坐标 (1920x1080 全屏)
+SHARE_BUTTON = (1271, 833)
+CONFIRM_BUTTON = (1593, 1078)
+
+# 每一步的等待上限 = 原来写死的等待时长；界面一响应就继续
+WAIT_TIMEOUTS = {"simulation": 8.0, "share": 1.0, "confirm": 5.0, "back": 1.0}
+# 可选的按钮参考截图 (存在时用 "与参考图一致" 判断，比单纯检测变化更不容易被画面里驶过的车辆误触发)；
+# 在结果界面 ("分享回放"按钮可见) 运行 python cli.py run --capture-ref 采集一次即可
+SHARE_BUTTON_REF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ui_refs", "share_button.png")
+# 没有参考图时退化为 "按钮区域变化后稳定 SIMULATION_SETTLE 秒"，稳定时间取得比车辆驶过按钮区域的时间长
+SIMULATION_SETTLE = float(os.getenv("SIMULATION_SETTLE", "1.0"))
+
+
+def capture_share_button_ref(source=None):
+    """在结果界面截取"分享回放"按钮区域，保存为 SHARE_BUTTON_REF，之后的模拟等待改用参考图匹配"""
+    path = screen_wait.capture_reference(screen_wait.region_around(*SHARE_BUTTON), SHARE_BUTTON_REF, source)
+    print(f"📸 已保存分享按钮参考图: {path}")
+    return path
+
+def run_and_save_replay(source=None):
     """
     运行测试，保存回放并返回搭建界面
+    source：截图来源，默认实时截屏 (见 tool/screen_wait.py)
     """
+    import pyautogui  # 真正操作界面时才导入，导入本模块不需要图形环境
+
     print("▶️ 开始运行桥梁测试...")
-    
-    # 1. 空格键开始运行
+    share_region = screen_wait.region_around(*SHARE_BUTTON)
+    confirm_region = screen_wait.region_around(*CONFIRM_BUTTON)
+
+    # 1. 空格键开始运行，等待模拟结束 (“分享回放”按钮出现)
+    baseline = screen_wait.snapshot(share_region, source)
     pyautogui.press('space')
-    print("-> ⌨️ 已按下 [Space] 键，等待 8 秒钟的物理模拟...")
-    time.sleep(8.0)
+    print(f"-> ⌨️ 已按下 [Space] 键，等待物理模拟结束 (最多 {WAIT_TIMEOUTS['simulation']:.0f} 秒)...")
+    if not os.path.exists(SHARE_BUTTON_REF):
+        print(f"   ℹ️ 未找到参考图 {SHARE_BUTTON_REF}，按区域变化 + 稳定 {SIMULATION_SETTLE:.1f}s 判断 "
+              f"(可运行 python cli.py run --capture-ref 采集)")
+    result = screen_wait.wait_for_ui(share_region, baseline, WAIT_TIMEOUTS["simulation"],
+                                     reference=SHARE_BUTTON_REF, settle=SIMULATION_SETTLE, source=source)
+    screen_wait.log_wait("物理模拟", result, WAIT_TIMEOUTS["simulation"])
 
     print("❌ 模拟结束，开始保存回放...")
 
-    # 2. 点击“分享回放”按钮
-    pyautogui.click(x=1271, y=833)
-    print("-> 🎥 已点击分享回放 (1271, 833)")
-    time.sleep(1.0)
+    # 2. 点击“分享回放”按钮，等待确认对话框弹出
+    baseline = screen_wait.snapshot(confirm_region, source)
+    pyautogui.click(*SHARE_BUTTON)
+    print(f"-> 🎥 已点击分享回放 {SHARE_BUTTON}")
+    result = screen_wait.wait_for_transition(confirm_region, baseline, WAIT_TIMEOUTS["share"], source=source)
+    screen_wait.log_wait("确认对话框弹出", result, WAIT_TIMEOUTS["share"])
 
-    # 3. 点击“对钩”确认保存
-    pyautogui.click(x=1593, y=1078)
-    print("-> ✔️ 已点击确认保存 (1593, 1078)，等待 5 秒钟处理视频并写入硬盘...")
-    # 稍微延长了这里的等待时间，确保 GIF 已经完全写入上一级目录中
-    time.sleep(5.0) 
+    # 3. 点击“对钩”确认保存，等待对话框关闭 (视频处理完毕)
+    baseline = screen_wait.snapshot(confirm_region, source)
+    pyautogui.click(*CONFIRM_BUTTON)
+    print(f"-> ✔️ 已点击确认保存 {CONFIRM_BUTTON}，等待视频处理并写入硬盘...")
+    result = screen_wait.wait_for_transition(confirm_region, baseline, WAIT_TIMEOUTS["confirm"], settle=0.3, source=source)
+    screen_wait.log_wait("回放保存", result, WAIT_TIMEOUTS["confirm"])
 
-    # 4. 再次按下空格键返回搭建界面
+    # 4. 再次按下空格键返回搭建界面 (“分享回放”按钮消失)
+    baseline = screen_wait.snapshot(share_region, source)
     pyautogui.press('space')
     print("-> ⌨️ 已按下 [Space] 键返回搭建界面")
-    time.sleep(1.0)
+    result = screen_wait.wait_for_transition(share_region, baseline, WAIT_TIMEOUTS["back"], source=source)
+    screen_wait.log_wait("返回搭建界面", result, WAIT_TIMEOUTS["back"])
     
     print("✅ 回放保存完毕，已成功回到初始状态！")
 
 
-def process_and_extract_gif():
+def process_and_extract_gif(source_gif_path=None, pic_base_dir=None, entry_id=None):
     """
-    找到上一级目录中的最新 GIF，将其移动到同级的 pic 目录中，并抽取 3 帧图像
+    将回放 GIF 移动到上一级的 pic 目录中，抽帧并自动判定通过 / 失败，返回归档目录
+    source_gif_path：ReplayCollector 检测到的本次回放；为空时退化为取 GIF 目录中最新的已写完文件
     """
     print("\n📂 开始处理并抽帧 GIF 回放文件...")
     
-    # 获取当前脚本运行的绝对路径，并推算出上一级目录
-    current_dir = os.path.abspath(os.getcwd())
-    parent_dir = os.path.dirname(current_dir)
-    
-    # 定义上一级目录中的 PolyBridgeGIFs 和 pic 文件夹路径
-    gif_dir = os.path.join(parent_dir, "PolyBridgeGIFs")
-    pic_base_dir = os.path.join(parent_dir, "pic")
-    
-    # 1. 检查上一级的 PolyBridgeGIFs 目录是否存在
-    if not os.path.exists(gif_dir):
-        print(f"⚠️ 找不到目录: {gif_dir}\n请确认当前运行目录的上一级是否存在该文件夹！")
-        return
-        
-    # 查找 GIF 文件
-    gif_files = glob.glob(os.path.join(gif_dir, "*.gif"))
-    
-    if not gif_files:
-        print(f"⚠️ 在 {gif_dir} 中没有找到任何 GIF 文件！可能游戏保存太慢，或者路径不对。")
-        return
-        
-    # 取出该目录下唯一存在的文件
-    source_gif_path = gif_files[0] 
+    # 默认目录：当前运行目录上一级的 PolyBridgeGIFs 和 pic 文件夹
+    gif_dir, default_pic_dir = replay_collector.default_replay_dirs()
+    pic_base_dir = pic_base_dir or default_pic_dir
+
+    if source_gif_path is None:
+        # 1. 检查上一级的 PolyBridgeGIFs 目录是否存在
+        if not os.path.exists(gif_dir):
+            print(f"⚠️ 找不到目录: {gif_dir}\n请确认当前运行目录的上一级是否存在该文件夹！")
+            return
+
+        # 查找已写完的 GIF 文件，按修改时间取最新的一个
+        gif_files = [p for p in glob.glob(os.path.join(gif_dir, "*.gif")) if replay_collector.is_complete_gif(p)]
+        if not gif_files:
+            print(f"⚠️ 在 {gif_dir} 中没有找到任何写完的 GIF 文件！可能游戏保存太慢，或者路径不对。")
+            return
+        source_gif_path = max(gif_files, key=os.path.getmtime)
+
     gif_filename = os.path.basename(source_gif_path)
     
     # 2. 在上一级的 pic 目录下，创建一个以当前时间命名的子目录
@@ -78,35 +111,61 @@ def process_and_extract_gif():
     shutil.move(source_gif_path, target_gif_path)
     print(f"-> 📦 已将原 GIF 移动至: {target_dir}")
     
-    # 4. 开始对移动后的 GIF 进行抽帧操作
+    # 4. 单次流式解码抽帧 (采样模式见 tool/gif_frames.py，默认保留画面变化明显的关键帧)
     try:
-        with Image.open(target_gif_path) as img:
-            total_frames = img.n_frames
-            # 计算我们需要抽取的 3 帧索引：第一帧(0)、最中间一帧、最后一帧
-            indices = [0, total_frames // 2, total_frames - 1]
-            
-            for i, frame_idx in enumerate(indices):
-                img.seek(frame_idx)
-                # 将图像转为 RGB 模式（因为保存为 JPG 不支持透明通道）
-                frame = img.copy().convert("RGB")
-                frame_path = os.path.join(target_dir, f"frame_{i+1}.jpg")
-                frame.save(frame_path, "JPEG")
-                print(f"-> 🖼️ 提取帧 {i+1}/3 (原视频第 {frame_idx} 帧) 保存为: {frame_path}")
-                
+        records = gif_frames.extract_frames(target_gif_path, target_dir)
+        for r in records:
+            print(f"-> 🖼️ 提取帧 {r['frame']}/{len(records)} (原视频第 {r['index']} 帧, {r['time']:.2f}s) 保存为: {r['path']}")
         print("✅ 抽帧并归档流程彻底完成！")
         
     except Exception as e:
         print(f"❌ 抽帧处理时发生错误: {e}")
+        return target_dir
 
+    # 5. 根据抽出的帧自动判定通过 / 失败，结果写入同目录的 score.json
+    try:
+        result = replay_score.score_replay(target_dir)
+        print(f"{'🏁' if result['success'] else '💥'} 回放判定: {replay_score.describe(result)}")
+    except Exception as e:
+        print(f"❌ 回放判定时发生错误: {e}")
+        return target_dir
 
-if __name__ == "__main__":
-    print("⏳ 脚本已启动！请在 3 秒内切换回 Poly Bridge 游戏界面...")
-    time.sleep(3)
+    # 6. 把判定结果记到 gen/ 索引中对应的设计上 (给出 entry_id 时即该设计，否则取回放之前最近一个写入游戏存档槽的设计)
+    try:
+        import design_index
+        index = design_index.default_index()
+        entry_id = index.attach_replay(target_dir, result, at=datetime.now().timestamp(), entry_id=entry_id) if index else None
+        if entry_id:
+            print(f"-> 🗂️ 判定结果已记入设计索引: {entry_id}")
+    except Exception as e:
+        print(f"⚠️ 更新设计索引失败: {e}")
+    return target_dir
+
+
+def run_and_collect(source=None, entry_id=None):
+    """跑测 + 保存回放 + 归档抽帧判定的完整流程，返回归档目录 (未检测到回放时为 None)；entry_id 为当前载入游戏的设计 id"""
+    # 运行前先记下 GIF 目录里已有的文件，之后只认本次运行新写出的回放
+    gif_dir, _ = replay_collector.default_replay_dirs()
+    collector = replay_collector.ReplayCollector(gif_dir).start()
     
     # 阶段 1: 执行运行和保存流程
-    run_and_save_replay()
+    run_and_save_replay(source)
     
-    # 阶段 2: 将保存好的 GIF 进行移动归档并抽取 3 张图片
-    process_and_extract_gif()
+    # 阶段 2: 回放一写完就移动归档、抽帧并判定结果
+    gif_path = collector.wait_for_replay()
+    target_dir = process_and_extract_gif(gif_path, entry_id=entry_id) if gif_path else None
     
-    print("🎉 自动化跑测与录像处理全流程执行完毕！")
\ No newline at end of file
+    print("🎉 自动化跑测与录像处理全流程执行完毕！")
+    return target_dir
+
+
+if __name__ == "__main__":
+    # 在仓库根目录下以 python -m tool.auto_run [capture-ref] 运行
+    import sys
+
+    print("⏳ 脚本已启动！请在 3 秒内切换回 Poly Bridge 游戏界面...")
+    screen_wait.wait_for_window_switch(3.0)
+    if sys.argv[1:2] == ["capture-ref"]:
+        capture_share_button_ref()
+    else:
+        run_and_collect()
@@ -0,0 +1,237 @@
+import base64
+import json
+import os
+import zlib
+
+# ================= Poly Bridge 存档编解码 =================
+# 存档格式：紧凑 JSON -> UTF-8 -> zlib 压缩 -> Base64。
+# 本模块导入时不做任何 I/O，也不导入标准库以外的包；命令行 / 进程池相关的模块在用到时才导入。
+# 大存档可走流式接口 (encode_stream / decode_stream)，按块压缩 / 解压，不必把整份数据同时放在内存里。
+# 命令行用法 (在仓库根目录下)：
+#   python -m tool.codec decode gen              # 把 gen 下每个 */0 解码成同目录的 0.json
+#   python -m tool.codec encode gen/x.json --name 0   # 目标文件已存在时跳过 (例如归档的存档 "0")，--force 覆盖
+#   python -m tool.codec verify gen              # 校验每个存档 解码 -> 编码 -> 解码 后内容不变
+
+CHUNK_SIZE = 1 << 16                 # 流式处理的块大小 (字节)；Base64 按 3 / 4 的倍数切块
+STREAM_THRESHOLD = 4 << 20           # 超过该大小的文件在批量转换时走流式接口
+DEFAULT_PATTERNS = {"decode": "0", "encode": "*.json", "verify": "0"}
+_WHITESPACE = b" \t\r\n"
+
+
+def encode_save(json_obj):
+    """Python 对象 -> 存档字符串"""
+    return encode_json_string(json.dumps(json_obj, separators=(',', ':')))
+
+
+def encode_json_string(json_str):
+    """对已序列化好的紧凑 JSON 字符串直接加密，避免重复 dumps"""
+    return base64.b64encode(zlib.compress(json_str.encode('utf-8'))).decode('utf-8')
+
+
+def decode_to_string(save_str):
+    """存档字符串 -> JSON 文本 (容忍首尾及中间的换行 / 空格)"""
+    if isinstance(save_str, str):
+        save_str = save_str.encode('ascii')
+    clean = save_str.translate(None, _WHITESPACE)
+    return zlib.decompress(base64.b64decode(clean, validate=True)).decode('utf-8')
+
+
+def decode_save(save_str):
+    """存档字符串 -> Python 对象"""
+    return json.loads(decode_to_string(save_str))
+
+
+def verify_roundtrip(save_str):
+    """
+    解码 -> 重新编码 -> 再解码，比较两次得到的对象是否一致。
+    (不直接比较 Base64 文本：游戏使用的压缩参数可能与 zlib 默认值不同，密文不必逐字节相同)
+    返回 (是否一致, 解码得到的对象)
+    """
+    obj = decode_save(save_str)
+    return decode_save(encode_save(obj)) == obj, obj
+
+
+# ================= 流式接口 =================
+
+def encode_stream(src, dst, chunk_size=CHUNK_SIZE):
+    """src：以二进制打开的 JSON 文件；dst：以文本打开的输出文件。返回写出的字符数"""
+    compressor = zlib.compressobj()
+    pending = b""
+    written = 0
+
+    def emit(data, final=False):
+        nonlocal pending, written
+        pending += data
+        cut = len(pending) if final else len(pending) - len(pending) % 3
+        if cut:
+            text = base64.b64encode(pending[:cut]).decode('ascii')
+            dst.write(text)
+            written += len(text)
+            pending = pending[cut:]
+
+    while True:
+        block = src.read(chunk_size)
+        if not block:
+            break
+        emit(compressor.compress(block))
+    emit(compressor.flush(), final=True)
+    return written
+
+
+def decode_stream(src, dst, chunk_size=CHUNK_SIZE):
+    """src：以二进制打开的存档文件；dst：以二进制打开的输出文件。返回写出的字节数"""
+    decompressor = zlib.decompressobj()
+    pending = b""
+    written = 0
+    while True:
+        block = src.read(chunk_size)
+        if not block:
+            break
+        pending += block.translate(None, _WHITESPACE)
+        cut = len(pending) - len(pending) % 4
+        if cut:
+            data = decompressor.decompress(base64.b64decode(pending[:cut], validate=True))
+            dst.write(data)
+            written += len(data)
+            pending = pending[cut:]
+    if pending:
+        raise ValueError("Base64 数据长度不完整")
+    data = decompressor.flush()
+    dst.write(data)
+    written += len(data)
+    if not decompressor.eof:
+        raise ValueError("zlib 数据不完整 (存档可能被截断)")
+    return written
+
+
+# ================= 文件 / 目录树批量转换 =================
+
+def convert_file(src_path, dst_path, direction, indent=None):
+    """单个文件的 编码 / 解码 / 校验；返回结果字典 (供进程池汇总)"""
+    size = os.path.getsize(src_path)
+    if direction == "verify":
+        with open(src_path, 'r', encoding='utf-8') as f:
+            ok, _ = verify_roundtrip(f.read())
+        return {"src": src_path, "dst": None, "ok": ok, "bytes": size}
+
+    os.makedirs(os.path.dirname(os.path.abspath(dst_path)), exist_ok=True)
+    if size > STREAM_THRESHOLD and indent is None:
+        if direction == "encode":
+            with open(src_path, 'rb') as src, open(dst_path, 'w', encoding='utf-8') as dst:
+                encode_stream(src, dst)
+        else:
+            with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+                decode_stream(src, dst)
+    else:
+        with open(src_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if direction == "encode":
+            # 先解析一遍：既校验 JSON 合法，又统一成紧凑格式
+            result = encode_save(json.loads(text))
+        else:
+            result = decode_to_string(text)
+            if indent is not None:
+                result = json.dumps(json.loads(result), indent=indent, ensure_ascii=False)
+        with open(dst_path, 'w', encoding='utf-8') as f:
+            f.write(result)
+    return {"src": src_path, "dst": dst_path, "ok": True, "bytes": size}
+
+
+def _convert_job(job):
+    src_path, dst_path, direction, indent = job
+    try:
+        return convert_file(src_path, dst_path, direction, indent)
+    except Exception as e:
+        return {"src": src_path, "dst": dst_path, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def output_path(src_path, direction, root=None, out_dir=None, name=None):
+    """
+    输出路径：decode 在原文件名后加 .json (gen/x/0 -> gen/x/0.json)，encode 去掉 .json 后缀；
+    name 指定输出文件名 (例如 encode 时写成存档槽 "0")；out_dir 给出时按相对 root 的结构镜像到 out_dir 下。
+    """
+    directory, base = os.path.split(src_path)
+    if name is None:
+        if direction == "decode":
+            name = base + ".json"
+        else:
+            name = base[:-5] if base.lower().endswith(".json") else base + ".sav"
+    if out_dir is not None:
+        relative = os.path.relpath(directory, root) if root else ""
+        directory = os.path.normpath(os.path.join(out_dir, relative))
+    return os.path.join(directory, name)
+
+
+def find_inputs(paths, pattern):
+    """展开输入：文件原样保留；目录下递归匹配文件名 pattern；其余按 glob 展开。返回 [(文件, 根目录)]"""
+    import fnmatch
+    import glob
+
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append((path, os.path.dirname(path)))
+        elif os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(fnmatch.filter(filenames, pattern)):
+                    found.append((os.path.join(dirpath, filename), path))
+        else:
+            found += [(p, os.path.dirname(p)) for p in sorted(glob.glob(path, recursive=True)) if os.path.isfile(p)]
+    return sorted(set(found))
+
+
+def convert_tree(paths, direction, pattern=None, out_dir=None, name=None, indent=None, workers=None, force=False):
+    """
+    批量转换目录树 / 文件列表，多个文件交给进程池并行处理 (只有一个文件或 workers=1 时在当前进程处理)。
+    encode 的目标文件已存在时 (例如 gen/ 下解码出的 0.json 会编码回归档的存档 0) 跳过不写，force=True 时覆盖。
+    返回结果字典列表 (跳过的项带 skipped=True)
+    """
+    pattern = pattern or DEFAULT_PATTERNS[direction]
+    jobs, skipped = [], []
+    for src_path, root in find_inputs(paths, pattern):
+        dst_path = None if direction == "verify" else output_path(src_path, direction, root, out_dir, name)
+        if direction == "encode" and not force and os.path.exists(dst_path):
+            skipped.append({"src": src_path, "dst": dst_path, "ok": True, "skipped": True, "bytes": 0})
+            continue
+        jobs.append((src_path, dst_path, direction, indent))
+
+    if len(jobs) <= 1 or workers == 1:
+        return skipped + [_convert_job(job) for job in jobs]
+
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        return skipped + list(executor.map(_convert_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Poly Bridge 存档编解码 (目录树并行批量转换)")
+    parser.add_argument("direction", choices=("encode", "decode", "verify"))
+    parser.add_argument("paths", nargs="+", help="文件、目录或 glob (例如 'gen/*/0')")
+    parser.add_argument("--pattern", help="目录下要匹配的文件名 (默认 decode/verify 为 0，encode 为 *.json)")
+    parser.add_argument("--out-dir", help="输出到该目录下 (保持相对目录结构)，默认写在原文件旁边")
+    parser.add_argument("--name", help="输出文件名 (例如 encode 时写成存档槽 0)")
+    parser.add_argument("--indent", type=int, help="decode 时格式化 JSON 的缩进")
+    parser.add_argument("--workers", type=int, help="并行进程数，默认 CPU 核数")
+    parser.add_argument("--force", action="store_true", help="encode 时覆盖已存在的目标文件 (默认跳过，避免覆盖归档的存档)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = convert_tree(args.paths, args.direction, args.pattern, args.out_dir, args.name,
+                           args.indent, args.workers, args.force)
+    failed = [r for r in results if not r["ok"]]
+    skipped = [r for r in results if r.get("skipped")]
+    for r in failed:
+        print(f"❌ {r['src']}: {r.get('error', '解码 -> 编码 -> 解码 后内容不一致')}")
+    if skipped:
+        print(f"⏭️ 跳过 {len(skipped)} 个目标已存在的文件 (例如 {skipped[0]['dst']})，需要覆盖请加 --force")
+    elapsed = time.perf_counter() - started
+    print(f"✅ {args.direction}: {len(results) - len(failed) - len(skipped)}/{len(results)} 个文件成功 ({elapsed:.2f}s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,147 @@
+import base64
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+# ================= 截图裁剪 / 缩放 / 单次编码 =================
+# 只保留游戏画面 (桥梁区域) 和左下角材料栏两块区域，缩放到目标尺寸后只编码一次，
+# 同一份字节既用于 base64 上传，也由后台线程原样写盘，不再重复编码。
+# PIL 与写盘线程在用到时才导入 / 创建，只读取 MIME_TYPES 等常量时导入本模块没有开销。
+
+# 区域用相对屏幕的比例表示 (left, top, right, bottom)，与分辨率无关
+DEFAULT_REGIONS = {
+    "play_area": (0.0, 0.05, 1.0, 0.93),   # 去掉顶部菜单栏和底部工具栏
+    "toolbar": (0.0, 0.93, 0.35, 1.0),     # 左下角材料栏，用于判断哪些材料已解锁
+}
+DEFAULT_MAX_SIDE = int(os.getenv("SCREENSHOT_MAX_SIDE", "1280"))
+DEFAULT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "JPEG").upper()
+DEFAULT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "85"))
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp"}
+FORMATS_BY_EXTENSION = {**{ext: fmt for fmt, ext in EXTENSIONS.items()}, ".jpeg": "JPEG"}
+
+_writer = None
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot-writer")
+    return _writer
+
+
+def capture_screen():
+    """全屏截图 (pyautogui 延迟导入，离线处理已有图片时无需图形环境)"""
+    import pyautogui
+    return pyautogui.screenshot()
+
+
+def crop_regions(image, regions=None):
+    """按比例区域裁剪，返回 {区域名: 子图}"""
+    regions = regions or DEFAULT_REGIONS
+    width, height = image.size
+    crops = {}
+    for name, (left, top, right, bottom) in regions.items():
+        box = (round(left * width), round(top * height), round(right * width), round(bottom * height))
+        crops[name] = image.crop(box)
+    return crops
+
+
+def compose_regions(crops):
+    """把多个区域自上而下拼成一张图 (左对齐，背景填黑)，这样只需上传一张图片"""
+    crops = list(crops.values()) if isinstance(crops, dict) else list(crops)
+    if len(crops) == 1:
+        return crops[0]
+    from PIL import Image
+    width = max(c.width for c in crops)
+    height = sum(c.height for c in crops)
+    canvas = Image.new("RGB", (width, height))
+    y = 0
+    for crop in crops:
+        canvas.paste(crop, (0, y))
+        y += crop.height
+    return canvas
+
+
+def downscale(image, max_side=DEFAULT_MAX_SIDE):
+    """等比缩放到最长边不超过 max_side (只缩小不放大)"""
+    scale = max_side / max(image.size)
+    if scale >= 1:
+        return image
+    from PIL import Image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def encode_image(image, fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY):
+    """按指定格式编码一次，返回字节"""
+    fmt = fmt.upper()
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"不支持的图片格式: {fmt}")
+    if fmt in ("JPEG", "WEBP") and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffered = BytesIO()
+    if fmt == "PNG":
+        image.save(buffered, format=fmt, optimize=False)
+    else:
+        image.save(buffered, format=fmt, quality=quality)
+    return buffered.getvalue()
+
+
+def _write_bytes(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def _encode_and_write(path, image, fmt, quality):
+    return _write_bytes(path, encode_image(image, fmt, quality))
+
+
+def capture_for_llm(save_path=None, source=None, regions=None, max_side=DEFAULT_MAX_SIDE,
+                    fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY):
+    """
+    截图 -> 裁剪区域 -> 拼接 -> 缩放 -> 单次编码。
+    source 可传入已有的 PIL 图片 (或图片路径) 代替实时截图；
+    save_path 不为空时在后台线程写盘，路径保持调用方给出的不变：扩展名与上传格式一致时直接写出同一份字节，
+    不一致时 (例如 current_level.png + JPEG 上传) 在写盘线程里按扩展名对应的格式另行编码，不占用上传前的时间。
+    返回 {"base64", "mime", "bytes", "size", "path", "write_future"}
+    """
+    if source is None:
+        image = capture_screen()
+    elif isinstance(source, (str, os.PathLike)):
+        from PIL import Image
+        image = Image.open(source)
+    else:
+        image = source
+
+    image = downscale(compose_regions(crop_regions(image, regions)), max_side)
+    fmt = fmt.upper()
+    data = encode_image(image, fmt, quality)
+
+    path, write_future = None, None
+    if save_path:
+        path = save_path
+        disk_fmt = FORMATS_BY_EXTENSION.get(os.path.splitext(save_path)[1].lower(), fmt)
+        if disk_fmt == fmt:
+            write_future = _get_writer().submit(_write_bytes, path, data)
+        else:
+            write_future = _get_writer().submit(_encode_and_write, path, image, disk_fmt, quality)
+
+    return {
+        "base64": base64.b64encode(data).decode("utf-8"),
+        "mime": MIME_TYPES[fmt],
+        "bytes": len(data),
+        "size": image.size,
+        "path": path,
+        "write_future": write_future,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    src = sys.argv[1] if len(sys.argv) > 1 else "current_level.png"
+    for fmt in ("PNG", "JPEG", "WEBP"):
+        result = capture_for_llm(source=src, fmt=fmt)
+        print(f"{fmt:5s} {result['size']} -> {result['bytes'] / 1024:.1f} KB (base64 {len(result['base64']) / 1024:.1f} KB)")
@@ -1,20 +1,23 @@
-import base64
-import zlib
+from tool.codec import decode_to_string
 
-# 从input.txt读取字符串
-with open('../input.txt', 'r', encoding='utf-8') as f:
-    data_str = f.read().strip()
 
-# 1. Base64 解码
-compressed_data = base64.b64decode(data_str)
-# 2. Zlib 解压
-original_json = zlib.decompress(compressed_data)
+def decode_file(input_path='input.txt', output_path='build.json'):
+    """读取存档字符串，解码成 JSON 文本写入 output_path，返回 JSON 文本"""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        data_str = f.read()
 
-# 解码并写入build.json
-result = original_json.decode('utf-8')
+    # Base64 解码 + Zlib 解压 (见 tool/codec.py)
+    result = decode_to_string(data_str)
 
-print("生成成功！同时输出到build.json中。")
-print(result)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(result)
+    return result
 
-with open('../build.json', 'w', encoding='utf-8') as f:
-    f.write(result)
\ No newline at end of file
+
+if __name__ == "__main__":
+    # 在仓库根目录下以 python -m tool.decode [存档文件] [输出 JSON] 运行，默认 input.txt -> build.json
+    import sys
+
+    result = decode_file(*sys.argv[1:3])
+    print(f"生成成功！同时输出到{sys.argv[2] if len(sys.argv) > 2 else 'build.json'}中。")
+    print(result)
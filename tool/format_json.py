@@ -1,11 +1,19 @@
 import json
 
-# 读取build.json
-with open('build.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
 
-# 格式化并写入build_formatted.json
-with open('build_formatted.json', 'w', encoding='utf-8') as f:
-    json.dump(data, f, indent=2, ensure_ascii=False)
+def format_json_file(input_path='build.json', output_path='build_formatted.json', indent=2):
+    """读取 JSON 文件，格式化后写入 output_path"""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
 
-print("格式化完成！已保存到 build_formatted.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    return output_path
+
+
+if __name__ == "__main__":
+    # python tool/format_json.py [输入 JSON] [输出 JSON]，默认 build.json -> build_formatted.json
+    import sys
+
+    output_path = format_json_file(*sys.argv[1:3])
+    print(f"格式化完成！已保存到 {output_path}")
@@ -0,0 +1,146 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+# ================= 单次流式 GIF 抽帧 =================
+# 按顺序把 GIF 只解码一遍 (不再为了 n_frames / 跳帧反复 seek 重新解码)，边解码边决定是否保留当前帧：
+#   every     每隔 k 帧保留一帧
+#   count     均匀保留固定数量的帧 (先只扫描一遍帧头统计帧数，不解码像素)
+#   keyframes 与上一张保留帧相比变化像素占比超过阈值时保留 (首帧、末帧总是保留)
+# 内存中同时只有当前帧、上一帧和上一张保留帧的缩略签名。多个回放可以交给进程池并行处理。
+
+SAMPLE_MODE = os.getenv("REPLAY_SAMPLE_MODE", "keyframes")
+SAMPLE_EVERY = int(os.getenv("REPLAY_SAMPLE_EVERY", "10"))
+SAMPLE_COUNT = int(os.getenv("REPLAY_SAMPLE_COUNT", "3"))
+KEYFRAME_THRESHOLD = float(os.getenv("REPLAY_KEYFRAME_THRESHOLD", "0.005"))   # 变化像素占比
+PIXEL_DELTA = 0.1               # 灰度差超过该值的像素算作 "变化"
+SIGNATURE_SIZE = (128, 72)      # 车辆在 512x288 的回放里只有十几个像素，签名不能缩得太小
+INDEX_FILE = "frames.json"
+JPEG_QUALITY = 90
+
+
+def _signature(frame):
+    return np.asarray(frame.convert("L").resize(SIGNATURE_SIZE, Image.BILINEAR), dtype=np.float32) / 255.0
+
+
+def change_ratio(a, b):
+    """两个签名之间发生变化的像素占比"""
+    return float(np.mean(np.abs(a - b) > PIXEL_DELTA))
+
+
+def count_frames(gif_path):
+    """只解析帧头统计帧数 (Pillow 的 n_frames 逐帧跳过数据块，不做 LZW 解码)"""
+    with Image.open(gif_path) as img:
+        return getattr(img, "n_frames", 1)
+
+
+def iter_frames(gif_path):
+    """按顺序逐帧产出 (帧序号, 该帧起始时间 秒, RGB 图片)；每帧都是独立副本，可安全保留"""
+    with Image.open(gif_path) as img:
+        elapsed_ms = 0
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            yield index, elapsed_ms / 1000.0, frame.convert("RGB")
+            elapsed_ms += frame.info.get("duration", 0) or 0
+
+
+def iter_sampled_frames(gif_path, mode=SAMPLE_MODE, every=SAMPLE_EVERY, count=SAMPLE_COUNT,
+                        threshold=KEYFRAME_THRESHOLD):
+    """按采样模式流式产出需要保留的帧 (帧序号, 时间, 图片)"""
+    if mode == "every":
+        step = max(1, every)
+        pending = None
+        for index, t, frame in iter_frames(gif_path):
+            if index % step == 0:
+                pending = None
+                yield index, t, frame
+            else:
+                pending = (index, t, frame)
+        if pending is not None:
+            yield pending  # 末帧 (最终状态) 总是保留
+    elif mode == "count":
+        total = count_frames(gif_path)
+        wanted = set(np.linspace(0, total - 1, num=min(max(1, count), total)).round().astype(int).tolist())
+        for index, t, frame in iter_frames(gif_path):
+            if index in wanted:
+                yield index, t, frame
+    elif mode == "keyframes":
+        kept_signature, previous = None, None
+        for index, t, frame in iter_frames(gif_path):
+            sig = _signature(frame)
+            if kept_signature is None or change_ratio(sig, kept_signature) > threshold:
+                kept_signature, previous = sig, None
+                yield index, t, frame
+            else:
+                previous = (index, t, frame)
+        if previous is not None:
+            yield previous
+    else:
+        raise ValueError(f"未知的采样模式: {mode}")
+
+
+def extract_frames(gif_path, out_dir, mode=SAMPLE_MODE, every=SAMPLE_EVERY, count=SAMPLE_COUNT,
+                   threshold=KEYFRAME_THRESHOLD):
+    """
+    抽帧并保存为 out_dir/frame_<n>.jpg (n 从 1 开始)，同时写出 frames.json 索引 (帧序号、时间、文件名)。
+    返回索引列表 [{"frame", "index", "time", "path"}]
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    records = []
+    for n, (index, t, frame) in enumerate(iter_sampled_frames(gif_path, mode, every, count, threshold), start=1):
+        path = os.path.join(out_dir, f"frame_{n}.jpg")
+        frame.save(path, "JPEG", quality=JPEG_QUALITY)
+        records.append({"frame": n, "index": index, "time": round(t, 3), "path": path})
+
+    with open(os.path.join(out_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"source": os.path.basename(gif_path), "mode": mode,
+                   "frames": [dict(r, path=os.path.basename(r["path"])) for r in records]}, f, indent=2)
+    return records
+
+
+def _extract_job(job):
+    gif_path, out_dir, options = job
+    try:
+        return gif_path, extract_frames(gif_path, out_dir, **options), None
+    except Exception as e:
+        return gif_path, None, f"{type(e).__name__}: {e}"
+
+
+def extract_many(jobs, max_workers=None, **options):
+    """
+    用进程池并行处理多个回放：jobs 为 [(gif_path, out_dir)]，options 透传给 extract_frames。
+    返回 {gif_path: 索引列表或错误信息}
+    """
+    results = {}
+    tasks = [(gif_path, out_dir, options) for gif_path, out_dir in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for gif_path, records, error in executor.map(_extract_job, tasks):
+            results[gif_path] = records if error is None else error
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="单次流式抽取 GIF 回放帧 (多个回放并行处理)")
+    parser.add_argument("inputs", nargs="+", help="GIF 文件或包含 GIF 的目录")
+    parser.add_argument("--mode", choices=("every", "count", "keyframes"), default=SAMPLE_MODE)
+    parser.add_argument("--every", type=int, default=SAMPLE_EVERY)
+    parser.add_argument("--count", type=int, default=SAMPLE_COUNT)
+    parser.add_argument("--threshold", type=float, default=KEYFRAME_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    gifs = []
+    for item in args.inputs:
+        gifs += sorted(glob.glob(os.path.join(item, "**", "*.gif"), recursive=True)) if os.path.isdir(item) else [item]
+    jobs = [(g, os.path.join(os.path.dirname(g), os.path.splitext(os.path.basename(g))[0] + "_frames")) for g in gifs]
+    results = extract_many(jobs, args.workers, mode=args.mode, every=args.every, count=args.count, threshold=args.threshold)
+    for gif_path, records in results.items():
+        if isinstance(records, str):
+            print(f"❌ {gif_path}: {records}")
+        else:
+            print(f"🖼️ {gif_path}: 保留 {len(records)} 帧 -> {os.path.dirname(records[0]['path']) if records else '-'}")
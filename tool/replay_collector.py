@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ================= 基于目录监听的回放收集 =================
+# 运行前先记下 GIF 目录里已有的文件，之后只认本次运行新出现的 GIF，
+# 并等到文件大小稳定且以 GIF 结束符 (0x3B) 结尾才算写完，写完立刻交给后续的移动 / 抽帧。
+# 装了 watchdog 时用系统的文件事件 (inotify / ReadDirectoryChangesW) 唤醒，否则退化为低频轮询目录。
+
+POLL_INTERVAL = float(os.getenv("REPLAY_POLL_INTERVAL", "0.1"))
+STABLE_FOR = float(os.getenv("REPLAY_STABLE_FOR", "0.3"))     # 文件大小保持不变的时长 (秒)
+DEFAULT_TIMEOUT = float(os.getenv("REPLAY_TIMEOUT", "30"))
+GIF_TRAILER = b"\x3b"
+
+_executor = None
+
+
+def default_replay_dirs():
+    """与原流程一致：当前运行目录上一级的 PolyBridgeGIFs 与 pic 目录"""
+    parent_dir = os.path.dirname(os.path.abspath(os.getcwd()))
+    return os.path.join(parent_dir, "PolyBridgeGIFs"), os.path.join(parent_dir, "pic")
+
+
+def _list_gifs(gif_dir):
+    """返回 {文件名: (大小, mtime)}"""
+    gifs = {}
+    try:
+        with os.scandir(gif_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(".gif"):
+                    stat = entry.stat()
+                    gifs[entry.name] = (stat.st_size, stat.st_mtime)
+    except FileNotFoundError:
+        pass
+    return gifs
+
+
+def is_complete_gif(path):
+    """GIF 文件以结束符 0x3B 收尾；写到一半的文件末尾通常还是图像数据"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == GIF_TRAILER
+    except OSError:
+        return False
+
+
+class ReplayCollector:
+    """
+    用法：
+        collector = ReplayCollector(gif_dir)
+        collector.start()              # 在触发保存回放之前调用
+        ...                            # 运行模拟、点击分享 / 确认
+        path = collector.wait_for_replay()
+    """
+
+    def __init__(self, gif_dir, poll_interval=POLL_INTERVAL, stable_for=STABLE_FOR):
+        self.gif_dir = gif_dir
+        self.poll_interval = poll_interval
+        self.stable_for = stable_for
+        self._known = {}
+        self._event = threading.Event()
+        self._observer = None
+
+    def start(self):
+        """记下当前已有的 GIF，并在可用时开始监听目录事件"""
+        self._known = _list_gifs(self.gif_dir)
+        self._event.clear()
+        self._start_observer()
+        return self
+
+    def _start_observer(self):
+        if self._observer is not None or not os.path.isdir(self.gif_dir):
+            return
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return
+
+        event = self._event
+
+        class _Wake(FileSystemEventHandler):
+            def on_any_event(self, _):
+                event.set()
+
+        self._observer = Observer()
+        self._observer.schedule(_Wake(), self.gif_dir, recursive=False)
+        self._observer.start()
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def _new_files(self):
+        """本次运行中新出现 (或被覆盖改写) 的 GIF"""
+        current = _list_gifs(self.gif_dir)
+        return {name: info for name, info in current.items() if self._known.get(name) != info}
+
+    def wait_for_replay(self, timeout=DEFAULT_TIMEOUT):
+        """
+        等待本次运行的新 GIF 写完，返回其路径；超时返回 None。
+        同时出现多个新文件时取最新的一个，其余的记为已知，不会被下一次运行误认。
+        """
+        started = time.perf_counter()
+        candidate, last_size, stable_since = None, None, None
+        try:
+            while time.perf_counter() - started < timeout:
+                new_files = self._new_files()
+                if new_files:
+                    name = max(new_files, key=lambda n: new_files[n][1])
+                    size = new_files[name][0]
+                    now = time.perf_counter()
+                    if name != candidate or size != last_size:
+                        candidate, last_size, stable_since = name, size, now
+                    elif now - stable_since >= self.stable_for and is_complete_gif(os.path.join(self.gif_dir, name)):
+                        self._known.update(_list_gifs(self.gif_dir))
+                        elapsed = time.perf_counter() - started
+                        print(f"-> 🎞️ 检测到回放已写完: {name} ({size / 1024:.0f} KB，等待 {elapsed:.2f}s)")
+                        return os.path.join(self.gif_dir, name)
+                self._event.wait(self.poll_interval)
+                self._event.clear()
+        finally:
+            self.stop()
+        print(f"⚠️ {timeout:.1f}s 内没有在 {self.gif_dir} 中检测到写完的新 GIF")
+        return None
+
+    def submit(self, callback, timeout=DEFAULT_TIMEOUT):
+        """在后台线程里等待回放写完后立即调用 callback(path)，返回 Future (未检测到时 callback 不会被调用)"""
+        global _executor
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="replay-collector")
+
+        def task():
+            path = self.wait_for_replay(timeout)
+            return callback(path) if path else None
+
+        return _executor.submit(task)
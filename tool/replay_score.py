@@ -0,0 +1,180 @@
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+from PIL import Image
+
+# ================= 回放自动判定 (通过 / 失败) =================
+# 对 gif_frames 抽出的帧做向量化分析，整组帧叠成 (N, H, W, 3) 的 uint8 数组一次性处理：
+#   1. 杆件像素：木材 / 钢材在回放里是高饱和的暖色，首帧中这些像素的外接框即桥梁区域；
+#      之后每帧统计剩余的杆件像素占比 (retention) 与整体下沉量，判断是否坍塌 / 杆件消失。
+#   2. 对岸区域：桥梁外接框靠车辆前进方向一侧的一块区域，相邻帧差分检测是否有车辆驶入。
+# 结果写到帧目录下的 score.json，包含 success / failure_time / confidence 等字段。
+
+MEMBER_MIN_RED = 128           # 暖色杆件像素：R 足够高且 R - B 足够大 (木材橙黄、钢材红)
+MEMBER_MIN_RED_BLUE_GAP = 100
+COLLAPSE_RETENTION = 0.5       # 杆件像素剩余不到一半视为坍塌
+MEMBER_LOSS_THRESHOLD = 0.2    # 杆件像素减少超过 20% 视为有杆件断裂消失
+SAG_LIMIT = 0.5                # 杆件像素重心下沉超过桥梁外接框高度的一半视为坍塌
+PIXEL_DELTA = 40               # 相邻帧某像素任一通道差超过该值算作 "运动"
+MOTION_THRESHOLD = 0.04        # 对岸区域运动像素占比超过该值视为车辆驶入
+MIN_FRAMES_FOR_FULL_CONFIDENCE = 5
+SCORE_FILE = "score.json"
+
+
+def load_frames(frames_dir):
+    """读取 frames.json 索引 (没有时按文件名顺序)，返回 (uint8 数组 (N, H, W, 3), 时间列表 秒)"""
+    index_path = os.path.join(frames_dir, "frames.json")
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)["frames"]
+        paths = [os.path.join(frames_dir, e["path"]) for e in entries]
+        times = [e.get("time") for e in entries]
+    else:
+        paths = sorted(glob.glob(os.path.join(frames_dir, "frame_*.jpg")),
+                       key=lambda p: int(re.search(r"frame_(\d+)", p).group(1)))
+        times = [None] * len(paths)
+    frames = []
+    for path in paths:
+        with Image.open(path) as img:
+            frames.append(np.asarray(img.convert("RGB")))
+    if not frames:
+        raise ValueError(f"{frames_dir} 中没有可用的帧")
+    return np.stack(frames), times
+
+
+def member_masks(frames):
+    """(N, H, W) 布尔数组：每帧中疑似杆件 (暖色高饱和) 的像素"""
+    r = frames[..., 0].astype(np.int16)
+    b = frames[..., 2].astype(np.int16)
+    return (r >= MEMBER_MIN_RED) & (r - b >= MEMBER_MIN_RED_BLUE_GAP)
+
+
+def _far_side_box(bbox, shape, direction):
+    """桥梁外接框在车辆前进方向一侧、同一高度附近的区域 (x0, y0, x1, y1)"""
+    x0, y0, x1, y1 = bbox
+    height, width = shape
+    gap = max(4, int(0.2 * (x1 - x0)))      # 留出一段间隔，避开桥端杆件本身的晃动
+    span = max(20, int(0.6 * (x1 - x0)))
+    top, bottom = max(0, y0), min(height, y1 + 1)
+    if direction == "right":
+        return min(width, x1 + gap), top, min(width, x1 + gap + span), bottom
+    return max(0, x0 - gap - span), top, max(0, x0 - gap), bottom
+
+
+def _confidence(value, threshold):
+    """离阈值越远越有把握，映射到 [0, 1]"""
+    return float(np.clip(abs(value - threshold) / threshold, 0.0, 1.0))
+
+
+def score_frames(frames, times=None, direction="right"):
+    """
+    frames：(N, H, W, 3) uint8；times：每帧的时间 (秒)，缺失时用帧序号代替；
+    direction：车辆前进方向 ("right" 或 "left")。返回结构化判定结果。
+    """
+    started = time.perf_counter()
+    n = frames.shape[0]
+    times = [t if t is not None else float(i) for i, t in enumerate(times or [None] * n)]
+
+    masks = member_masks(frames)
+    counts = masks.reshape(n, -1).sum(axis=1)
+    if counts[0] == 0:
+        return {
+            "success": None, "collapsed": None, "vehicle_reached": None, "members_lost": None,
+            "failure_time": None, "confidence": 0.0, "frames": n,
+            "reason": "首帧中没有识别到杆件像素，无法判定",
+            "elapsed_ms": (time.perf_counter() - started) * 1000.0,
+        }
+
+    ys, xs = np.nonzero(masks[0])
+    bbox = (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+    bbox_height = max(1, bbox[3] - bbox[1])
+
+    # 杆件像素剩余占比与重心下沉量 (向量化：每帧对行坐标加权求和)
+    retention = counts / counts[0]
+    row_index = np.arange(frames.shape[1], dtype=np.float64)
+    row_sums = masks.sum(axis=2)
+    centroid_y = (row_sums @ row_index) / np.maximum(counts, 1)
+    sag = np.where(counts > 0, (centroid_y - centroid_y[0]) / bbox_height, np.inf)
+    broken = (retention < COLLAPSE_RETENTION) | (sag > SAG_LIMIT)
+    collapsed = bool(broken[-1])
+    failure_frame = int(np.argmax(broken)) if collapsed else None
+
+    # 对岸区域相邻帧差分
+    fx0, fy0, fx1, fy1 = _far_side_box(bbox, frames.shape[1:3], direction)
+    far = frames[:, fy0:fy1, fx0:fx1].astype(np.int16)
+    if n > 1 and far.size:
+        moving = np.abs(np.diff(far, axis=0)).max(axis=-1) > PIXEL_DELTA
+        # 掉落的杆件不算车辆：前后两帧任一帧是杆件颜色的像素不计入
+        far_members = masks[:, fy0:fy1, fx0:fx1]
+        moving &= ~(far_members[1:] | far_members[:-1])
+        motion = moving.reshape(n - 1, -1).mean(axis=1)
+    else:
+        motion = np.zeros(1)
+    peak_motion = float(motion.max())
+    vehicle_reached = peak_motion > MOTION_THRESHOLD
+
+    # 车辆到达对岸之前桥就已塌掉时，以坍塌为准
+    if vehicle_reached and collapsed and int(np.argmax(motion > MOTION_THRESHOLD)) + 1 > failure_frame:
+        vehicle_reached = False
+    success = vehicle_reached and not collapsed
+
+    members_lost = float(max(0.0, 1.0 - retention[-1]))
+    collapse_conf = _confidence(float(retention[-1]), COLLAPSE_RETENTION)
+    reach_conf = _confidence(peak_motion, MOTION_THRESHOLD) * min(1.0, n / MIN_FRAMES_FOR_FULL_CONFIDENCE)
+    confidence = collapse_conf if collapsed else min(collapse_conf, reach_conf)
+
+    return {
+        "success": bool(success),
+        "collapsed": collapsed,
+        "vehicle_reached": bool(vehicle_reached),
+        "members_lost": round(members_lost, 3),
+        "members_disappeared": members_lost > MEMBER_LOSS_THRESHOLD,
+        "failure_time": times[failure_frame] if failure_frame is not None else None,
+        "confidence": round(confidence, 3),
+        "frames": n,
+        "metrics": {
+            "bridge_bbox": bbox,
+            "far_side_box": (fx0, fy0, fx1, fy1),
+            "retention": np.round(retention, 3).tolist(),
+            "sag": [round(float(s), 3) if np.isfinite(s) else None for s in sag],
+            "far_side_motion": np.round(motion, 4).tolist(),
+        },
+        "elapsed_ms": (time.perf_counter() - started) * 1000.0,
+    }
+
+
+def score_replay(frames_dir, direction="right", write=True):
+    """对一个回放帧目录 (pic/<时间戳>) 打分，并把结果写到同目录的 score.json"""
+    frames, times = load_frames(frames_dir)
+    result = score_frames(frames, times, direction)
+    if write:
+        with open(os.path.join(frames_dir, SCORE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
+
+
+def describe(result):
+    """一行中文结论，供日志使用"""
+    if result["success"] is None:
+        return f"无法判定 ({result.get('reason')})"
+    if result["success"]:
+        return f"车辆到达对岸，桥梁未坍塌 (置信度 {result['confidence']:.2f})"
+    parts = []
+    if result["collapsed"]:
+        parts.append(f"桥梁在 {result['failure_time']:.2f}s 坍塌")
+    if result["members_disappeared"]:
+        parts.append(f"约 {result['members_lost']:.0%} 的杆件断裂消失")
+    if not result["vehicle_reached"]:
+        parts.append("车辆未到达对岸")
+    return "，".join(parts) + f" (置信度 {result['confidence']:.2f})"
+
+
+if __name__ == "__main__":
+    import sys
+    for frames_dir in sys.argv[1:]:
+        result = score_replay(frames_dir)
+        print(f"{'✅' if result['success'] else '❌'} {frames_dir}: {describe(result)} ({result['elapsed_ms']:.0f} ms)")
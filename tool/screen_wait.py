@@ -0,0 +1,180 @@
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+# ================= 事件驱动的界面等待 =================
+# 代替写死的 time.sleep：在一个小的屏幕区域上轮询，直到画面发生变化 / 重新稳定 / 与参考图一致，
+# 或者超时 (超时时间取原来写死的等待时长，因此最坏情况与原来一样，通常只需其中一小部分)。
+# 截图来源可注入：默认用 pyautogui 实时截屏，测试时可换成 RecordedScreenSource 回放录好的帧。
+
+POLL_INTERVAL = float(os.getenv("GUI_POLL_INTERVAL", "0.05"))
+CHANGE_THRESHOLD = float(os.getenv("GUI_CHANGE_THRESHOLD", "0.02"))   # 签名平均灰度差 (0~1) 超过即视为变化
+MATCH_THRESHOLD = float(os.getenv("GUI_MATCH_THRESHOLD", "0.03"))     # 与参考图的差低于此值即视为一致
+SIGNATURE_SIZE = (48, 48)
+
+
+class LiveScreenSource:
+    """实时截屏 (pyautogui 延迟导入)；region 为 (left, top, width, height)，None 表示全屏"""
+
+    def grab(self, region=None):
+        import pyautogui
+        return pyautogui.screenshot(region=region)
+
+
+class RecordedScreenSource:
+    """
+    回放录好的整屏帧 (PIL 图片或图片路径)，每次 grab 前进一帧，播完后停在最后一帧。
+    用于在没有游戏 / 图形环境时测试等待逻辑。
+    """
+
+    def __init__(self, frames):
+        self.frames = [Image.open(f) if isinstance(f, (str, os.PathLike)) else f for f in frames]
+        self.position = 0
+
+    def grab(self, region=None):
+        frame = self.frames[min(self.position, len(self.frames) - 1)]
+        self.position += 1
+        if region is None:
+            return frame
+        left, top, width, height = region
+        return frame.crop((left, top, left + width, top + height))
+
+
+_default_source = None
+
+
+def set_default_source(source):
+    """替换全局默认的截图来源 (例如测试时注入 RecordedScreenSource)"""
+    global _default_source
+    _default_source = source
+
+
+def get_default_source():
+    global _default_source
+    if _default_source is None:
+        _default_source = LiveScreenSource()
+    return _default_source
+
+
+def region_around(x, y, width=160, height=60):
+    """以点击坐标为中心取一块区域，用于观察按钮 / 菜单是否出现"""
+    return (max(0, x - width // 2), max(0, y - height // 2), width, height)
+
+
+def signature(image):
+    """缩成小尺寸灰度图作为区域签名，比较签名比逐像素比较整块区域快得多"""
+    return np.asarray(image.convert("L").resize(SIGNATURE_SIZE, Image.BILINEAR), dtype=np.float32) / 255.0
+
+
+def difference(a, b):
+    return float(np.mean(np.abs(a - b)))
+
+
+def snapshot(region=None, source=None):
+    """截取区域签名，作为之后 wait_for_change 的基准 (在触发动作之前调用)"""
+    return signature((source or get_default_source()).grab(region))
+
+
+def capture_reference(region, path, source=None):
+    """把当前区域截图保存为参考图 (供 wait_for_match / wait_for_ui 使用)，返回保存路径"""
+    image = (source or get_default_source()).grab(region)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    image.save(path)
+    return path
+
+
+class WaitResult:
+    __slots__ = ("ok", "elapsed", "polls", "diff")
+
+    def __init__(self, ok, elapsed, polls, diff):
+        self.ok = ok
+        self.elapsed = elapsed
+        self.polls = polls
+        self.diff = diff
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return f"WaitResult(ok={self.ok}, elapsed={self.elapsed:.2f}s, polls={self.polls}, diff={self.diff:.3f})"
+
+
+def _poll(region, condition, timeout, interval, source):
+    """按 interval 轮询区域签名，condition(签名) 返回 (是否满足, 差值)；超时返回 ok=False"""
+    source = source or get_default_source()
+    started = time.perf_counter()
+    polls, diff = 0, 0.0
+    while True:
+        ok, diff = condition(signature(source.grab(region)))
+        polls += 1
+        elapsed = time.perf_counter() - started
+        if ok or elapsed >= timeout:
+            return WaitResult(ok, elapsed, polls, diff)
+        time.sleep(min(interval, max(0.0, timeout - elapsed)))
+
+
+def wait_for_change(region, baseline, timeout, interval=POLL_INTERVAL, threshold=CHANGE_THRESHOLD, source=None):
+    """等待区域相对 baseline (snapshot 的结果) 发生变化"""
+    return _poll(region, lambda sig: (difference(sig, baseline) > threshold, difference(sig, baseline)),
+                 timeout, interval, source)
+
+
+def wait_for_match(region, reference, timeout, interval=POLL_INTERVAL, threshold=MATCH_THRESHOLD, source=None):
+    """等待区域与参考图 (PIL 图片、图片路径或签名数组) 一致"""
+    if isinstance(reference, (str, os.PathLike)):
+        with Image.open(reference) as image:
+            reference = signature(image)
+    elif isinstance(reference, Image.Image):
+        reference = signature(reference)
+    return _poll(region, lambda sig: (difference(sig, reference) <= threshold, difference(sig, reference)),
+                 timeout, interval, source)
+
+
+def wait_for_stable(region, timeout, settle=0.15, interval=POLL_INTERVAL, threshold=CHANGE_THRESHOLD, source=None):
+    """等待区域在 settle 秒内不再变化 (动画播放完毕)"""
+    state = {"last": None, "since": time.perf_counter()}
+
+    def condition(sig):
+        now = time.perf_counter()
+        diff = 0.0 if state["last"] is None else difference(sig, state["last"])
+        if state["last"] is None or diff > threshold:
+            state["last"], state["since"] = sig, now
+        return now - state["since"] >= settle, diff
+
+    return _poll(region, condition, timeout, interval, source)
+
+
+def wait_for_transition(region, baseline, timeout, settle=0.15, source=None):
+    """先等区域发生变化，再等它稳定下来；两段共用同一个超时预算"""
+    started = time.perf_counter()
+    changed = wait_for_change(region, baseline, timeout, source=source)
+    if not changed:
+        return changed
+    stable = wait_for_stable(region, max(0.0, timeout - (time.perf_counter() - started)), settle, source=source)
+    return WaitResult(stable.ok, time.perf_counter() - started, changed.polls + stable.polls, changed.diff)
+
+
+def log_wait(label, result, budget):
+    """打印等待结果：实际耗时 / 原固定等待时长"""
+    if result:
+        print(f"   ⏱️ {label}: {result.elapsed:.2f}s / {budget:.1f}s")
+    else:
+        print(f"   ⚠️ {label}: 等待 {budget:.1f}s 未检测到界面变化，继续执行")
+
+
+def wait_for_ui(region, baseline, timeout, reference=None, settle=0.15, source=None):
+    """
+    等待某个界面元素出现 / 消失：给出参考图 (且文件存在) 时等待与参考图一致，
+    否则退化为 "区域发生变化并重新稳定"。
+    """
+    if reference is not None and (not isinstance(reference, (str, os.PathLike)) or os.path.exists(reference)):
+        return wait_for_match(region, reference, timeout, source=source)
+    return wait_for_transition(region, baseline, timeout, settle, source=source)
+
+
+def wait_for_window_switch(timeout=3.0, settle=0.3, source=None):
+    """启动时等待用户切换到游戏窗口：整屏一变化并稳定下来就继续，最多等 timeout 秒"""
+    baseline = snapshot(None, source)
+    return wait_for_transition(None, baseline, timeout, settle, source=source)
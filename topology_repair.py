@@ -0,0 +1,175 @@
+import math
+
+from design_canon import COORD_DIGITS
+from materials import MATERIALS
+
+# ================= 拓扑自动修复 =================
+# 大模型输出的拓扑 (nodes + edges) 在转换成存档前就地修掉能机械修复的问题，省去一次重新调用：
+#   1. 重复 id / 坐标重合的节点合并为一个 (优先保留锚点，其次保留先出现的)，杆件的端点随之改指；
+#   2. 合并后两端相同的杆件 (长度为 0) 删除，端点与材料都相同的重复杆件只保留一根，与其它物体重复的杆件 id 重新分配；
+#   3. 超过材料最大长度的杆件等分成若干段：分点与已有节点坐标重合时直接用已有节点，否则插入非锚点，
+#      id 接在当前最大 id 之后；第一段沿用原杆件 id，其余各段的 id 接在新节点之后，与已有杆件重复的段不再添加。
+# 每一处改动都记入报告 [{"action", "id", "message", ...}]，写法与 design_validator 的违规项一致。
+# 注意：等分出来的中间节点只连着同一直线上的两段时没有侧向支撑，是机构 (静力预筛会判为几何可变)，
+# 这类等分记为 split_edge_unbraced，不算修好，设计仍需要修改布置。
+
+LENGTH_TOLERANCE = 1e-6
+
+
+def _change(action, obj_id, message, **detail):
+    return {"action": action, "id": obj_id, "message": message, **detail}
+
+
+def _key(node):
+    return round(float(node["x"]), COORD_DIGITS) + 0.0, round(float(node["y"]), COORD_DIGITS) + 0.0
+
+
+def repair_topology(nodes, edges):
+    """返回 (修复后的 nodes, 修复后的 edges, 报告)，不修改传入的列表"""
+    report = []
+
+    # ---------- 1. 节点去重 / 合并 ----------
+    kept, by_id, by_xy, remap = [], {}, {}, {}
+    for node in nodes:
+        node = dict(node)
+        node_id, key = node["id"], _key(node)
+        if node_id in by_id:
+            report.append(_change("duplicate_node", node_id, f"节点 id {node_id} 重复出现，只保留第一个。"))
+            continue
+        target = by_xy.get(key)
+        if target is None:
+            by_id[node_id] = by_xy[key] = len(kept)
+            kept.append(node)
+            continue
+        other = kept[target]
+        if node.get("isKinematic") is True and other.get("isKinematic") is not True:
+            # 锚点与已有的普通节点重合：保留锚点，原先的普通节点并入锚点
+            remap[other["id"]] = node_id
+            by_id[node_id] = target
+            kept[target] = node
+            report.append(_change("merge_node", other["id"], f"节点 {other['id']} 与锚点 {node_id} 坐标重合，已并入锚点。",
+                                  into=node_id))
+        else:
+            remap[node_id] = other["id"]
+            report.append(_change("merge_node", node_id, f"节点 {node_id} 与节点 {other['id']} 坐标重合，已合并。",
+                                  into=other["id"]))
+
+    def resolve(node_id):
+        while node_id in remap:
+            node_id = remap[node_id]
+        return node_id
+
+    xy = {node["id"]: (float(node["x"]), float(node["y"])) for node in kept}
+    used_ids = set(xy)
+    next_id = max([*used_ids, *(e["id"] for e in edges)], default=0) + 1
+
+    # ---------- 2. 杆件端点改指、去重 ----------
+    cleaned, seen_pairs, fresh = [], set(), []
+    for edge in edges:
+        edge = dict(edge)
+        a, b = resolve(edge["anchorAID"]), resolve(edge["anchorBID"])
+        edge["anchorAID"], edge["anchorBID"] = a, b
+        if a == b:
+            report.append(_change("self_loop", edge["id"], f"杆件 {edge['id']} 两端合并为同一节点 {a}，已删除。"))
+            continue
+        pair = (edge["type"], min(a, b), max(a, b))
+        if pair in seen_pairs:
+            report.append(_change("duplicate_edge", edge["id"], f"杆件 {edge['id']} 与已有杆件端点、材料都相同，已删除。"))
+            continue
+        seen_pairs.add(pair)
+        if edge["id"] in used_ids:
+            fresh.append(edge)
+        else:
+            used_ids.add(edge["id"])
+        cleaned.append(edge)
+
+    # ---------- 3. 超长杆件等分 (先分配新节点 id，再分配新杆件 id) ----------
+    splits = []
+    for edge in cleaned:
+        max_length = MATERIALS.get(edge["type"], {}).get("max_length")
+        if max_length is None or edge["anchorAID"] not in xy or edge["anchorBID"] not in xy:
+            continue
+        (xa, ya), (xb, yb) = xy[edge["anchorAID"]], xy[edge["anchorBID"]]
+        length = math.hypot(xb - xa, yb - ya)
+        if length <= max_length + LENGTH_TOLERANCE:
+            continue
+        n = math.ceil(length / max_length - LENGTH_TOLERANCE)
+        inner, reused = [], []
+        for i in range(1, n):
+            t = i / n
+            node = {"id": next_id, "x": round(xa + t * (xb - xa), 6), "y": round(ya + t * (yb - ya), 6), "isKinematic": False}
+            target = by_xy.get(_key(node))
+            if target is not None:
+                # 分点上已经有节点 (原有的或前一根杆件等分出来的)：直接连到它上面，不再叠一个新节点
+                inner.append(kept[target]["id"])
+                reused.append(kept[target]["id"])
+                continue
+            next_id += 1
+            by_xy[_key(node)] = len(kept)
+            kept.append(node)
+            inner.append(node["id"])
+        splits.append((edge, length, max_length, inner, reused))
+
+    for edge in fresh:
+        report.append(_change("reassign_id", edge["id"], f"杆件 id {edge['id']} 与其它物体重复，改为 {next_id}。",
+                              new_id=next_id))
+        edge["id"] = next_id
+        next_id += 1
+
+    result = []
+    pieces = {}
+    for edge, length, max_length, inner, reused in splits:
+        chain = [edge["anchorAID"], *inner, edge["anchorBID"]]
+        seen_pairs.discard((edge["type"], min(chain[0], chain[-1]), max(chain[0], chain[-1])))
+        segments = []
+        for k, (a, b) in enumerate(zip(chain, chain[1:])):
+            pair = (edge["type"], min(a, b), max(a, b))
+            if pair in seen_pairs:
+                continue
+            seen_pairs.add(pair)
+            segment = dict(edge, anchorAID=a, anchorBID=b)
+            if segments:
+                segment["id"] = next_id
+                next_id += 1
+            segments.append(segment)
+        pieces[id(edge)] = segments
+    for edge in cleaned:
+        result.extend(pieces.get(id(edge), [edge]))
+
+    # 等分的报告放在所有杆件确定之后：只连着本链两段的中间节点 (锚点除外) 没有侧向支撑
+    anchors = {node["id"] for node in kept if node.get("isKinematic") is True}
+    degree = {}
+    for edge in result:
+        for end in (edge["anchorAID"], edge["anchorBID"]):
+            degree[end] = degree.get(end, 0) + 1
+    for edge, length, max_length, inner, reused in splits:
+        segments = pieces[id(edge)]
+        new_nodes = [n for n in inner if n not in reused]
+        unbraced = [n for n in inner if n not in anchors and degree.get(n, 0) <= 2]
+        name = MATERIALS[edge["type"]]["name"]
+        added = [s["id"] for s in segments if s["id"] != edge["id"]]
+        detail = [f"新节点 {new_nodes}" if new_nodes else "", f"复用已有节点 {reused}" if reused else "",
+                  f"新杆件 {added}" if added else "",
+                  f"{len(inner) + 1 - len(segments)} 段与已有杆件重复未添加" if len(segments) <= len(inner) else ""]
+        message = (f"杆件 {edge['id']} ({name}) 长度 {length:.2f}m 超过上限 {max_length:g}m，已等分为 {len(inner) + 1} 段 "
+                   f"({'，'.join(d for d in detail if d)})")
+        if unbraced:
+            report.append(_change("split_edge_unbraced", edge["id"],
+                                  message + f"，但节点 {unbraced} 只连着这根杆件的相邻两段，没有侧向支撑 (机构)，仍需修改布置。",
+                                  segments=[s["id"] for s in segments], new_nodes=new_nodes, reused_nodes=reused,
+                                  unbraced_nodes=unbraced))
+        else:
+            report.append(_change("split_edge", edge["id"], message + "。",
+                                  segments=[s["id"] for s in segments], new_nodes=new_nodes, reused_nodes=reused))
+
+    return kept, result, report
+
+
+
+def print_repairs(report):
+    """按现有日志风格逐条打印修复项"""
+    for change in report:
+        if change["action"] == "split_edge_unbraced":
+            print(f"⚠️ 自动修复不完整：{change['message']}")
+        else:
+            print(f"🔧 自动修复：{change['message']}")
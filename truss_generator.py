@@ -0,0 +1,359 @@
+import json
+import math
+import os
+import time
+
+from bridge_design import BridgeDesign
+from materials import MATERIALS, ROAD_TYPE
+
+# ================= 参数化桁架基线 =================
+# 从初始存档中取出锚点，按参数化族 (Warren / Pratt / Howe / 王柱 / 拱 / 绳索悬吊) 和几组高度直接生成候选设计，
+# 输出与大模型相同的拓扑 JSON (nodes + edges，新节点 id 接在已有最大 id 之后，杆件 id 接在节点之后)，
+# 之后走同一条 convert_topology_to_objects / 存档写出路径。
+# 节间长度默认取路面最大长度，也可以取更短的节间：竖杆桁架高度超过节间长度时分成若干层 (每层一排横杆)，
+# 使每个格子接近正方形，只用木材 (2m) 也能搭出比单根杆件更高的桁架。
+# 每个候选先给每根杆件选长度够用的最便宜材料，静力预筛不通过时把超载杆件升级为更强的材料再试，
+# 最后按造价从低到高排序。简单的关卡 (例如 8m、四个锚点的空关卡) 几毫秒就能解出，不必调用视觉大模型。
+
+DEFAULT_HEIGHTS = (1.0, 1.5, 2.0, 3.0)            # 桁架高度 / 拱矢高 (m)
+DEFAULT_PANELS = (None, 1.0)                      # 节间长度 (m)，None 为路面最大长度
+UTILISATION_LIMIT = float(os.getenv("BASELINE_UTILISATION_LIMIT", "0.9"))
+MAX_UPGRADE_ROUNDS = 3
+STRUCTURAL_TYPES = (2, 8)                         # 桁架杆件可选材料 (木材、钢材)，液压杆不用于静态桁架
+ROPE_TYPE = 5
+ANCHOR_TOLERANCE = 0.05
+MIN_LENGTH = 0.05
+
+
+def parse_anchors(initial_code):
+    """初始存档 (JSON 字符串或 dict) 中的固定锚点列表 [{"id", "x", "y"}] 与已有的最大 id"""
+    data = json.loads(initial_code) if isinstance(initial_code, str) else initial_code
+    objects = data.get("Objects", []) if isinstance(data, dict) else data
+    anchors = [{"id": o["id"], "x": float(o["x"]), "y": float(o["y"])}
+               for o in objects if o.get("type", 0) == 0 and o.get("isKinematic") is True]
+    max_id = max((o.get("id", 0) for o in objects), default=0)
+    return anchors, max_id
+
+
+def find_site(anchors):
+    """
+    桥面两端：最左侧与最右侧锚点中各取最高的一个；同一侧更低的锚点作为下方支座 (拱脚 / 斜撑)。
+    返回 {"left", "right", "lower_left", "lower_right"}，找不到两端时返回 None
+    """
+    if len(anchors) < 2:
+        return None
+    min_x = min(a["x"] for a in anchors)
+    max_x = max(a["x"] for a in anchors)
+    if max_x - min_x < MIN_LENGTH:
+        return None
+    left = sorted((a for a in anchors if a["x"] <= min_x + ANCHOR_TOLERANCE), key=lambda a: -a["y"])
+    right = sorted((a for a in anchors if a["x"] >= max_x - ANCHOR_TOLERANCE), key=lambda a: -a["y"])
+    return {
+        "left": left[0],
+        "right": right[0],
+        "lower_left": left[-1] if len(left) > 1 else None,
+        "lower_right": right[-1] if len(right) > 1 else None,
+    }
+
+
+class _Builder:
+    """收集节点与带角色 (road / struct / rope) 的杆件，最后统一编号"""
+
+    def __init__(self, anchors, max_id):
+        self.nodes = [dict(a, isKinematic=True) for a in anchors]
+        self.next_id = max_id + 1
+        self.edges = []  # (a, b, role)
+
+    def node(self, x, y):
+        node = {"id": self.next_id, "x": round(x, 4), "y": round(y, 4), "isKinematic": False}
+        self.next_id += 1
+        self.nodes.append(node)
+        return node
+
+    def anchor(self, anchor_id):
+        return next(n for n in self.nodes if n["id"] == anchor_id)
+
+    def edge(self, a, b, role="struct"):
+        if a is b or (a["isKinematic"] and b["isKinematic"]):
+            return
+        self.edges.append((a, b, role))
+
+
+def _panel_length(panel):
+    return min(panel or math.inf, MATERIALS[ROAD_TYPE]["max_length"])
+
+
+def _deck(site, builder, panel=None):
+    """桥面：按节间长度 (默认路面最大长度) 等分跨度，返回桥面节点列表 (两端为锚点)，并连好路面"""
+    left, right = builder.anchor(site["left"]["id"]), builder.anchor(site["right"]["id"])
+    span = math.hypot(right["x"] - left["x"], right["y"] - left["y"])
+    n = max(1, math.ceil(span / _panel_length(panel) - 1e-9))
+    deck = [left]
+    for i in range(1, n):
+        t = i / n
+        deck.append(builder.node(left["x"] + t * (right["x"] - left["x"]), left["y"] + t * (right["y"] - left["y"])))
+    deck.append(right)
+    for a, b in zip(deck, deck[1:]):
+        builder.edge(a, b, "road")
+    return deck
+
+
+def _above(node, h):
+    return node["x"], node["y"] + h
+
+
+def _diagonals(builder, bottom, top, toward_center=True):
+    """在相邻两列之间加斜杆：toward_center=True 为 Pratt 式 (斜杆自上而下指向跨中)，否则为 Howe 式"""
+    n = len(bottom) - 1
+    for i in range(n):
+        if top[i] is None or top[i + 1] is None:
+            continue
+        left_half = i + 1 <= n / 2
+        if left_half == toward_center:
+            builder.edge(top[i], bottom[i + 1])
+        else:
+            builder.edge(bottom[i], top[i + 1])
+
+
+def warren(site, anchors, max_id, height, panel=None):
+    """Warren 桁架：上弦节点位于每个节间中点上方，斜杆交替组成三角形"""
+    b = _Builder(anchors, max_id)
+    deck = _deck(site, b, panel)
+    tops = [b.node((p["x"] + q["x"]) / 2, (p["y"] + q["y"]) / 2 + height) for p, q in zip(deck, deck[1:])]
+    for i, t in enumerate(tops):
+        b.edge(deck[i], t)
+        b.edge(t, deck[i + 1])
+    for s, t in zip(tops, tops[1:]):
+        b.edge(s, t)
+    return b
+
+
+def _vertical_truss(site, anchors, max_id, heights, toward_center, panel=None):
+    """
+    竖杆桁架 (Pratt / Howe / 王柱)：heights(i, n) 给出第 i 个内部桥面节点上方的高度。
+    最大高度超过节间长度时分成 ceil(高度 / 节间长度) 层，每层都有竖杆、横杆与斜杆
+    """
+    b = _Builder(anchors, max_id)
+    deck = _deck(site, b, panel)
+    n = len(deck) - 1
+    tiers = max(1, math.ceil(max((heights(i, n) for i in range(1, n)), default=0.0) / _panel_length(panel) - 1e-9))
+    rows = [deck]
+    for k in range(1, tiers + 1):
+        rows.append([deck[0]] + [b.node(*_above(deck[i], heights(i, n) * k / tiers)) for i in range(1, n)] + [deck[-1]])
+    for lower, upper in zip(rows, rows[1:]):
+        for i in range(1, n):
+            b.edge(lower[i], upper[i])
+        for s, t in zip(upper, upper[1:]):
+            b.edge(s, t)
+        _diagonals(b, lower, [None] + upper[1:-1] + [None], toward_center)
+    return b
+
+
+def pratt(site, anchors, max_id, height, panel=None):
+    return _vertical_truss(site, anchors, max_id, lambda i, n: height, toward_center=True, panel=panel)
+
+
+def howe(site, anchors, max_id, height, panel=None):
+    return _vertical_truss(site, anchors, max_id, lambda i, n: height, toward_center=False, panel=panel)
+
+
+def king_post(site, anchors, max_id, height, panel=None):
+    """王柱 (三角形) 桁架：上弦从两端锚点升到跨中顶点，各内部节点设竖杆并向跨中加斜杆"""
+    return _vertical_truss(site, anchors, max_id, lambda i, n: height * (1 - abs(2 * i / n - 1)),
+                           toward_center=False, panel=panel)
+
+
+def arch(site, anchors, max_id, height, panel=None):
+    """
+    拱：两侧都有下方支座时做上承式拱 (拱脚在下方支座，拱顶在桥面下方 0.3m 处，立柱支撑桥面)，
+    否则做下承式系杆拱 (拱脚在桥面锚点，矢高 height，吊杆悬挂桥面)；每个节间加一根斜杆保证几何不变
+    """
+    b = _Builder(anchors, max_id)
+    deck = _deck(site, b, panel)
+    n = len(deck) - 1
+    under = site["lower_left"] is not None and site["lower_right"] is not None
+    if under:
+        spring_l, spring_r = b.anchor(site["lower_left"]["id"]), b.anchor(site["lower_right"]["id"])
+        crown_gap = 0.3
+    else:
+        spring_l, spring_r = deck[0], deck[-1]
+
+    ribs = [spring_l]
+    for i in range(1, n):
+        t = i / n
+        base_y = spring_l["y"] + t * (spring_r["y"] - spring_l["y"])
+        if under:
+            rise = deck[i]["y"] - crown_gap - (spring_l["y"] + spring_r["y"]) / 2
+            y = base_y + 4 * rise * t * (1 - t)
+            if deck[i]["y"] - y < MIN_LENGTH:
+                return None
+        else:
+            y = base_y + 4 * height * t * (1 - t)
+        ribs.append(b.node(deck[i]["x"], y))
+    ribs.append(spring_r)
+
+    for s, t in zip(ribs, ribs[1:]):
+        b.edge(s, t)
+    for i in range(1, n):
+        b.edge(deck[i], ribs[i])
+    if under:
+        b.edge(deck[0], ribs[1])
+        b.edge(ribs[-2], deck[-1])
+    _diagonals(b, deck, [None] + ribs[1:-1] + [None], toward_center=False)
+    return b
+
+
+def suspension(site, anchors, max_id, height, panel=None):
+    """
+    绳索悬吊：两端各立一座塔，两座塔顶各用绳索斜拉全部内部桥面节点。
+    有下方支座时塔顶向跨内偏半个节间，与桥面锚点、下方支座组成固定三角形；否则塔立在桥面锚点上，斜撑到第一个桥面节点。
+    静力预筛是线性分析，抛物线主缆 + 竖直吊杆在没有预应力时是机构，所以这里用扇形斜拉布置
+    """
+    b = _Builder(anchors, max_id)
+    deck = _deck(site, b, panel)
+    n = len(deck) - 1
+    if n < 2:
+        return None
+    towers, braced = [], set()
+    for end, inner, key in ((deck[0], deck[1], "lower_left"), (deck[-1], deck[-2], "lower_right")):
+        x, y = _above(end, height)
+        if site[key] is not None:
+            tower = b.node(x + (inner["x"] - end["x"]) / 2, y)
+            b.edge(tower, b.anchor(site[key]["id"]))
+        else:
+            tower = b.node(x, y)
+            b.edge(tower, inner)
+            braced.add((tower["id"], inner["id"]))
+        b.edge(end, tower)
+        towers.append(tower)
+    for tower in towers:
+        for i in range(1, n):
+            if (tower["id"], deck[i]["id"]) not in braced:
+                b.edge(tower, deck[i], "rope")
+    return b
+
+
+FAMILIES = {
+    "warren": warren,
+    "pratt": pratt,
+    "howe": howe,
+    "king_post": king_post,
+    "arch": arch,
+    "suspension": suspension,
+}
+
+
+def _material_options(role, allowed_types):
+    """某角色可用的材料，按单价从低到高"""
+    allowed = set(MATERIALS) if allowed_types is None else set(allowed_types)
+    if role == "road":
+        return [ROAD_TYPE]
+    if role == "rope":
+        return [ROPE_TYPE] if ROPE_TYPE in allowed else []
+    return sorted((t for t in STRUCTURAL_TYPES if t in allowed), key=lambda t: MATERIALS[t]["cost"])
+
+
+def _fits(t, length):
+    max_length = MATERIALS[t]["max_length"]
+    return max_length is None or length <= max_length + 1e-9
+
+
+def _to_topology(builder, types):
+    """编号：节点 id 已经按顺序分配，杆件 id 接在最大节点 id 之后"""
+    first_edge_id = max(n["id"] for n in builder.nodes) + 1
+    return {
+        "nodes": [dict(n) for n in builder.nodes],
+        "edges": [{"id": first_edge_id + k, "type": t, "anchorAID": a["id"], "anchorBID": b["id"], "rate": 0}
+                  for k, ((a, b, _), t) in enumerate(zip(builder.edges, types))],
+    }
+
+
+def evaluate(builder, allowed_types=None, utilisation_limit=UTILISATION_LIMIT):
+    """
+    选材 + 静力预筛 (超载杆件逐轮升级材料)。
+    返回 {"topology", "design", "passed", "reason", "cost", "max_utilisation", "prescreens"}
+    """
+    from cost_optimizer import member_costs
+    from design_validator import collect_violations
+    from truss_solver import prescreen_design
+
+    lengths = [math.hypot(b["x"] - a["x"], b["y"] - a["y"]) for a, b, _ in builder.edges]
+    options = [[t for t in _material_options(role, allowed_types) if _fits(t, length)]
+               for (_, _, role), length in zip(builder.edges, lengths)]
+    result = {"topology": None, "design": None, "passed": False, "reason": None, "cost": None,
+              "max_utilisation": None, "prescreens": 0}
+    if any(length < MIN_LENGTH for length in lengths):
+        result["reason"] = "存在过短的杆件"
+        return result
+    if any(not o for o in options):
+        result["reason"] = "有杆件超出所有可用材料的长度上限"
+        return result
+
+    choice = [0] * len(options)
+    for _ in range(MAX_UPGRADE_ROUNDS + 1):
+        types = [o[c] for o, c in zip(options, choice)]
+        topology = _to_topology(builder, types)
+        design = BridgeDesign.from_topology(topology["nodes"], topology["edges"], display_name="Bridge_Generated")
+        violations = collect_violations(design)
+        if violations:
+            result.update(topology=topology, design=design, reason=violations[0]["message"])
+            return result
+        report = prescreen_design(design, utilisation_limit=utilisation_limit)
+        result["prescreens"] += 1
+        result.update(topology=topology, design=design, passed=report["passed"], reason=report["reason"],
+                      max_utilisation=report["max_utilisation"], cost=float(member_costs(design).sum()))
+        if report["passed"] or not report["members"]:
+            return result
+        upgraded = False
+        for k, member in enumerate(report["members"]):
+            if member["utilisation"] > utilisation_limit and choice[k] + 1 < len(options[k]):
+                choice[k] += 1
+                upgraded = True
+        if not upgraded:
+            return result
+    return result
+
+
+def generate_baselines(initial_code, allowed_types=None, families=None, heights=DEFAULT_HEIGHTS,
+                       panels=DEFAULT_PANELS, utilisation_limit=UTILISATION_LIMIT):
+    """
+    对所有参数化族 × 高度 × 节间长度生成候选并评估，结构相同的候选 (例如与高度无关的上承式拱) 只保留一个，
+    返回列表 (通过预筛的在前，按造价从低到高)，
+    每项 {"name", "family", "height", "panel", "passed", "reason", "cost", "max_utilisation", "topology", "design"}
+    """
+    anchors, max_id = parse_anchors(initial_code)
+    site = find_site(anchors)
+    if site is None:
+        return []
+    from design_canon import design_hash
+
+    candidates, seen = [], set()
+    for family in families or FAMILIES:
+        for panel in panels:
+            for height in heights:
+                builder = FAMILIES[family](site, anchors, max_id, height, panel)
+                if builder is None:
+                    continue
+                started = time.perf_counter()
+                result = evaluate(builder, allowed_types, utilisation_limit)
+                name = f"{family}_h{height:g}" + (f"_p{panel:g}" if panel else "")
+                result.update(name=name, family=family, height=height, panel=panel,
+                              elapsed_ms=(time.perf_counter() - started) * 1000.0)
+                if result["design"] is not None:
+                    key = design_hash(result["design"])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                candidates.append(result)
+    candidates.sort(key=lambda c: (not c["passed"], c["cost"] if c["cost"] is not None else math.inf))
+    return candidates
+
+
+def print_candidates(candidates, limit=None):
+    for c in candidates[:limit]:
+        cost = f"${c['cost']:.0f}" if c["cost"] is not None else "-"
+        util = f"{c['max_utilisation']:.2f}" if c["max_utilisation"] is not None else "-"
+        detail = "" if c["passed"] else f" ({c['reason']})"
+        n_edges = len(c["topology"]["edges"]) if c["topology"] else 0
+        print(f"   {'✅' if c['passed'] else '❌'} {c['name']:16s} 造价 {cost:>7s} 利用率 {util:>5s} "
+              f"杆件 {n_edges:2d} ({c['elapsed_ms']:.1f} ms){detail}")
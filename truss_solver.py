@@ -0,0 +1,153 @@
+import time
+import numpy as np
+
+from bridge_design import BridgeDesign
+from materials import MATERIALS, ROAD_TYPE
+
+# ================= 离线静力预筛 =================
+# 把游戏存档的 Objects 当作二维铰接桁架，用刚度矩阵法求各杆件轴力，
+# 再与材料强度表比较，在进游戏跑 8 秒模拟之前先筛掉明显会塌的设计。
+
+DEFAULT_ROAD_LOAD = 100.0      # 路面均布荷载 (PN/m)，近似路面自重 + 车道荷载
+DEFAULT_VEHICLE_LOAD = 400.0   # 车辆集中荷载 (PN)，依次作用在每个路面节点上
+MAX_CONDITION = 1e12           # 刚度矩阵条件数上限，超过视为机构 (几何可变)
+MAX_SLACK_ITERATIONS = 10      # 绳索松弛迭代次数上限
+
+
+def _fail(reason, started):
+    return {
+        "passed": False,
+        "reason": reason,
+        "max_utilisation": None,
+        "critical_member": None,
+        "members": [],
+        "elapsed_ms": (time.perf_counter() - started) * 1000.0,
+    }
+
+
+def _assemble_stiffness(n_dof, a_idx, b_idx, c, s, k):
+    """向量化组装整体刚度矩阵 (每根杆件贡献一个 4x4 单元矩阵)"""
+    dofs = np.stack([2 * a_idx, 2 * a_idx + 1, 2 * b_idx, 2 * b_idx + 1], axis=1)
+    t = np.stack([-c, -s, c, s], axis=1)
+    blocks = k[:, None, None] * t[:, :, None] * t[:, None, :]
+    K = np.zeros((n_dof, n_dof))
+    np.add.at(K, (dofs[:, :, None], dofs[:, None, :]), blocks)
+    return K
+
+
+def _solve_case(free, F, a_idx, b_idx, c, s, k):
+    """求解一个或多个荷载工况，返回各杆件轴力 (拉为正)；几何可变时返回 None"""
+    K = _assemble_stiffness(F.shape[0], a_idx, b_idx, c, s, k)
+    Kff = K[np.ix_(free, free)]
+    if Kff.size == 0 or np.linalg.cond(Kff) > MAX_CONDITION:
+        return None
+    U = np.zeros((K.shape[0], F.shape[1]))
+    try:
+        U[free] = np.linalg.solve(Kff, F[free])
+    except np.linalg.LinAlgError:
+        return None
+    elong = (c[:, None] * (U[2 * b_idx] - U[2 * a_idx])
+             + s[:, None] * (U[2 * b_idx + 1] - U[2 * a_idx + 1]))
+    return k[:, None] * elong
+
+
+def prescreen_design(design_data, road_load=DEFAULT_ROAD_LOAD, vehicle_load=DEFAULT_VEHICLE_LOAD,
+                     utilisation_limit=1.0):
+    """
+    静力预筛：接收 BridgeDesign 或 convert_topology_to_objects 的输出 (存档 dict / Objects 数组)，
+    计算各杆件轴力与强度利用率，返回是否值得送进游戏模拟。
+
+    荷载工况 = 路面均布荷载 + 车辆集中荷载依次作用于每个路面节点，取包络。
+    绳索 (tension_only) 受压时视为松弛并剔除后重算。
+    """
+    started = time.perf_counter()
+    design = BridgeDesign.coerce(design_data)
+    if design.n_nodes == 0 or design.n_edges == 0:
+        return _fail("设计中缺少节点或杆件", started)
+
+    edge_ids, types = design.edge_ids, design.edge_type
+    resolved = design.resolved()
+    if not np.all(resolved):
+        return _fail(f"杆件 {edge_ids[~resolved].tolist()} 引用了不存在的节点", started)
+    unknown = sorted(set(types.tolist()) - set(MATERIALS))
+    if unknown:
+        return _fail(f"未知材料类型 {unknown}", started)
+
+    fixed = design.node_kinematic
+    a_idx, b_idx = design.edge_nodes[:, 0], design.edge_nodes[:, 1]
+    delta = design.edge_vectors()
+    length = np.hypot(delta[:, 0], delta[:, 1])
+    if np.any(length < 1e-9):
+        return _fail(f"杆件 {edge_ids[length < 1e-9].tolist()} 长度为 0", started)
+    c, s = delta[:, 0] / length, delta[:, 1] / length
+
+    strength = np.array([MATERIALS[t]["strength"] for t in types])
+    tension_only = np.array([MATERIALS[t]["tension_only"] for t in types])
+    k = np.array([MATERIALS[t]["stiffness"] for t in types]) / length
+
+    # 只保留连着杆件的非固定节点自由度，孤立节点不参与计算
+    n_dof = 2 * design.n_nodes
+    connected = np.zeros(design.n_nodes, dtype=bool)
+    connected[a_idx] = True
+    connected[b_idx] = True
+    free = np.flatnonzero(np.repeat(connected & ~fixed, 2))
+
+    # ---------- 荷载工况 ----------
+    is_road = types == ROAD_TYPE
+    if not np.any(is_road):
+        return _fail("设计中没有路面 (Road) 杆件，车辆无法通过", started)
+    base = np.zeros(n_dof)
+    half = road_load * length[is_road] / 2.0
+    np.add.at(base, 2 * a_idx[is_road] + 1, -half)
+    np.add.at(base, 2 * b_idx[is_road] + 1, -half)
+    road_nodes = np.unique(np.concatenate([a_idx[is_road], b_idx[is_road]]))
+    road_nodes = road_nodes[~fixed[road_nodes]]
+    F = np.tile(base[:, None], (1, len(road_nodes) + 1))
+    F[2 * road_nodes + 1, np.arange(1, len(road_nodes) + 1)] -= vehicle_load
+
+    # 先让全部绳索参与，一次性求解所有工况；只对出现绳索受压的工况单独做松弛迭代
+    all_active = np.ones(design.n_edges, dtype=bool)
+    N = _solve_case(free, F, a_idx, b_idx, c, s, k)
+    if N is None:
+        return _fail("结构为机构 (几何可变)，刚度矩阵奇异", started)
+
+    for case in np.flatnonzero(np.any(tension_only[:, None] & (N < 0), axis=0)):
+        active = all_active.copy()
+        for _ in range(MAX_SLACK_ITERATIONS):
+            slack = tension_only & active & (N[:, case] < 0)
+            if not np.any(slack):
+                break
+            active &= ~slack
+            solved = _solve_case(free, F[:, [case]], a_idx, b_idx, c, s, k * active)
+            if solved is None:
+                return _fail("绳索松弛后结构变为机构", started)
+            N[:, case] = solved[:, 0]
+
+    utilisation = np.abs(N) / strength[:, None]
+    utilisation[tension_only[:, None] & (N < 0)] = 0.0
+    governing = np.argmax(utilisation, axis=1)
+    member_util = utilisation[np.arange(design.n_edges), governing]
+    member_force = N[np.arange(design.n_edges), governing]
+
+    critical = int(np.argmax(member_util))
+    max_util = float(member_util[critical])
+    passed = max_util <= utilisation_limit
+    members = [
+        {
+            "id": int(edge_ids[i]),
+            "type": int(types[i]),
+            "material": MATERIALS[int(types[i])]["name"],
+            "length": float(length[i]),
+            "force": float(member_force[i]),
+            "utilisation": float(member_util[i]),
+        }
+        for i in range(design.n_edges)
+    ]
+    return {
+        "passed": bool(passed),
+        "reason": None if passed else f"杆件 {int(edge_ids[critical])} 利用率 {max_util:.2f} 超过 {utilisation_limit}",
+        "max_utilisation": max_util,
+        "critical_member": int(edge_ids[critical]),
+        "members": members,
+        "elapsed_ms": (time.perf_counter() - started) * 1000.0,
+    }